@@ -0,0 +1,131 @@
+import os
+import time
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict
+
+logger = logging.getLogger("financial_agent")
+
+# Consecutive failures that open a breaker
+FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURES", "5"))
+# Seconds an open breaker rejects calls before letting traffic probe the upstream again
+RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling an upstream whose breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Per-dependency breaker. After `failure_threshold` consecutive failures it opens
+    and `allow()` is False for `reset_timeout` seconds, so callers fail fast instead
+    of tying up worker threads on a dead upstream. After that it is half-open: one
+    probe call goes through while the rest are still rejected, its success closes the
+    breaker and its failure opens it again. A caller whose call says nothing about the
+    upstream's health calls `release` so the next one can probe; a probe that never
+    reports back is replaced after another `reset_timeout`.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = FAILURE_THRESHOLD, reset_timeout: float = RESET_TIMEOUT, clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.stats = {"successes": 0, "failures": 0, "rejected": 0, "opened": 0}
+        self._failures = 0
+        self._opened_at = None
+        self._probe_started = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        return "open" if self.clock() - self._opened_at < self.reset_timeout else "half_open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open":
+                now = self.clock()
+                if self._probe_started is None or now - self._probe_started >= self.reset_timeout:
+                    self._probe_started = now
+                    return True
+            self.stats["rejected"] += 1
+            return False
+
+    def release(self):
+        """Ends a half-open probe without a verdict, e.g. the call never reached the upstream."""
+        with self._lock:
+            self._probe_started = None
+
+    def check(self):
+        """Raises CircuitOpenError when `allow` refuses the call."""
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} is unavailable (circuit open)")
+
+    def record_success(self):
+        with self._lock:
+            self.stats["successes"] += 1
+            self._failures = 0
+            self._probe_started = None
+            if self._opened_at is not None:
+                logger.info(f"Circuit {self.name} closed.")
+            self._opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.stats["failures"] += 1
+            self._failures += 1
+            self._probe_started = None
+            # A half-open breaker reopens on its first failure
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.stats["opened"] += 1
+                    logger.warning(f"Circuit {self.name} opened after {self._failures} consecutive failures.")
+                self._opened_at = self.clock()
+
+    def call(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        self.check()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
+
+    async def acall(self, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        self.check()
+        try:
+            result = await fn(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"state": self.state, "consecutive_failures": self._failures, **self.stats}
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """Process-wide breaker for an upstream ("yfinance", "pinecone", "gemini", "g4f:<route>")."""
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(name)
+            if breaker is None:
+                breaker = _breakers[name] = CircuitBreaker(name)
+    return breaker
+
+
+def breaker_snapshot() -> Dict[str, Dict[str, Any]]:
+    return {name: breaker.snapshot() for name, breaker in list(_breakers.items())}
@@ -0,0 +1,22 @@
+import os
+import time
+from typing import Optional
+
+# Seconds a /chat request may take end to end
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", "90"))
+
+
+def new_deadline(timeout: Optional[float] = None) -> float:
+    """time.monotonic() timestamp by which the request must finish."""
+    return time.monotonic() + (REQUEST_TIMEOUT if timeout is None else timeout)
+
+
+def remaining(deadline: Optional[float], cap: Optional[float] = None) -> Optional[float]:
+    """
+    Seconds left before `deadline` (never negative), at most `cap`.
+    None when there is neither a deadline nor a cap.
+    """
+    if deadline is None:
+        return cap
+    left = max(0.0, deadline - time.monotonic())
+    return left if cap is None else min(left, cap)
@@ -1,10 +1,41 @@
-from typing import List, Optional, Any, Union
+import threading
+from typing import List, Optional, Any, Union, Iterator, AsyncIterator
 from langchain_core.language_models.chat_models import BaseChatModel
-from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, SystemMessage
-from langchain_core.outputs import ChatResult, ChatGeneration
-from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, AIMessageChunk, SystemMessage
+from langchain_core.outputs import ChatResult, ChatGeneration, ChatGenerationChunk
+from langchain_core.callbacks import CallbackManagerForLLMRun, AsyncCallbackManagerForLLMRun
 from pydantic import Field
-from g4f.client import Client
+from g4f.client import Client, AsyncClient
+from agent.streaming_json import StreamingJSONParser
+from agent.llm_pool import Route, llm_pool
+from agent.metrics import record_llm_tokens
+from agent.prompt_budget import estimate_tokens
+
+
+# Process-wide g4f clients, shared by every G4FChatModel instance
+_client_lock = threading.Lock()
+_client: Optional[Client] = None
+_async_client: Optional[AsyncClient] = None
+
+
+def get_client() -> Client:
+    """Return the shared sync g4f client, creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = Client()
+    return _client
+
+
+def get_async_client() -> AsyncClient:
+    """Return the shared async g4f client, creating it on first use."""
+    global _async_client
+    if _async_client is None:
+        with _client_lock:
+            if _async_client is None:
+                _async_client = AsyncClient()
+    return _async_client
 
 
 class G4FChatModel(BaseChatModel):
@@ -13,17 +44,18 @@ class G4FChatModel(BaseChatModel):
     model: str = Field(default="deepseek-v3")
     temperature: float = Field(default=0.0)
     web_search: bool = Field(default=False)
+    # g4f provider name for the first route; None lets g4f pick
+    provider: Optional[str] = Field(default=None)
+    # Overall deadline per call in seconds, across fallbacks; None uses LLM_CALL_TIMEOUT
+    timeout: Optional[float] = Field(default=None)
+    # llm_scheduler queue priority, lower is served first
+    priority: int = Field(default=1)
+    # Node task this model serves (see ModelRouter); llm_pool keeps latency history per task
+    task: Optional[str] = Field(default=None)
     
-    def _generate(
-        self,
-        messages: List[BaseMessage],
-        stop: Optional[List[str]] = None,
-        run_manager: Optional[CallbackManagerForLLMRun] = None,
-        **kwargs: Any,
-    ) -> ChatResult:
-        """Generate chat completion using g4f client."""
-        
-        # Convert LangChain messages to g4f format
+    @staticmethod
+    def _to_g4f_messages(messages: List[BaseMessage]) -> List[dict]:
+        """Convert LangChain messages to g4f format."""
         g4f_messages = []
         for msg in messages:
             if isinstance(msg, HumanMessage):
@@ -34,52 +66,209 @@ class G4FChatModel(BaseChatModel):
                 g4f_messages.append({"role": "system", "content": msg.content})
             else:
                 g4f_messages.append({"role": "user", "content": str(msg.content)})
-        
-        # Call g4f client
-        client = Client()
-        response = client.chat.completions.create(
-            model=self.model,
-            messages=g4f_messages,
-            web_search=self.web_search,
-            temperature=self.temperature
-        )
-        
-        # Convert response to LangChain format
+        return g4f_messages
+    
+    @staticmethod
+    def _prompt_tokens(g4f_messages: List[dict]) -> int:
+        return sum(estimate_tokens(str(m["content"])) for m in g4f_messages)
+    
+    @staticmethod
+    def _to_chat_result(response: Any) -> ChatResult:
+        """Convert a g4f completion to LangChain format."""
         content = response.choices[0].message.content
+        if not content:
+            # Some providers answer with nothing instead of failing; treat it as a failure
+            raise ValueError("Empty completion")
         message = AIMessage(content=content)
         generation = ChatGeneration(message=message)
-        
         return ChatResult(generations=[generation])
     
-    def invoke(self, input: Union[str, List[BaseMessage], dict], config=None, **kwargs) -> AIMessage:
-        """Invoke method for Runnable compatibility."""
-        # Handle different input types
+    @staticmethod
+    def _to_messages(input: Any) -> List[BaseMessage]:
+        """Normalize Runnable input into a list of messages."""
         if isinstance(input, str):
-            messages = [HumanMessage(content=input)]
-        elif isinstance(input, dict):
+            return [HumanMessage(content=input)]
+        if hasattr(input, "to_messages"):
+            # PromptValue coming from a `prompt | llm` chain
+            return input.to_messages()
+        if isinstance(input, dict):
             # Assume it's a formatted prompt from PromptTemplate
             if "text" in input:
-                messages = [HumanMessage(content=input["text"])]
-            else:
-                # Try to convert dict values to string
-                messages = [HumanMessage(content=str(input))]
-        elif isinstance(input, list):
-            messages = input
-        else:
-            messages = [HumanMessage(content=str(input))]
+                return [HumanMessage(content=input["text"])]
+            # Try to convert dict values to string
+            return [HumanMessage(content=str(input))]
+        if isinstance(input, list):
+            return input
+        return [HumanMessage(content=str(input))]
+    
+    def _create_kwargs(self, route: Route, g4f_messages: List[dict], timeout: float) -> dict:
+        """g4f create() arguments for one attempt on `route`."""
+        kwargs = {
+            "model": route.model,
+            "messages": g4f_messages,
+            "web_search": self.web_search,
+            "temperature": self.temperature,
+            "timeout": timeout,
+        }
+        if route.provider:
+            kwargs["provider"] = route.provider
+        return kwargs
+    
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        deadline: Optional[float] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        """Generate chat completion using g4f client, with deadline, fallbacks and hedging."""
+        g4f_messages = self._to_g4f_messages(messages)
         
-        result = self._generate(messages)
+        def attempt(route: Route, timeout: float) -> ChatResult:
+            response = get_client().chat.completions.create(**self._create_kwargs(route, g4f_messages, timeout))
+            return self._to_chat_result(response)
+        
+        result = llm_pool.call(attempt, self.model, self.provider, self.timeout, deadline, self.priority, self.task)
+        record_llm_tokens(self.model, self._prompt_tokens(g4f_messages), estimate_tokens(result.generations[0].message.content))
+        return result
+    
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        deadline: Optional[float] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        """Generate chat completion using the async g4f client without blocking the event loop."""
+        g4f_messages = self._to_g4f_messages(messages)
+        
+        async def attempt(route: Route, timeout: float) -> ChatResult:
+            response = await get_async_client().chat.completions.create(**self._create_kwargs(route, g4f_messages, timeout))
+            return self._to_chat_result(response)
+        
+        result = await llm_pool.acall(attempt, self.model, self.provider, self.timeout, deadline, self.priority, self.task)
+        record_llm_tokens(self.model, self._prompt_tokens(g4f_messages), estimate_tokens(result.generations[0].message.content))
+        return result
+    
+    @staticmethod
+    def _to_generation_chunk(chunk: Any) -> Optional[ChatGenerationChunk]:
+        """Convert a g4f stream chunk to LangChain format, skipping empty deltas."""
+        if not chunk.choices:
+            return None
+        content = chunk.choices[0].delta.content
+        if not content:
+            return None
+        return ChatGenerationChunk(message=AIMessageChunk(content=content))
+    
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        deadline: Optional[float] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        """Stream chat completion tokens using g4f client, falling back until a route starts answering."""
+        g4f_messages = self._to_g4f_messages(messages)
+        
+        def open_stream(route: Route, timeout: float) -> Iterator[ChatGenerationChunk]:
+            response = get_client().chat.completions.create(**self._create_kwargs(route, g4f_messages, timeout), stream=True)
+            for chunk in response:
+                generation_chunk = self._to_generation_chunk(chunk)
+                if generation_chunk is not None:
+                    yield generation_chunk
+        
+        stream = llm_pool.stream(open_stream, self.model, self.provider, self.timeout, deadline, self.priority, self.task)
+        completion_tokens = 0
+        try:
+            for chunk in stream:
+                completion_tokens += estimate_tokens(chunk.message.content)
+                yield chunk
+        finally:
+            stream.close()
+            record_llm_tokens(self.model, self._prompt_tokens(g4f_messages), completion_tokens)
+    
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        deadline: Optional[float] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        """Stream chat completion tokens using the async g4f client."""
+        g4f_messages = self._to_g4f_messages(messages)
+        
+        async def open_stream(route: Route, timeout: float) -> AsyncIterator[ChatGenerationChunk]:
+            response = get_async_client().chat.completions.create(**self._create_kwargs(route, g4f_messages, timeout), stream=True)
+            async for chunk in response:
+                generation_chunk = self._to_generation_chunk(chunk)
+                if generation_chunk is not None:
+                    yield generation_chunk
+        
+        stream = llm_pool.astream(open_stream, self.model, self.provider, self.timeout, deadline, self.priority, self.task)
+        completion_tokens = 0
+        try:
+            async for chunk in stream:
+                completion_tokens += estimate_tokens(chunk.message.content)
+                yield chunk
+        finally:
+            await stream.aclose()
+            record_llm_tokens(self.model, self._prompt_tokens(g4f_messages), completion_tokens)
+    
+    def invoke(self, input: Union[str, List[BaseMessage], dict], config=None, deadline: Optional[float] = None, **kwargs) -> AIMessage:
+        """Invoke method for Runnable compatibility. `deadline` is a time.monotonic() timestamp."""
+        result = self._generate(self._to_messages(input), deadline=deadline)
         return result.generations[0].message
     
+    async def ainvoke(self, input: Union[str, List[BaseMessage], dict], config=None, deadline: Optional[float] = None, **kwargs) -> AIMessage:
+        """Async counterpart of `invoke`."""
+        result = await self._agenerate(self._to_messages(input), deadline=deadline)
+        return result.generations[0].message
+    
+    def stream_json(self, messages: List[BaseMessage], schema: Optional[type] = None, defaults: Optional[dict] = None, deadline: Optional[float] = None) -> StreamingJSONParser:
+        """
+        Streams a JSON answer through StreamingJSONParser and stops reading as soon
+        as the object is complete, so trailing prose is never waited for.
+        Call `result()` or `parse()` on the returned parser.
+        """
+        parser = StreamingJSONParser(schema, defaults)
+        stream = self._stream(messages, deadline=deadline)
+        try:
+            for chunk in stream:
+                parser.feed(chunk.message.content)
+                if parser.done:
+                    break
+        finally:
+            stream.close()
+        return parser
+    
+    async def astream_json(self, messages: List[BaseMessage], schema: Optional[type] = None, defaults: Optional[dict] = None, deadline: Optional[float] = None) -> StreamingJSONParser:
+        """Async counterpart of `stream_json`."""
+        parser = StreamingJSONParser(schema, defaults)
+        stream = self._astream(messages, deadline=deadline)
+        try:
+            async for chunk in stream:
+                parser.feed(chunk.message.content)
+                if parser.done:
+                    break
+        finally:
+            await stream.aclose()
+        return parser
+    
     @property
     def _llm_type(self) -> str:
         """Return type of llm."""
         return "g4f-chat"
     
+    @property
     def _identifying_params(self):
         """Get identifying parameters."""
         return {
             "model": self.model,
+            "provider": self.provider,
             "temperature": self.temperature,
             "web_search": self.web_search
         }
@@ -87,40 +276,39 @@ class G4FChatModel(BaseChatModel):
     def with_structured_output(self, schema):
         """Return a wrapper that outputs structured data according to schema."""
         from langchain_core.output_parsers import PydanticOutputParser
-        from langchain_core.runnables import RunnablePassthrough
         
-        # Create a parser for the schema
+        # Only used for its format instructions; parsing is done by StreamingJSONParser
         parser = PydanticOutputParser(pydantic_object=schema)
         
         # Return a chain that includes format instructions and parsing
-        def structured_invoke(input_text):
-            # Add format instructions to the prompt
+        def build_messages(input_val):
+            # Add format instructions to the prompt (or to the last message of a conversation)
             format_instructions = parser.get_format_instructions()
-            enhanced_prompt = f"{input_text}\n\n{format_instructions}\n\nOutput only valid JSON."
-            
-            # Generate response
-            messages = [HumanMessage(content=enhanced_prompt)]
-            result = self._generate(messages)
-            
-            # Parse the output
-            raw_output = result.generations[0].message.content
-            
-            # Try to extract JSON if wrapped in markdown
-            import re
-            json_match = re.search(r'```json\s*(.*?)\s*```', raw_output, re.DOTALL)
-            if json_match:
-                raw_output = json_match.group(1)
-            
-            # Parse with the parser
-            return parser.parse(raw_output)
+            suffix = f"\n\n{format_instructions}\n\nOutput only valid JSON."
+            if isinstance(input_val, list):
+                *history, last = input_val
+                return [*history, HumanMessage(content=f"{last.content}{suffix}")]
+            return [HumanMessage(content=f"{input_val}{suffix}")]
+        
+        # Tokens are parsed as they arrive: fields are validated on completion,
+        # malformed JSON is repaired and the stream is closed once the object ends
+        def structured_invoke(input_text, deadline=None):
+            return self.stream_json(build_messages(input_text), schema, deadline=deadline).parse()
+        
+        async def structured_ainvoke(input_text, deadline=None):
+            return (await self.astream_json(build_messages(input_text), schema, deadline=deadline)).parse()
         
         # Create a simple callable wrapper
         class StructuredOutputWrapper:
-            def __init__(self, invoke_fn):
+            def __init__(self, invoke_fn, ainvoke_fn):
                 self.invoke_fn = invoke_fn
+                self.ainvoke_fn = ainvoke_fn
+            
+            def invoke(self, input_val, deadline=None):
+                return self.invoke_fn(input_val, deadline)
             
-            def invoke(self, input_val):
-                return self.invoke_fn(input_val)
+            async def ainvoke(self, input_val, deadline=None):
+                return await self.ainvoke_fn(input_val, deadline)
         
-        return StructuredOutputWrapper(structured_invoke)
+        return StructuredOutputWrapper(structured_invoke, structured_ainvoke)
 
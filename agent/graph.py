@@ -1,14 +1,17 @@
 from typing import Literal
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import StateGraph, END
 from agent.schemas.state import AgentState
-from agent.nodes.input_parsing import parse_input
+from agent.metrics import timed_node
+from agent.nodes.input_parsing import parse_input, aparse_input
+from agent.nodes.cache_lookup import lookup_response
 from agent.nodes.query_planner import plan_query
-from agent.nodes.data_fetch import fetch_data
+from agent.nodes.data_fetch import fetch_data, afetch_data
 from agent.nodes.data_normalization import normalize_data
 from agent.nodes.embedding import embed_knowledge
-from agent.nodes.retrieval import retrieve_context
-from agent.nodes.reasoning import analyze_market
-from agent.nodes.response_generation import generate_response
+from agent.nodes.retrieval import retrieve_context, aretrieve_context
+from agent.nodes.reasoning import analyze_market, aanalyze_market
+from agent.nodes.response_generation import generate_response, agenerate_response
 
 def route_query(state: AgentState) -> Literal["fetch", "reason"]:
     """
@@ -27,6 +30,26 @@ def route_query(state: AgentState) -> Literal["fetch", "reason"]:
     # market_data and comparative_analysis need yfinance
     return "fetch"
 
+def plan_branches(state: AgentState):
+    """
+    Fan-out after planning. On the fetch path, market data and retrieval run in parallel;
+    retrieval only needs `parsed_query`, so it does not wait for yfinance.
+    """
+    if route_query(state) == "reason":
+        return ["reasoning"]
+    return ["data_fetch", "retrieval"]
+
+def _node(name, func, afunc=None):
+    """
+    Wraps a node so graph.invoke runs the sync version and graph.ainvoke the async one
+    (when there is one), each timed into the `agent_node_seconds` histogram under `name`.
+    """
+    return RunnableLambda(
+        timed_node(name, func),
+        afunc=timed_node(name, afunc) if afunc else None,
+        name=func.__name__
+    )
+
 def build_graph():
     """
     Constructs the LangGraph.
@@ -34,14 +57,15 @@ def build_graph():
     workflow = StateGraph(AgentState)
     
     # Add nodes
-    workflow.add_node("input_parsing", parse_input)
-    workflow.add_node("query_planner", plan_query)
-    workflow.add_node("data_fetch", fetch_data)
-    workflow.add_node("data_normalization", normalize_data)
-    workflow.add_node("embedding", embed_knowledge)
-    workflow.add_node("retrieval", retrieve_context)
-    workflow.add_node("reasoning", analyze_market)
-    workflow.add_node("response_generation", generate_response)
+    workflow.add_node("input_parsing", _node("input_parsing", parse_input, aparse_input))
+    workflow.add_node("cache_lookup", _node("cache_lookup", lookup_response))
+    workflow.add_node("query_planner", _node("query_planner", plan_query))
+    workflow.add_node("data_fetch", _node("data_fetch", fetch_data, afetch_data))
+    workflow.add_node("data_normalization", _node("data_normalization", normalize_data))
+    workflow.add_node("embedding", _node("embedding", embed_knowledge))
+    workflow.add_node("retrieval", _node("retrieval", retrieve_context, aretrieve_context))
+    workflow.add_node("reasoning", _node("reasoning", analyze_market, aanalyze_market))
+    workflow.add_node("response_generation", _node("response_generation", generate_response, agenerate_response))
     
     # Define edges
     workflow.set_entry_point("input_parsing")
@@ -56,26 +80,39 @@ def build_graph():
         check_parsing_error,
         {
             "end": END,
-            "continue": "query_planner"
+            "continue": "cache_lookup"
         }
     )
     
+    def check_cache_hit(state: AgentState):
+        if state.get("final_response"):
+            return "end"
+        return "continue"
+    
+    # Repeated options_trading / general_chat questions are answered from cache
     workflow.add_conditional_edges(
-        "query_planner",
-        route_query,
+        "cache_lookup",
+        check_cache_hit,
         {
-            "fetch": "data_fetch",
-            "reason": "reasoning"
+            "end": END,
+            "continue": "query_planner"
         }
     )
     
-    # Sequential flow for data fetching path
+    workflow.add_conditional_edges(
+        "query_planner",
+        plan_branches,
+        ["data_fetch", "retrieval", "reasoning"]
+    )
+    
+    # Fetch path: data_fetch -> data_normalization runs alongside retrieval,
+    # and reasoning waits for both branches.
     workflow.add_edge("data_fetch", "data_normalization")
+    workflow.add_edge(["data_normalization", "retrieval"], "reasoning")
+    # Embedding only queues new memory for the background writer; it runs next to
+    # reasoning instead of in front of it, so it stays off the critical path.
     workflow.add_edge("data_normalization", "embedding")
-    workflow.add_edge("embedding", "retrieval") 
-    workflow.add_edge("retrieval", "reasoning")
-    # Note: Embedding creates new memory, Retrieval gets *existing* memory. 
-    # Ideally Retrieval matches the query. 
+    workflow.add_edge("embedding", END)
     
     workflow.add_edge("reasoning", "response_generation")
     workflow.add_edge("response_generation", END)
@@ -0,0 +1,146 @@
+import os
+import re
+from pathlib import Path
+from typing import List, NamedTuple, Optional
+import numpy as np
+from agent.tools.local_embeddings import HashingEmbeddings
+from agent.prompt_budget import estimate_tokens
+
+KNOWLEDGE_PATH = Path(__file__).parent.parent / "sys_prmpt.txt"
+
+# Sections injected per call, and the token budget they must fit in
+TOP_K = int(os.getenv("LTP_PROMPT_TOP_K", "8"))
+TOKEN_BUDGET = int(os.getenv("LTP_PROMPT_TOKEN_BUDGET", "1500"))
+# Sections scoring below this are not injected
+MIN_SCORE = float(os.getenv("LTP_PROMPT_MIN_SCORE", "0.12"))
+# Hashed features (words, word pairs, character n-grams) a section must share with the
+# query. A lone two-letter word shares at most 4, so "hi" or "ok" gets only the persona
+# core even though Hinglish rules are full of "hi hoga"; "wtb" or "pcr" shares 7.
+MIN_MATCHES = int(os.getenv("LTP_PROMPT_MIN_MATCHES", "5"))
+# Consecutive rule paragraphs are packed into sections of about this many characters
+SECTION_CHARS = 700
+
+# Always sent. Condenses the persona paragraph that opens sys_prmpt.txt, which is
+# kept out of the index.
+PERSONA_CORE = """Your name is Daddy's AI, an intelligent chatbot from India that helps with trading in the Indian stock market and general questions. You were created by Adarsh (Class 8) at Daddy's International School.
+- Talk in Hindi (WhatsApp language) in a formal, sequenced, professional and respectful style, like an Indian girl would, without saying so.
+- Keep replies short and clear to the topic, explain with an LTP Calculator scenario where relevant, and never repeat the same explanation.
+- Do not greet (no repeated namaste), do not use informal words like yaar or dost, and do not mention indicators other than the LTP Calculator.
+- Always answer every question about the stock market, the LTP Calculator and its strategies using the knowledge below; never list every strategy in your database."""
+
+QUESTION_PATTERN = re.compile(r"^\d+\.\s")
+
+
+class Section(NamedTuple):
+    position: int
+    text: str
+
+
+def split_sections(text: str) -> List[str]:
+    """
+    Splits the knowledge base into retrievable sections. Each numbered Q&A entry
+    ("12. Capital Gain kya hota hai?" and its answer) is one section; the free-form
+    LTP rules before them are packed paragraph by paragraph into ~SECTION_CHARS
+    sections. The opening persona paragraph is dropped and repeated entries are kept once.
+    """
+    paragraphs = [p.strip() for p in re.split(r"\n\s*\n", text) if p.strip()]
+    sections: List[str] = []
+    current = ""
+    in_questions = False
+    for paragraph in paragraphs[1:]:
+        if not in_questions and not any(QUESTION_PATTERN.match(l) for l in paragraph.splitlines()):
+            if current and len(current) + len(paragraph) > SECTION_CHARS:
+                sections.append(current)
+                current = ""
+            current = f"{current}\n\n{paragraph}" if current else paragraph
+            continue
+        for line in paragraph.splitlines():
+            if QUESTION_PATTERN.match(line):
+                in_questions = True
+                if current:
+                    sections.append(current)
+                current = line
+            else:
+                current += "\n" + line
+    if current:
+        sections.append(current)
+
+    seen = set()
+    unique = []
+    for section in sections:
+        key = re.sub(r"^\d+\.\s*|\s+", " ", section.lower()).strip()
+        if key not in seen:
+            seen.add(key)
+            unique.append(section)
+    return unique
+
+
+class KnowledgeBase:
+    """
+    The LTP Calculator knowledge base held as sections with offline hashed
+    embeddings (see HashingEmbeddings), so picking what to inject is one
+    matrix-vector product with no network call.
+    """
+
+    def __init__(self, sections: List[str], embeddings: Optional[HashingEmbeddings] = None):
+        self.sections = [Section(i, s) for i, s in enumerate(sections)]
+        self.embeddings = embeddings or HashingEmbeddings(dim=4096).fit(sections)
+        self._matrix = np.asarray(self.embeddings.embed_documents(sections), dtype=np.float32).reshape(len(sections), self.embeddings.dim)
+        self._tokens = [estimate_tokens(s) for s in sections]
+
+    @classmethod
+    def from_file(cls, path: Path = KNOWLEDGE_PATH) -> "KnowledgeBase":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(split_sections(f.read()))
+
+    def __len__(self) -> int:
+        return len(self.sections)
+
+    def search(
+        self,
+        query: str,
+        k: int = TOP_K,
+        token_budget: int = TOKEN_BUDGET,
+        min_score: float = MIN_SCORE,
+        min_matches: int = MIN_MATCHES,
+        document_order: bool = True,
+    ) -> List[Section]:
+        """
+        Best-scoring sections for `query` that fit in `token_budget`, skipping those
+        that share fewer than `min_matches` features with it. By default they
+        come back in document order so related rules read as they were written;
+        `document_order=False` keeps them most relevant first.
+        """
+        if not self.sections:
+            return []
+        vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        scores = self._matrix @ vector
+        matches = np.count_nonzero(self._matrix[:, np.flatnonzero(vector)], axis=1)
+        picked = []
+        used = 0
+        for i in np.argsort(-scores):
+            if len(picked) >= k or scores[i] < min_score:
+                break
+            if matches[i] < min_matches or used + self._tokens[i] > token_budget:
+                continue
+            picked.append(self.sections[i])
+            used += self._tokens[i]
+        return sorted(picked) if document_order else picked
+
+    def system_prompt(self, query: str, k: int = TOP_K, token_budget: int = TOKEN_BUDGET) -> str:
+        """The persona core plus the sections relevant to `query`."""
+        return build_system_prompt("\n\n".join(s.text for s in self.search(query, k, token_budget)))
+
+
+def build_system_prompt(knowledge: str) -> str:
+    if not knowledge:
+        return PERSONA_CORE
+    return f"{PERSONA_CORE}\n\nRelevant knowledge:\n{knowledge}"
+
+
+def load_knowledge_base(path: Path = KNOWLEDGE_PATH) -> KnowledgeBase:
+    try:
+        return KnowledgeBase.from_file(path)
+    except Exception as e:
+        print(f"[WARNING] Could not load {path.name}: {e}")
+        return KnowledgeBase([])
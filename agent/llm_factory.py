@@ -1,12 +1,30 @@
 import os
+from functools import lru_cache
+from typing import Optional, Tuple
 from agent.g4f_wrapper import G4FChatModel
+from agent.llm_pool import Route
+from agent.model_router import PRIORITIES, model_router
 
-def get_llm(model_name: str = "deepseek-v3", temperature: float = 0):
+@lru_cache(maxsize=None)
+def get_llm(model_name: str = "deepseek-v3", temperature: float = 0, provider: Optional[str] = None, priority: int = 1, task: Optional[str] = None):
     """
     Returns a configured G4F chat model using native g4f.client.
+    Instances are cached per (model, temperature, provider, priority, task) and share the process-wide g4f clients.
     """
     return G4FChatModel(
         model=model_name,
         temperature=temperature,
+        provider=provider,
+        priority=priority,
+        task=task,
         web_search=True
     )
+
+def get_llm_for(task: str, intent: Optional[str] = None, temperature: float = 0) -> Tuple[G4FChatModel, str]:
+    """
+    Model chosen by the model router for a node task and intent.
+    Returns the model and its route spec, which callers pass to `model_router.track`.
+    """
+    spec = model_router.select(task, intent)
+    route = Route.parse(spec)
+    return get_llm(route.model, temperature, route.provider, PRIORITIES.get(task, 1), task), spec
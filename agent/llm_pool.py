@@ -0,0 +1,670 @@
+import os
+import time
+import asyncio
+import contextvars
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, NamedTuple, Optional
+from agent.circuit_breaker import get_breaker
+from agent.deadline import remaining
+from agent.llm_scheduler import LLMOverloadedError, llm_scheduler
+from agent.metrics import llm_span, observe_llm
+
+logger = logging.getLogger("financial_agent")
+
+# Total seconds one LLM call may take, across every attempt and fallback
+CALL_TIMEOUT = float(os.getenv("LLM_CALL_TIMEOUT", "60"))
+# Seconds a single model/provider attempt may take before it is abandoned
+ATTEMPT_TIMEOUT = float(os.getenv("LLM_ATTEMPT_TIMEOUT", "25"))
+# Ordered routes tried after the requested model, as "model" or "model@Provider"
+FALLBACKS = [r.strip() for r in os.getenv("LLM_FALLBACKS", "gpt-4o-mini,llama-3.3-70b").split(",") if r.strip()]
+# Hedging: if the first attempt is slower than its route's p95 (time to first chunk
+# for streams), start the next route too
+HEDGE = os.getenv("LLM_HEDGE", "1") == "1"
+HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))
+HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "1.5"))
+# Used until a route has MIN_SAMPLES latencies of its own
+HEDGE_DEFAULT_DELAY = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "8"))
+MIN_SAMPLES = 5
+# Threads for sync attempts; an abandoned attempt keeps its thread until g4f's own timeout
+LLM_WORKERS = int(os.getenv("LLM_WORKERS", "16"))
+
+_llm_executor = ThreadPoolExecutor(max_workers=LLM_WORKERS, thread_name_prefix="llm-call")
+
+
+def _discard_stream(future):
+    """Done-callback for an abandoned stream attempt: close it and free its slot."""
+    if future.cancelled() or future.exception() is not None:
+        return
+    slot, iterator, _ = future.result()
+    try:
+        if hasattr(iterator, "close"):
+            iterator.close()
+    finally:
+        llm_scheduler.release(slot)
+
+
+async def _aclose(iterator):
+    if hasattr(iterator, "aclose"):
+        try:
+            await iterator.aclose()
+        except Exception:
+            pass
+
+
+async def _adiscard_stream(task: asyncio.Task):
+    """Async counterpart of `_discard_stream`: cancel a pending attempt, or close one that already opened."""
+    if not task.done():
+        task.cancel()
+        return
+    if task.cancelled() or task.exception() is not None:
+        return
+    slot, iterator, _ = task.result()
+    llm_scheduler.release(slot)
+    await _aclose(iterator)
+
+
+class Route(NamedTuple):
+    model: str
+    provider: Optional[str] = None
+
+    @classmethod
+    def parse(cls, spec: str) -> "Route":
+        model, _, provider = spec.partition("@")
+        return cls(model.strip(), provider.strip() or None)
+
+    @property
+    def label(self) -> str:
+        return f"{self.model}@{self.provider}" if self.provider else self.model
+
+
+class LLMUnavailableError(RuntimeError):
+    """Every route failed or the call deadline passed."""
+
+    def __init__(self, message: str, errors: Optional[Dict[str, str]] = None):
+        super().__init__(message)
+        self.errors = errors or {}
+
+
+class RouteStats:
+    """
+    Rolling latency and error window for one route. Completed calls and streams are
+    timed separately: a call's latency is the whole answer, a stream's is the time to
+    its first chunk, and each is what hedging waits on in its own mode. Attempts that
+    lost a hedge or timed out add how long they had run as a lower bound; leaving
+    them out would keep only a slow route's fast wins and understate its p95.
+    """
+
+    WINDOW = 200
+
+    def __init__(self):
+        self.latencies = deque(maxlen=self.WINDOW)     # completed calls only
+        self.first_chunks = deque(maxlen=self.WINDOW)  # streams that started
+        self.outcomes = deque(maxlen=self.WINDOW)      # 1 = error or timeout
+        self.calls = 0
+        self.errors = 0
+
+    def record(self, latency: Optional[float], ok: bool, stream: bool = False):
+        self.calls += 1
+        self.outcomes.append(0 if ok else 1)
+        if ok and latency is not None:
+            (self.first_chunks if stream else self.latencies).append(latency)
+        if not ok:
+            self.errors += 1
+
+    def record_lower_bound(self, elapsed: float, stream: bool = False):
+        (self.first_chunks if stream else self.latencies).append(elapsed)
+
+    def quantile(self, q: float, stream: bool = False) -> Optional[float]:
+        window = self.first_chunks if stream else self.latencies
+        if len(window) < MIN_SAMPLES:
+            return None
+        ordered = sorted(window)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    @property
+    def error_rate(self) -> float:
+        return sum(self.outcomes) / len(self.outcomes) if self.outcomes else 0.0
+
+    def score(self, stream: bool = False) -> float:
+        """Expected seconds to a successful answer (or first chunk); unknown routes look average."""
+        median = self.quantile(0.5, stream)
+        if median is None:
+            median = HEDGE_DEFAULT_DELAY / 2
+        return median / max(1.0 - self.error_rate, 0.05)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "error_rate": round(self.error_rate, 3),
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "first_chunk_p50": self.quantile(0.5, stream=True),
+            "first_chunk_p95": self.quantile(0.95, stream=True),
+        }
+
+
+class LLMPool:
+    """
+    Runs LLM calls under a deadline across an ordered list of routes.
+
+    The requested model comes first, then `fallbacks`; once the fallbacks have
+    enough history they are ordered by expected latency inflated by their error
+    rate, so a flaky or slow provider sinks on its own. The requested route is never
+    demoted here: which model serves a task is ModelRouter's decision. Latency and
+    error history is kept per `task` (as given by the caller), since one model's
+    timings differ between, say, query extraction and a long report. Each attempt gets `attempt_timeout`;
+    a failed or timed-out attempt moves on to the next route. With `hedge`, when
+    the running attempt outlasts its route's p95 the next route is started as
+    well and the first answer wins (async losers are cancelled, sync ones are
+    abandoned to their own g4f timeout). Streams hedge the same way on time to
+    first chunk: whichever stream starts first is kept and the others are closed.
+    """
+
+    def __init__(
+        self,
+        fallbacks: Optional[List[str]] = None,
+        call_timeout: float = CALL_TIMEOUT,
+        attempt_timeout: float = ATTEMPT_TIMEOUT,
+        hedge: bool = HEDGE,
+        hedge_quantile: float = HEDGE_QUANTILE,
+    ):
+        self.fallbacks = [Route.parse(r) for r in (FALLBACKS if fallbacks is None else fallbacks)]
+        self.call_timeout = call_timeout
+        self.attempt_timeout = attempt_timeout
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.stats: Dict[str, RouteStats] = {}
+        self.counters = {"calls": 0, "fallbacks": 0, "hedges": 0, "hedge_wins": 0, "failures": 0}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(route: Route, task: Optional[str]) -> str:
+        return f"{task}/{route.label}" if task else route.label
+
+    def _stats(self, route: Route, task: Optional[str] = None) -> RouteStats:
+        with self._lock:
+            stats = self.stats.get(self._key(route, task))
+            if stats is None:
+                stats = self.stats[self._key(route, task)] = RouteStats()
+            return stats
+
+    def record(self, route: Route, latency: Optional[float], ok: bool, stream: bool = False, task: Optional[str] = None):
+        stats = self._stats(route, task)
+        with self._lock:
+            stats.record(latency, ok, stream)
+        breaker = get_breaker(f"g4f:{route.label}")
+        if ok:
+            breaker.record_success()
+        else:
+            breaker.record_failure()
+
+    def routes(self, model: str, provider: Optional[str] = None, stream: bool = False, task: Optional[str] = None) -> List[Route]:
+        """
+        Requested route first, then the fallbacks with the best expected latency first.
+        Routes whose circuit breaker is open are left out; if that is all of them the
+        call fails fast. This only reads breaker state; `_take` asks the breaker for
+        each attempt it actually starts.
+        """
+        requested = Route(model, provider)
+        configured = list(dict.fromkeys([requested, *self.fallbacks]))
+        candidates = [r for r in configured if get_breaker(f"g4f:{r.label}").state != "open"]
+        if not candidates:
+            self.counters["failures"] += 1
+            raise LLMUnavailableError(f"All LLM routes are unavailable (circuit open): {[r.label for r in configured]}")
+        fallbacks = [r for r in candidates if r != requested]
+        with self._lock:
+            scores = {r: (self.stats[self._key(r, task)].score(stream) if self._key(r, task) in self.stats else HEDGE_DEFAULT_DELAY / 2) for r in fallbacks}
+        # Stable sort: configured order breaks ties while nothing is known
+        fallbacks.sort(key=lambda r: scores[r])
+        return [requested, *fallbacks] if requested in candidates else fallbacks
+
+    @staticmethod
+    def _take(queue: List[Route], errors: Dict[str, str]) -> Optional[Route]:
+        """
+        Pops the next route whose breaker admits an attempt. A half-open breaker
+        admits one probe at a time, so the others are skipped like open ones.
+        """
+        while queue:
+            route = queue.pop(0)
+            if get_breaker(f"g4f:{route.label}").allow():
+                return route
+            errors[route.label] = "circuit open"
+        return None
+
+    def hedge_delay(self, route: Route, stream: bool = False, task: Optional[str] = None) -> float:
+        with self._lock:
+            stats = self.stats.get(self._key(route, task))
+            delay = stats.quantile(self.hedge_quantile, stream) if stats else None
+        return max(HEDGE_MIN_DELAY, delay if delay is not None else HEDGE_DEFAULT_DELAY)
+
+    def _budget(self, timeout: Optional[float], deadline: Optional[float]) -> float:
+        """Seconds this call may take: its own timeout, capped by the request deadline."""
+        budget = remaining(deadline, timeout or self.call_timeout)
+        if budget <= 0:
+            self.counters["failures"] += 1
+            raise LLMUnavailableError("Request deadline passed before the LLM call")
+        return budget
+
+    def _failed(self, routes: List[Route], errors: Dict[str, str]) -> LLMUnavailableError:
+        self.counters["failures"] += 1
+        detail = "; ".join(f"{k}: {v}" for k, v in errors.items()) or "deadline reached"
+        logger.error(f"LLM call failed on {[r.label for r in routes]}: {detail}")
+        return LLMUnavailableError(f"No LLM route answered in time ({detail})", errors)
+
+    def _attempt_failed(self, route: Route, error: BaseException, errors: Dict[str, str], task: Optional[str] = None):
+        if isinstance(error, LLMOverloadedError):
+            # Queued too long on our own scheduler; the provider was never asked
+            get_breaker(f"g4f:{route.label}").release()
+            errors[route.label] = "no free LLM slot"
+            return
+        self.record(route, None, False, task=task)
+        errors[route.label] = str(error) or type(error).__name__
+        logger.warning(f"LLM attempt on {route.label} failed: {errors[route.label]}")
+
+    def _expired(self, route: Route, budget: float, running: Optional[float], errors: Dict[str, str], task: Optional[str] = None):
+        if running is None:
+            errors[route.label] = "no free LLM slot"
+        elif budget < self.attempt_timeout:
+            # Cut short by the call deadline rather than by the provider's own slowness
+            errors[route.label] = "call deadline reached"
+        else:
+            self.record(route, None, False, task=task)
+            errors[route.label] = f"timed out after {budget:.1f}s"
+
+    def _abandoned(self, route: Route, state: dict, now: float, stream: bool = False, task: Optional[str] = None):
+        """
+        Records an attempt given up on (lost the hedge, timed out) as running at least
+        this long, and frees its breaker's half-open probe; a timeout is then recorded
+        as a failure by `_expired`.
+        """
+        get_breaker(f"g4f:{route.label}").release()
+        if state["running"] is None:
+            return  # never got a slot, so the provider was never asked
+        stats = self._stats(route, task)
+        with self._lock:
+            stats.record_lower_bound(now - state["running"], stream)
+
+    def _won(self, route: Route, routes: List[Route], pending: Dict, now: float, stream: bool = False, task: Optional[str] = None):
+        if pending and route != routes[0]:
+            self.counters["hedge_wins"] += 1
+        for loser_route, _, _, state in pending.values():
+            self._abandoned(loser_route, state, now, stream, task)
+
+    def _may_hedge(self) -> bool:
+        # Extra attempts would only lengthen the queue when every slot is busy
+        if llm_scheduler.saturated:
+            return False
+        self.counters["hedges"] += 1
+        return True
+
+    def call(self, fn: Callable[[Route, float], Any], model: str, provider: Optional[str] = None, timeout: Optional[float] = None, deadline: Optional[float] = None, priority: int = 1, task: Optional[str] = None) -> Any:
+        """
+        Sync call. `fn(route, attempt_timeout)` performs one attempt and raises on failure.
+        `deadline` is the request's time.monotonic() deadline, if it has one. Each
+        attempt first waits for an llm_scheduler slot at `priority`. `task` names the
+        caller's kind of call (e.g. "reasoning") that latency history is kept under.
+        """
+        self.counters["calls"] += 1
+        deadline = time.monotonic() + self._budget(timeout, deadline)
+        routes = self.routes(model, provider, task=task)
+        queue = list(routes)
+        pending: Dict[Any, tuple] = {}
+        errors: Dict[str, str] = {}
+        next_hedge = float("inf")
+
+        def run(route: Route, budget: float, state: dict):
+            with llm_scheduler.slot(route.label, priority, budget) as left:
+                state["running"] = time.monotonic()
+                with llm_span(route.label):
+                    return fn(route, left)
+
+        def launch():
+            nonlocal next_hedge
+            route = self._take(queue, errors)
+            if route is None:
+                return
+            budget = max(0.0, min(self.attempt_timeout, deadline - time.monotonic()))
+            state = {"running": None}
+            pending[_llm_executor.submit(contextvars.copy_context().run, run, route, budget, state)] = (route, time.monotonic(), budget, state)
+            next_hedge = time.monotonic() + self.hedge_delay(route, task=task) if self.hedge and queue else float("inf")
+
+        launch()
+        while pending:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            expiry = min(started + budget for _, started, budget, _ in pending.values())
+            done, _ = wait(list(pending), timeout=max(0.0, min(deadline, next_hedge, expiry) - now), return_when=FIRST_COMPLETED)
+            for future in done:
+                route, _, _, state = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    self._attempt_failed(route, e, errors, task)
+                    continue
+                now = time.monotonic()
+                self.record(route, now - state["running"], True, task=task)
+                self._won(route, routes, pending, now, task=task)
+                for loser in pending:
+                    loser.cancel()
+                return result
+
+            now = time.monotonic()
+            for future, (route, started, budget, state) in list(pending.items()):
+                if now - started >= budget:
+                    del pending[future]
+                    future.cancel()
+                    self._abandoned(route, state, now, task=task)
+                    self._expired(route, budget, state["running"], errors, task)
+            if queue and now < deadline:
+                if not pending:
+                    self.counters["fallbacks"] += 1
+                    launch()
+                elif now >= next_hedge:
+                    next_hedge = float("inf")
+                    if self._may_hedge():
+                        launch()
+        # Attempts cut short by the call deadline are not the provider's failure; only their running time is kept
+        now = time.monotonic()
+        for future, (route, _, _, state) in pending.items():
+            future.cancel()
+            self._abandoned(route, state, now, task=task)
+            errors.setdefault(route.label, "call deadline reached")
+        raise self._failed(routes, errors)
+
+    async def acall(self, fn: Callable[[Route, float], Awaitable[Any]], model: str, provider: Optional[str] = None, timeout: Optional[float] = None, deadline: Optional[float] = None, priority: int = 1, task: Optional[str] = None) -> Any:
+        """Async counterpart of `call`; losing and expired attempts are cancelled."""
+        self.counters["calls"] += 1
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self._budget(timeout, deadline)
+        routes = self.routes(model, provider, task=task)
+        queue = list(routes)
+        pending: Dict[asyncio.Task, tuple] = {}
+        errors: Dict[str, str] = {}
+        next_hedge = float("inf")
+
+        async def run(route: Route, budget: float, state: dict):
+            async with llm_scheduler.aslot(route.label, priority, budget) as left:
+                state["running"] = loop.time()
+                with llm_span(route.label):
+                    return await fn(route, left)
+
+        def launch():
+            nonlocal next_hedge
+            route = self._take(queue, errors)
+            if route is None:
+                return
+            budget = max(0.0, min(self.attempt_timeout, deadline - loop.time()))
+            state = {"running": None}
+            pending[asyncio.ensure_future(run(route, budget, state))] = (route, loop.time(), budget, state)
+            next_hedge = loop.time() + self.hedge_delay(route, task=task) if self.hedge and queue else float("inf")
+
+        launch()
+        try:
+            while pending:
+                now = loop.time()
+                if now >= deadline:
+                    break
+                expiry = min(started + budget for _, started, budget, _ in pending.values())
+                done, _ = await asyncio.wait(list(pending), timeout=max(0.0, min(deadline, next_hedge, expiry) - now), return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    route, _, _, state = pending.pop(future)
+                    if future.cancelled():
+                        errors[route.label] = "cancelled"
+                        continue
+                    if future.exception() is not None:
+                        self._attempt_failed(route, future.exception(), errors, task)
+                        continue
+                    now = loop.time()
+                    self.record(route, now - state["running"], True, task=task)
+                    self._won(route, routes, pending, now, task=task)
+                    return future.result()
+
+                now = loop.time()
+                for future, (route, started, budget, state) in list(pending.items()):
+                    if now - started >= budget:
+                        del pending[future]
+                        future.cancel()
+                        self._abandoned(route, state, now, task=task)
+                        self._expired(route, budget, state["running"], errors, task)
+                if queue and now < deadline:
+                    if not pending:
+                        self.counters["fallbacks"] += 1
+                        launch()
+                    elif now >= next_hedge:
+                        next_hedge = float("inf")
+                        if self._may_hedge():
+                            launch()
+            now = loop.time()
+            for route, _, _, state in pending.values():
+                self._abandoned(route, state, now, task=task)
+                errors.setdefault(route.label, "call deadline reached")
+            raise self._failed(routes, errors)
+        finally:
+            # Also reached when the caller is cancelled; attempts left behind give up their probes
+            for future, (route, _, _, _) in pending.items():
+                future.cancel()
+                get_breaker(f"g4f:{route.label}").release()
+
+    def _open_stream(self, open_fn: Callable[[Route, float], Iterator[Any]], routes: List[Route], deadline: float, priority: int, task: Optional[str]):
+        """
+        Opens streams across `routes` like `call` runs attempts, hedging on time to
+        first chunk. Returns (route, running, slot, iterator, first chunk) of the
+        stream that started first; every other attempt is closed and its slot freed.
+        """
+        queue = list(routes)
+        pending: Dict[Any, tuple] = {}
+        errors: Dict[str, str] = {}
+        next_hedge = float("inf")
+
+        def first(route: Route, budget: float, state: dict):
+            slot = llm_scheduler.acquire(route.label, priority, budget)
+            try:
+                state["running"] = time.monotonic()
+                iterator = iter(open_fn(route, max(0.0, budget - (state["running"] - state["started"]))))
+                try:
+                    return slot, iterator, next(iterator)
+                except StopIteration:
+                    raise ValueError("empty response")
+            except BaseException:
+                llm_scheduler.release(slot)
+                raise
+
+        def launch():
+            nonlocal next_hedge
+            route = self._take(queue, errors)
+            if route is None:
+                return
+            budget = max(0.0, min(self.attempt_timeout, deadline - time.monotonic()))
+            state = {"running": None, "started": time.monotonic()}
+            pending[_llm_executor.submit(contextvars.copy_context().run, first, route, budget, state)] = (route, state["started"], budget, state)
+            next_hedge = time.monotonic() + self.hedge_delay(route, stream=True, task=task) if self.hedge and queue else float("inf")
+
+        def discard(future):
+            # A running attempt keeps its thread; its slot is given back whenever it finishes
+            future.cancel()
+            future.add_done_callback(_discard_stream)
+
+        launch()
+        while pending:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            expiry = min(started + budget for _, started, budget, _ in pending.values())
+            done, _ = wait(list(pending), timeout=max(0.0, min(deadline, next_hedge, expiry) - now), return_when=FIRST_COMPLETED)
+            for future in done:
+                route, _, _, state = pending.pop(future)
+                try:
+                    slot, iterator, chunk = future.result()
+                except Exception as e:
+                    self._attempt_failed(route, e, errors, task)
+                    continue
+                now = time.monotonic()
+                self.record(route, now - state["running"], True, stream=True, task=task)
+                self._won(route, routes, pending, now, stream=True, task=task)
+                for loser in pending:
+                    discard(loser)
+                return route, state["running"], slot, iterator, chunk
+
+            now = time.monotonic()
+            for future, (route, started, budget, state) in list(pending.items()):
+                if now - started >= budget:
+                    del pending[future]
+                    discard(future)
+                    self._abandoned(route, state, now, stream=True, task=task)
+                    self._expired(route, budget, state["running"], errors, task)
+            if queue and now < deadline:
+                if not pending:
+                    self.counters["fallbacks"] += 1
+                    launch()
+                elif now >= next_hedge:
+                    next_hedge = float("inf")
+                    if self._may_hedge():
+                        launch()
+        now = time.monotonic()
+        for future, (route, _, _, state) in pending.items():
+            discard(future)
+            self._abandoned(route, state, now, stream=True, task=task)
+            errors.setdefault(route.label, "call deadline reached")
+        raise self._failed(routes, errors)
+
+    def stream(self, open_fn: Callable[[Route, float], Iterator[Any]], model: str, provider: Optional[str] = None, timeout: Optional[float] = None, deadline: Optional[float] = None, priority: int = 1, task: Optional[str] = None) -> Iterator[Any]:
+        """
+        Sync streaming. An attempt succeeds once its route yields the first chunk;
+        routes fall back and hedge as in `call`, measured on time to first chunk.
+        Once tokens flow the stream is not switched. The scheduler slot is held
+        until the stream is exhausted or closed.
+        """
+        self.counters["calls"] += 1
+        deadline = time.monotonic() + self._budget(timeout, deadline)
+        routes = self.routes(model, provider, stream=True, task=task)
+        route, running, slot, iterator, chunk = self._open_stream(open_fn, routes, deadline, priority, task)
+        status = "ok"
+        try:
+            yield chunk
+            yield from iterator
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            try:
+                if hasattr(iterator, "close"):
+                    iterator.close()
+            finally:
+                llm_scheduler.release(slot)
+                observe_llm(route.label, time.monotonic() - running, status)
+
+    async def _aopen_stream(self, open_fn: Callable[[Route, float], AsyncIterator[Any]], routes: List[Route], deadline: float, priority: int, task: Optional[str]):
+        """Async counterpart of `_open_stream`; losing and expired attempts are cancelled or closed."""
+        loop = asyncio.get_running_loop()
+        queue = list(routes)
+        pending: Dict[asyncio.Task, tuple] = {}
+        errors: Dict[str, str] = {}
+        next_hedge = float("inf")
+
+        async def first(route: Route, budget: float, state: dict):
+            slot = await llm_scheduler.aacquire(route.label, priority, budget)
+            try:
+                state["running"] = loop.time()
+                iterator = open_fn(route, max(0.0, budget - (state["running"] - state["started"]))).__aiter__()
+                try:
+                    return slot, iterator, await iterator.__anext__()
+                except StopAsyncIteration:
+                    await _aclose(iterator)
+                    raise ValueError("empty response")
+                except BaseException:
+                    await _aclose(iterator)
+                    raise
+            except BaseException:
+                llm_scheduler.release(slot)
+                raise
+
+        def launch():
+            nonlocal next_hedge
+            route = self._take(queue, errors)
+            if route is None:
+                return
+            budget = max(0.0, min(self.attempt_timeout, deadline - loop.time()))
+            state = {"running": None, "started": loop.time()}
+            pending[asyncio.ensure_future(first(route, budget, state))] = (route, state["started"], budget, state)
+            next_hedge = loop.time() + self.hedge_delay(route, stream=True, task=task) if self.hedge and queue else float("inf")
+
+        launch()
+        try:
+            while pending:
+                now = loop.time()
+                if now >= deadline:
+                    break
+                expiry = min(started + budget for _, started, budget, _ in pending.values())
+                done, _ = await asyncio.wait(list(pending), timeout=max(0.0, min(deadline, next_hedge, expiry) - now), return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    route, _, _, state = pending.pop(future)
+                    if future.cancelled():
+                        errors[route.label] = "cancelled"
+                        continue
+                    if future.exception() is not None:
+                        self._attempt_failed(route, future.exception(), errors, task)
+                        continue
+                    slot, iterator, chunk = future.result()
+                    now = loop.time()
+                    self.record(route, now - state["running"], True, stream=True, task=task)
+                    self._won(route, routes, pending, now, stream=True, task=task)
+                    return route, state["running"], slot, iterator, chunk
+
+                now = loop.time()
+                for future, (route, started, budget, state) in list(pending.items()):
+                    if now - started >= budget:
+                        del pending[future]
+                        await _adiscard_stream(future)
+                        self._abandoned(route, state, now, stream=True, task=task)
+                        self._expired(route, budget, state["running"], errors, task)
+                if queue and now < deadline:
+                    if not pending:
+                        self.counters["fallbacks"] += 1
+                        launch()
+                    elif now >= next_hedge:
+                        next_hedge = float("inf")
+                        if self._may_hedge():
+                            launch()
+            now = loop.time()
+            for route, _, _, state in pending.values():
+                self._abandoned(route, state, now, stream=True, task=task)
+                errors.setdefault(route.label, "call deadline reached")
+            raise self._failed(routes, errors)
+        finally:
+            for future, (route, _, _, _) in pending.items():
+                await _adiscard_stream(future)
+                get_breaker(f"g4f:{route.label}").release()
+
+    async def astream(self, open_fn: Callable[[Route, float], AsyncIterator[Any]], model: str, provider: Optional[str] = None, timeout: Optional[float] = None, deadline: Optional[float] = None, priority: int = 1, task: Optional[str] = None) -> AsyncIterator[Any]:
+        """Async counterpart of `stream`."""
+        loop = asyncio.get_running_loop()
+        self.counters["calls"] += 1
+        deadline = loop.time() + self._budget(timeout, deadline)
+        routes = self.routes(model, provider, stream=True, task=task)
+        route, running, slot, iterator, chunk = await self._aopen_stream(open_fn, routes, deadline, priority, task)
+        status = "ok"
+        try:
+            yield chunk
+            async for chunk in iterator:
+                yield chunk
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            llm_scheduler.release(slot)
+            observe_llm(route.label, loop.time() - running, status)
+            await _aclose(iterator)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            routes = {label: stats.snapshot() for label, stats in self.stats.items()}
+        return {**self.counters, "routes": routes}
+
+
+# Shared by every G4FChatModel so all nodes learn from the same provider history
+llm_pool = LLMPool()
@@ -0,0 +1,239 @@
+import os
+import time
+import asyncio
+import bisect
+import contextvars
+import itertools
+import threading
+from collections import Counter
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Dict, List, Optional, Set
+
+# g4f calls in flight across the process, and per model/provider route
+MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+PER_ROUTE_CONCURRENCY = int(os.getenv("LLM_PER_ROUTE_CONCURRENCY", "4"))
+# Assumed seconds per call until real ones have been measured
+DEFAULT_HOLD = 6.0
+
+
+class LLMOverloadedError(RuntimeError):
+    """No LLM slot became free within the caller's time budget."""
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "label", "event", "loop", "future", "granted", "started")
+
+    def __init__(self, priority: int, seq: int, label: str):
+        self.priority = priority
+        self.seq = seq
+        self.label = label
+        self.event: Optional[threading.Event] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.future: Optional[asyncio.Future] = None
+        self.granted = False
+        self.started = 0.0
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class Admission:
+    """A request admitted by `LLMScheduler.admit` that has not reached its first LLM call yet."""
+    __slots__ = ("expires",)
+
+    def __init__(self, expires: float):
+        self.expires = expires
+
+
+# Admission of the request running in this context, if any
+_admission: contextvars.ContextVar[Optional[Admission]] = contextvars.ContextVar("llm_admission", default=None)
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(True)
+
+
+class LLMScheduler:
+    """
+    Bounded admission for g4f calls, shared by sync threads and async tasks.
+
+    At most `max_concurrency` calls run at once, and at most `per_route` on one
+    model/provider route, so a burst cannot fan out into every provider at once
+    and get throttled everywhere. Waiting calls are served by priority (lower
+    first, see model_router.PRIORITIES), then arrival order, so short extractions
+    overtake long reasoning calls. `admit` is the admission control used by api.py:
+    it counts requests already admitted but not yet queued for a slot as work
+    ahead of a new one, so a burst cannot all be admitted before any of it queues.
+    """
+
+    def __init__(self, max_concurrency: int = MAX_CONCURRENCY, per_route: int = PER_ROUTE_CONCURRENCY):
+        self.max_concurrency = max_concurrency
+        self.per_route = per_route
+        self.stats = {"granted": 0, "queued": 0, "timeouts": 0, "max_waiting": 0}
+        self._active = 0
+        self._route_active: Counter = Counter()
+        self._waiters: List[_Waiter] = []
+        self._admitted: Set[Admission] = set()
+        self._seq = itertools.count()
+        self._hold = DEFAULT_HOLD  # moving average of slot hold time
+        self._lock = threading.Lock()
+
+    @property
+    def saturated(self) -> bool:
+        return self._active >= self.max_concurrency or bool(self._waiters)
+
+    @property
+    def avg_call_seconds(self) -> float:
+        return self._hold
+
+    def _pending(self) -> int:
+        """Admitted requests not yet at an LLM call. Caller holds the lock."""
+        now = time.monotonic()
+        # A request whose stream was never consumed never settles; it stops counting at its deadline
+        self._admitted = {a for a in self._admitted if a.expires > now}
+        return len(self._admitted)
+
+    def _wait(self) -> float:
+        ahead = len(self._waiters) + self._pending() - (self.max_concurrency - self._active)
+        if ahead < 0:
+            return 0.0
+        return (ahead + 1) / self.max_concurrency * self._hold
+
+    def estimated_wait(self) -> float:
+        """
+        Rough seconds a new call would queue, from the calls waiting, the admitted requests
+        that will queue shortly, and the average call time.
+        """
+        with self._lock:
+            return self._wait()
+
+    def admit(self, budget: float, expires_in: float) -> Optional[Admission]:
+        """
+        Admits a request if its first LLM call would get a slot and finish within `budget`
+        seconds. Returns None when it would not. Run the request under `admitted` so it
+        stops counting as pending once it queues; otherwise it counts for `expires_in` seconds.
+        """
+        with self._lock:
+            if self._wait() + self._hold > budget:
+                return None
+            admission = Admission(time.monotonic() + expires_in)
+            self._admitted.add(admission)
+            return admission
+
+    @contextmanager
+    def admitted(self, admission: Admission):
+        """Ties LLM calls made in this context to `admission`, and settles it on exit."""
+        _admission.set(admission)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._admitted.discard(admission)
+
+    def _dispatch(self):
+        """Grants free slots to waiters in priority order. Caller holds the lock."""
+        i = 0
+        while i < len(self._waiters) and self._active < self.max_concurrency:
+            waiter = self._waiters[i]
+            if self._route_active[waiter.label] >= self.per_route:
+                i += 1
+                continue
+            del self._waiters[i]
+            self._active += 1
+            self._route_active[waiter.label] += 1
+            waiter.granted = True
+            waiter.started = time.monotonic()
+            self.stats["granted"] += 1
+            if waiter.event is not None:
+                waiter.event.set()
+            else:
+                waiter.loop.call_soon_threadsafe(_resolve, waiter.future)
+
+    def _enqueue(self, waiter: _Waiter):
+        admission = _admission.get()
+        with self._lock:
+            if admission is not None:
+                # From here on the request is counted by its waiters and slots
+                self._admitted.discard(admission)
+            bisect.insort(self._waiters, waiter)
+            self._dispatch()
+            if not waiter.granted:
+                self.stats["queued"] += 1
+                self.stats["max_waiting"] = max(self.stats["max_waiting"], len(self._waiters))
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """Withdraws a waiter that gave up. Returns True if it had been granted meanwhile."""
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._waiters.remove(waiter)
+            self.stats["timeouts"] += 1
+            return False
+
+    def release(self, waiter: _Waiter):
+        with self._lock:
+            self._active -= 1
+            self._route_active[waiter.label] -= 1
+            self._hold = 0.9 * self._hold + 0.1 * (time.monotonic() - waiter.started)
+            self._dispatch()
+
+    def acquire(self, label: str, priority: int = 1, timeout: Optional[float] = None) -> _Waiter:
+        waiter = _Waiter(priority, next(self._seq), label)
+        waiter.event = threading.Event()
+        self._enqueue(waiter)
+        if waiter.event.wait(timeout) or self._abandon(waiter):
+            return waiter
+        raise LLMOverloadedError(f"No LLM slot for {label} within {timeout:.1f}s")
+
+    async def aacquire(self, label: str, priority: int = 1, timeout: Optional[float] = None) -> _Waiter:
+        waiter = _Waiter(priority, next(self._seq), label)
+        waiter.loop = asyncio.get_running_loop()
+        waiter.future = waiter.loop.create_future()
+        self._enqueue(waiter)
+        try:
+            await asyncio.wait_for(waiter.future, timeout)
+        except asyncio.TimeoutError:
+            if self._abandon(waiter):
+                return waiter
+            raise LLMOverloadedError(f"No LLM slot for {label} within {timeout:.1f}s")
+        except asyncio.CancelledError:
+            # e.g. a hedged attempt that lost; hand the slot on if it arrived meanwhile
+            if self._abandon(waiter):
+                self.release(waiter)
+            raise
+        return waiter
+
+    @contextmanager
+    def slot(self, label: str, priority: int = 1, timeout: Optional[float] = None):
+        """Holds a slot for the block; yields the seconds of `timeout` left after queueing."""
+        started = time.monotonic()
+        waiter = self.acquire(label, priority, timeout)
+        try:
+            yield None if timeout is None else max(0.0, timeout - (time.monotonic() - started))
+        finally:
+            self.release(waiter)
+
+    @asynccontextmanager
+    async def aslot(self, label: str, priority: int = 1, timeout: Optional[float] = None):
+        started = time.monotonic()
+        waiter = await self.aacquire(label, priority, timeout)
+        try:
+            yield None if timeout is None else max(0.0, timeout - (time.monotonic() - started))
+        finally:
+            self.release(waiter)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "active": self._active,
+                "waiting": len(self._waiters),
+                "admitted_pending": self._pending(),
+                "per_route": {k: v for k, v in self._route_active.items() if v},
+                "avg_call_seconds": round(self._hold, 2),
+                **self.stats,
+            }
+
+
+# Shared by every G4FChatModel in the process
+llm_scheduler = LLMScheduler()
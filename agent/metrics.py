@@ -0,0 +1,196 @@
+import os
+import time
+import inspect
+import functools
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from prometheus_client import Counter, Histogram, REGISTRY
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# Seconds; spans run from a cache hit (~1ms) up to a full REQUEST_TIMEOUT
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 60, 90)
+# Estimated tokens (prompt_budget.estimate_tokens)
+TOKEN_BUCKETS = (16, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+# Send a Server-Timing header on every /chat response, not only when X-Timing is requested
+TIMING_HEADER = os.getenv("TIMING_HEADER", "0") == "1"
+
+REQUEST_SECONDS = Histogram(
+    "agent_request_seconds", "HTTP request wall time", ["endpoint", "status"], buckets=LATENCY_BUCKETS
+)
+NODE_SECONDS = Histogram(
+    "agent_node_seconds", "Graph node wall time", ["node", "status"], buckets=LATENCY_BUCKETS
+)
+TOOL_SECONDS = Histogram(
+    "agent_tool_seconds", "Upstream call wall time (yfinance, Pinecone, embeddings)", ["tool", "operation", "status"], buckets=LATENCY_BUCKETS
+)
+LLM_SECONDS = Histogram(
+    "agent_llm_attempt_seconds", "One g4f attempt, from slot grant to answer", ["route", "status"], buckets=LATENCY_BUCKETS
+)
+LLM_PROMPT_TOKENS = Histogram(
+    "agent_llm_prompt_tokens", "Estimated prompt tokens per LLM call", ["model"], buckets=TOKEN_BUCKETS
+)
+LLM_COMPLETION_TOKENS = Histogram(
+    "agent_llm_completion_tokens", "Estimated completion tokens per LLM call", ["model"], buckets=TOKEN_BUCKETS
+)
+TOOL_RETRIES = Counter("agent_tool_retries_total", "Retried upstream calls", ["tool"])
+
+# Spans of the request being served, when it asked for a timing breakdown
+_timings: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar("request_timings", default=None)
+
+
+@contextmanager
+def request_timings():
+    """Collects every span finished in this context (and tasks/threads copied from it)."""
+    timings: List[Tuple[str, float]] = []
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+
+def timing_totals(timings: List[Tuple[str, float]]) -> Dict[str, float]:
+    """Milliseconds per span name, in first-seen order; repeated spans (retries, parallel fetches) are summed."""
+    totals: Dict[str, float] = {}
+    for name, seconds in timings:
+        totals[name] = totals.get(name, 0.0) + seconds * 1000
+    return {name: round(ms, 1) for name, ms in totals.items()}
+
+
+def server_timing(timings: List[Tuple[str, float]]) -> str:
+    """Server-Timing header value for a request's spans."""
+    return ", ".join(f"{name.replace(':', '-')};dur={ms}" for name, ms in timing_totals(timings).items())
+
+
+@contextmanager
+def span(histogram: Histogram, name: str, **labels: str):
+    """Times the block into `histogram` with a status label, and into the request breakdown as `name`."""
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except Exception:
+        status = "error"
+        raise
+    except BaseException:
+        # Lost hedges, abandoned streams, client disconnects
+        status = "cancelled"
+        raise
+    finally:
+        observe(histogram, name, time.perf_counter() - started, status, **labels)
+
+
+def observe(histogram: Histogram, name: str, seconds: float, status: str = "ok", **labels: str):
+    """Records a duration measured by the caller, e.g. a stream that outlives any one block."""
+    histogram.labels(status=status, **labels).observe(seconds)
+    timings = _timings.get()
+    if timings is not None:
+        timings.append((name, seconds))
+
+
+def tool_span(tool: str, operation: str):
+    return span(TOOL_SECONDS, f"{tool}:{operation}", tool=tool, operation=operation)
+
+
+def llm_span(route: str):
+    return span(LLM_SECONDS, f"llm:{route}", route=route)
+
+
+def observe_llm(route: str, seconds: float, status: str = "ok"):
+    observe(LLM_SECONDS, f"llm:{route}", seconds, status, route=route)
+
+
+def record_llm_tokens(model: str, prompt_tokens: int, completion_tokens: int):
+    LLM_PROMPT_TOKENS.labels(model=model).observe(prompt_tokens)
+    LLM_COMPLETION_TOKENS.labels(model=model).observe(completion_tokens)
+
+
+def timed_node(name: str, func: Callable) -> Callable:
+    """
+    Wraps a graph node (sync or async) in a span. A node that reports a failure
+    through an `error` key instead of raising is counted with status "error".
+    """
+    def finish(started: float, result: Any, status: str = "ok"):
+        if status == "ok" and isinstance(result, dict) and result.get("error"):
+            status = "error"
+        observe(NODE_SECONDS, name, time.perf_counter() - started, status, node=name)
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_node(state):
+            started = time.perf_counter()
+            try:
+                result = await func(state)
+            except Exception:
+                finish(started, None, "error")
+                raise
+            finish(started, result)
+            return result
+        return async_node
+
+    @functools.wraps(func)
+    def node(state):
+        started = time.perf_counter()
+        try:
+            result = func(state)
+        except Exception:
+            finish(started, None, "error")
+            raise
+        finish(started, result)
+        return result
+    return node
+
+
+class StatsCollector:
+    """
+    Exports the `stats` dicts the caches, LLM pool, scheduler and circuit breakers
+    already keep, read at scrape time, so hot paths need no extra bookkeeping.
+    """
+
+    def __init__(self, sources: Dict[str, Callable[[], Any]]):
+        self.sources = sources
+
+    def collect(self):
+        caches = CounterMetricFamily("agent_cache_events", "Cache lookups by outcome", labels=["cache", "event"])
+        for cache in ("response_cache", "market_cache"):
+            for event, count in self.sources[cache]().items():
+                caches.add_metric([cache, event], count)
+        for model, stats in self.sources["embedding_caches"]().items():
+            for event, count in stats.items():
+                caches.add_metric([f"embedding_cache:{model}", event], count)
+        yield caches
+
+        llm = CounterMetricFamily("agent_llm_events", "LLM calls, fallbacks (retries on another route), hedges and failures", labels=["event"])
+        for event, count in self.sources["llm_pool"]().items():
+            llm.add_metric([event], count)
+        yield llm
+
+        scheduler = self.sources["llm_scheduler"]()
+        queue = CounterMetricFamily("agent_llm_queue_events", "LLM slot grants, queued calls and queue timeouts", labels=["event"])
+        for event in ("granted", "queued", "timeouts"):
+            queue.add_metric([event], scheduler[event])
+        yield queue
+        yield GaugeMetricFamily("agent_llm_slots_active", "LLM calls holding a slot", value=scheduler["active"])
+        yield GaugeMetricFamily("agent_llm_queue_waiting", "LLM calls waiting for a slot", value=scheduler["waiting"])
+
+        circuits = self.sources["circuits"]()
+        circuit_events = CounterMetricFamily("agent_circuit_events", "Circuit breaker outcomes", labels=["circuit", "event"])
+        circuit_open = GaugeMetricFamily("agent_circuit_open", "1 while a circuit rejects calls", labels=["circuit"])
+        for name, snapshot in circuits.items():
+            for event in ("successes", "failures", "rejected", "opened"):
+                circuit_events.add_metric([name, event], snapshot[event])
+            circuit_open.add_metric([name], 1 if snapshot["state"] == "open" else 0)
+        yield circuit_events
+        yield circuit_open
+
+
+_collector: Optional[StatsCollector] = None
+
+
+def register_stats(sources: Dict[str, Callable[[], Any]]):
+    """Registers the stats exporter once; later calls are ignored (e.g. app reloads)."""
+    global _collector
+    if _collector is None:
+        _collector = StatsCollector(sources)
+        REGISTRY.register(_collector)
@@ -0,0 +1,169 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger("financial_agent")
+
+# Model per task, optionally per intent ("task:intent"); "model@Provider" pins a provider.
+# Small models do extraction and formatting, the large one writes the analysis.
+DEFAULT_ROUTES = {
+    "input_parsing": "gpt-4o-mini",
+    "reasoning": "deepseek-v3",
+    "reasoning:general_chat": "gpt-4o-mini",
+    "report": "deepseek-v3",
+    "response_generation": "gpt-4o-mini",
+}
+# Tried in order while the routed model misses its targets
+ALTERNATES = {
+    "input_parsing": ["llama-3.3-70b", "deepseek-v3"],
+    "reasoning": ["gpt-4o"],
+    "report": ["gpt-4o"],
+    "response_generation": ["deepseek-v3"],
+}
+# p95 latency target per task in seconds
+LATENCY_TARGETS = {"input_parsing": 6.0, "reasoning": 40.0, "report": 40.0, "response_generation": 15.0}
+# llm_scheduler queue priority per task, lower first: short calls that unblock a request overtake long ones
+PRIORITIES = {"input_parsing": 0, "response_generation": 1, "report": 2, "reasoning": 2}
+MAX_FAILURE_RATE = float(os.getenv("MODEL_ROUTER_MAX_FAILURES", "0.25"))
+MIN_SAMPLES = int(os.getenv("MODEL_ROUTER_MIN_SAMPLES", "10"))
+# A demoted model gets a fresh window and serves again after this many seconds
+COOLDOWN = float(os.getenv("MODEL_ROUTER_COOLDOWN", "300"))
+
+
+def _load_routes() -> Dict[str, str]:
+    routes = dict(DEFAULT_ROUTES)
+    raw = os.getenv("MODEL_ROUTES")
+    if raw:
+        try:
+            routes.update(json.loads(raw))
+        except (json.JSONDecodeError, TypeError) as e:
+            logger.warning(f"Ignoring invalid MODEL_ROUTES: {e}")
+    return routes
+
+
+class _Health:
+    __slots__ = ("samples", "demoted_until", "calls", "failures")
+
+    def __init__(self):
+        self.samples = deque(maxlen=50)  # (latency, ok)
+        self.demoted_until = 0.0
+        self.calls = 0
+        self.failures = 0
+
+    def failure_rate(self) -> float:
+        return sum(1 for _, ok in self.samples if not ok) / len(self.samples) if self.samples else 0.0
+
+    def p95(self) -> Optional[float]:
+        latencies = sorted(latency for latency, ok in self.samples if ok)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+
+
+class ModelRouter:
+    """
+    Picks the model for each LLM task from a routing table keyed by task and
+    intent, then adjusts it from what it observes. Callers wrap each call in
+    `track`, which records latency and whether the output parsed. Once a model
+    has MIN_SAMPLES for a task and its failure rate or p95 latency misses the
+    task's target, it is skipped in favour of the next ALTERNATES entry for
+    COOLDOWN seconds. `set_route` changes the table at runtime.
+    """
+
+    def __init__(self, routes: Optional[Dict[str, str]] = None, alternates: Optional[Dict[str, List[str]]] = None):
+        self.routes = dict(routes) if routes is not None else _load_routes()
+        self.alternates = {k: list(v) for k, v in (alternates or ALTERNATES).items()}
+        self._health: Dict[tuple, _Health] = {}
+        self._lock = threading.Lock()
+
+    def configured(self, task: str, intent: Optional[str] = None) -> str:
+        if intent and f"{task}:{intent}" in self.routes:
+            return self.routes[f"{task}:{intent}"]
+        return self.routes.get(task, DEFAULT_ROUTES["reasoning"])
+
+    def candidates(self, task: str, intent: Optional[str] = None) -> List[str]:
+        return list(dict.fromkeys([self.configured(task, intent), *self.alternates.get(task, [])]))
+
+    def select(self, task: str, intent: Optional[str] = None) -> str:
+        """Model spec ("model" or "model@Provider") to use for this task now."""
+        candidates = self.candidates(task, intent)
+        now = time.monotonic()
+        with self._lock:
+            for spec in candidates:
+                health = self._health.get((task, spec))
+                if health is None:
+                    return spec
+                if health.demoted_until:
+                    if now < health.demoted_until:
+                        continue
+                    health.demoted_until = 0.0
+                    health.samples.clear()
+                    logger.info(f"Model router: {spec} back in rotation for {task}.")
+                return spec
+        # Everything is demoted; the configured model is still the best guess
+        return candidates[0]
+
+    def record(self, task: str, spec: str, latency: float, ok: bool):
+        with self._lock:
+            health = self._health.setdefault((task, spec), _Health())
+            health.calls += 1
+            health.failures += 0 if ok else 1
+            health.samples.append((latency, ok))
+            if len(health.samples) < MIN_SAMPLES or health.demoted_until:
+                return
+            failure_rate = health.failure_rate()
+            p95 = health.p95()
+            target = LATENCY_TARGETS.get(task)
+            if failure_rate > MAX_FAILURE_RATE or (target is not None and p95 is not None and p95 > target):
+                health.demoted_until = time.monotonic() + COOLDOWN
+                logger.warning(
+                    f"Model router: demoting {spec} for {task} "
+                    f"(failure rate {failure_rate:.0%}, p95 {p95 or 0:.1f}s) for {COOLDOWN:.0f}s."
+                )
+
+    @contextmanager
+    def track(self, task: str, spec: str):
+        """Records latency and success of the wrapped call; unparseable output counts as a failure."""
+        started = time.monotonic()
+        try:
+            yield
+        except Exception:
+            self.record(task, spec, time.monotonic() - started, False)
+            raise
+        else:
+            self.record(task, spec, time.monotonic() - started, True)
+
+    def set_route(self, key: str, spec: Optional[str]):
+        """Sets (or with None, resets to default) the model for "task" or "task:intent"."""
+        with self._lock:
+            if spec:
+                self.routes[key] = spec
+            elif key in DEFAULT_ROUTES:
+                self.routes[key] = DEFAULT_ROUTES[key]
+            else:
+                self.routes.pop(key, None)
+        logger.info(f"Model router: {key} -> {self.routes.get(key)}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            health = {
+                f"{task}/{spec}": {
+                    "calls": h.calls,
+                    "failures": h.failures,
+                    "failure_rate": round(h.failure_rate(), 3),
+                    "p95": h.p95(),
+                    "demoted_for": round(max(0.0, h.demoted_until - now), 1) if h.demoted_until else 0.0,
+                }
+                for (task, spec), h in self._health.items()
+            }
+            return {"routes": dict(self.routes), "health": health}
+
+
+# Shared by all nodes
+model_router = ModelRouter()
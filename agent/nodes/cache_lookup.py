@@ -0,0 +1,22 @@
+from agent.schemas.state import AgentState
+from agent.response_cache import response_cache
+
+def lookup_response(state: AgentState):
+    """
+    Node to answer repeated knowledge-only questions from the response cache.
+    On a hit it fills `final_response` and the graph ends here; on a miss it
+    returns nothing and planning continues as usual.
+    """
+    query = state.get('parsed_query')
+    if not query:
+        return {}
+
+    language = getattr(query, 'language', 'english')
+    cached = response_cache.get(query.original_query, query.intent, language)
+    if cached is None:
+        return {}
+
+    return {
+        "final_response": cached.text,
+        "analysis_result": {"text": cached.text, "intent": cached.intent, "language": cached.language},
+    }
@@ -1,5 +1,11 @@
 from agent.schemas.state import AgentState
-from agent.tools.market_data import MarketDataTool
+from agent.tools.market_data import MarketDataTool, FETCH_TIMEOUT
+from agent.deadline import remaining
+
+def _valid_tickers(state: AgentState):
+    query = state.get('parsed_query')
+    # Filter out special GREETING ticker
+    return [t for t in (query.tickers or []) if t != "GREETING"]
 
 def fetch_data(state: AgentState):
     """
@@ -9,22 +15,35 @@ def fetch_data(state: AgentState):
     if not query:
         return {"error": "No parsed query found."}
 
-    tickers = query.tickers
-    if not tickers:
-        return {"fetched_data": {}}
-
-    # Filter out special GREETING ticker
-    valid_tickers = [t for t in tickers if t != "GREETING"]
+    valid_tickers = _valid_tickers(state)
     
     if not valid_tickers:
         return {"fetched_data": {}}
 
     tool = MarketDataTool()
     
-    # We fetch basic info for all tickers
-    data = tool.get_market_data(valid_tickers)
+    # We fetch basic info for all tickers, within what is left of the request budget
+    data = tool.get_market_data(valid_tickers, timeout=remaining(state.get('deadline'), FETCH_TIMEOUT))
     
     # If timeframe implies history needed (not implemented fully in this MVP but placeholder)
     # history = tool.get_history(tickers[0], period=query.timeframe)
     
     return {"fetched_data": data}
+
+async def afetch_data(state: AgentState):
+    """
+    Async variant of fetch_data.
+    """
+    query = state.get('parsed_query')
+    if not query:
+        return {"error": "No parsed query found."}
+
+    valid_tickers = _valid_tickers(state)
+    
+    if not valid_tickers:
+        return {"fetched_data": {}}
+
+    tool = MarketDataTool()
+    data = await tool.aget_market_data(valid_tickers, timeout=remaining(state.get('deadline'), FETCH_TIMEOUT))
+    
+    return {"fetched_data": data}
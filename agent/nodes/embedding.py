@@ -1,22 +1,17 @@
 from langchain_core.documents import Document
 from agent.schemas.state import AgentState
-from agent.tools.vector_store import VectorStoreTool
+from agent.tools.embedding_queue import embedding_queue
+from agent.tools.vector_store import memory_available
 
-def embed_knowledge(state: AgentState):
-    """
-    Node to embed the normalized data into Pinecone for future retrieval.
-    This acts as 'long term memory' of what we have seen.
-    """
-    metrics = state.get('normalized_metrics', [])
-    if not metrics:
-        return {}
-        
+def _build_documents(metrics):
     documents = []
     for m in metrics:
         # Create a text representation. 
         # In a real system, we might be more verbose or include summary analysis.
+        # Only the date goes into the text: the content hash is the document ID, so
+        # identical snapshots taken the same day dedupe and hit the embedding cache.
         content = (
-            f"Financial Metrics for {m.ticker} on {m.last_updated}:\n"
+            f"Financial Metrics for {m.ticker} on {m.last_updated[:10]}:\n"
             f"Price: {m.price} {m.currency}\n"
             f"Market Cap: {m.market_cap}\n"
             f"PE Ratio: {m.pe_ratio}\n"
@@ -31,14 +26,28 @@ def embed_knowledge(state: AgentState):
         }
         
         documents.append(Document(page_content=content, metadata=meta))
+    return documents
+
+def embed_knowledge(state: AgentState):
+    """
+    Node to embed the normalized data into Pinecone for future retrieval.
+    This acts as 'long term memory' of what we have seen.
+    Documents go to the write-behind embedding queue, so the request never waits on
+    Gemini or Pinecone here.
+    """
+    metrics = state.get('normalized_metrics', [])
+    if not metrics:
+        return {}
+    if not memory_available():
+        # Gemini or Pinecone is down; don't pile up writes that would fail anyway
+        print("[WARNING] Skipping memory write: vector memory circuit is open.")
+        return {}
         
     try:
-        tool = VectorStoreTool()
-        if tool.index:
-            tool.upsert_documents(documents)
+        embedding_queue.submit(_build_documents(metrics))
     except Exception as e:
         # Log error but don't crash. Long term memory is optional.
-        print(f"[WARNING] Failed to store embedding: {e}")
+        print(f"[WARNING] Failed to queue embedding: {e}")
     
     # We don't necessarily update state here, mostly side-effect.
     return {}
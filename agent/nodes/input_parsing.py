@@ -3,19 +3,19 @@ import json
 from langchain_core.messages import HumanMessage
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
-from agent.llm_factory import get_llm
+from agent.llm_factory import get_llm_for
+from agent.model_router import model_router
 from agent.schemas.state import AgentState
 from agent.schemas.models import FinancialQuery
+from agent.query_classifier import classify_query, FAST_PATH_CONFIDENCE
+from agent.tools.symbol_index import get_symbol_index
+from agent.singleflight import SingleFlight, AsyncSingleFlight
 
-def parse_input(state: AgentState):
-    """
-    Node to parse the user's natural language into a structured FinancialQuery.
-    """
-    messages = state['messages']
-    last_message = messages[-1]
-    
-    llm = get_llm(temperature=0)
-    
+# Identical queries arriving together share one LLM extraction
+_parse_flight = SingleFlight()
+_aparse_flight = AsyncSingleFlight()
+
+def _build_prompt():
     parser = JsonOutputParser(pydantic_object=FinancialQuery)
     
     prompt = PromptTemplate(
@@ -55,25 +55,80 @@ def parse_input(state: AgentState):
         partial_variables={"format_instructions": parser.get_format_instructions()},
     )
     
-    chain = prompt | llm | parser
+    return prompt
+
+def _extraction_messages(content):
+    return _build_prompt().format_prompt(query=content).to_messages()
+
+def _to_parsed_query(parsed_dict, content):
+    # Manually validate/convert to Pydantic to ensure safety
+    # LLM tickers are mapped onto the local symbol index; anything it cannot resolve
+    # (placeholders like the special "GREETING" ticker, and with a full SYMBOL_MASTER
+    # also hallucinated symbols) is dropped here instead of costing yfinance retries downstream.
+    index = get_symbol_index()
+    tickers = []
+    for ticker in parsed_dict.get("tickers") or []:
+        canonical = index.canonicalize(ticker)
+        if canonical is None:
+            print(f"[DEBUG] Dropping unknown ticker: {ticker}")
+        elif canonical not in tickers:
+            tickers.append(canonical)
+    # parsed_dict may be shared with coalesced callers, so it is not modified in place
+    return FinancialQuery(**{**parsed_dict, "tickers": tickers, "original_query": content})
+
+def _extract(content, deadline=None):
+    # Small routed model; streamed and repaired as it arrives, reading stops once the JSON object is complete
+    llm, spec = get_llm_for("input_parsing")
+    with model_router.track("input_parsing", spec):
+        parser = llm.stream_json(_extraction_messages(content), FinancialQuery, defaults={"original_query": content}, deadline=deadline)
+        return parser.result()
+
+async def _aextract(content, deadline=None):
+    llm, spec = get_llm_for("input_parsing")
+    with model_router.track("input_parsing", spec):
+        parser = await llm.astream_json(_extraction_messages(content), FinancialQuery, defaults={"original_query": content}, deadline=deadline)
+        return parser.result()
+
+def parse_input(state: AgentState):
+    """
+    Node to parse the user's natural language into a structured FinancialQuery.
+    """
+    messages = state['messages']
+    last_message = messages[-1]
+    
+    # Obvious queries (greetings, LTP terms, known companies) skip the LLM round-trip
+    fast = classify_query(last_message.content)
+    if fast.query and fast.confidence >= FAST_PATH_CONFIDENCE:
+        return {"parsed_query": fast.query}
     
     try:
-        parsed_dict = chain.invoke({"query": last_message.content})
-        
-        # Manually validate/convert to Pydantic to ensure safety
-        # Handle the special "GREETING" case logic in data_fetch or here?
-        # Let's map GREETING to a safe state.
-        
-        if "tickers" in parsed_dict and "GREETING" in parsed_dict["tickers"]:
-             # If it's a greeting, we can fail gracefully or handle it. 
-             # For now, let's just let it pass, but the downstream tool will fail for ticker "GREETING".
-             # Better: Return error "GREETING" to handle it in graph? 
-             # Or just allow empty tickers.
-             pass
-             
-        parsed = FinancialQuery(**parsed_dict)
-        parsed.original_query = last_message.content
-        return {"parsed_query": parsed}
+        parsed_dict = _parse_flight.do(
+            last_message.content,
+            lambda: _extract(last_message.content, state.get('deadline'))
+        )
+        return {"parsed_query": _to_parsed_query(parsed_dict, last_message.content)}
+    except Exception as e:
+        print(f"[DEBUG] Input parsing failed: {e}")
+        return {"error": f"Failed to parse input: {str(e)}"}
+
+async def aparse_input(state: AgentState):
+    """
+    Async variant of parse_input.
+    """
+    messages = state['messages']
+    last_message = messages[-1]
+    
+    # Obvious queries (greetings, LTP terms, known companies) skip the LLM round-trip
+    fast = classify_query(last_message.content)
+    if fast.query and fast.confidence >= FAST_PATH_CONFIDENCE:
+        return {"parsed_query": fast.query}
+    
+    try:
+        parsed_dict = await _aparse_flight.do(
+            last_message.content,
+            lambda: _aextract(last_message.content, state.get('deadline'))
+        )
+        return {"parsed_query": _to_parsed_query(parsed_dict, last_message.content)}
     except Exception as e:
         print(f"[DEBUG] Input parsing failed: {e}")
         return {"error": f"Failed to parse input: {str(e)}"}
@@ -1,19 +1,25 @@
 import os
 import json
-from pathlib import Path
-from agent.llm_factory import get_llm
+from agent.llm_factory import get_llm_for
+from agent.model_router import model_router
+from agent.llm_pool import LLMUnavailableError
 from langchain_core.messages import HumanMessage, SystemMessage
 from agent.schemas.state import AgentState
-
-# Load LTP Calculator system prompt once at module level
-LTP_SYSTEM_PROMPT = ""
-try:
-    sys_prompt_path = Path(__file__).parent.parent.parent / "sys_prmpt.txt"
-    if sys_prompt_path.exists():
-        with open(sys_prompt_path, "r", encoding="utf-8") as f:
-            LTP_SYSTEM_PROMPT = f.read()
-except Exception as e:
-    print(f"[WARNING] Could not load sys_prmpt.txt: {e}")
+from agent.schemas.models import FinancialNarrative
+from agent.knowledge_base import PERSONA_CORE, build_system_prompt, load_knowledge_base
+from agent.prompt_budget import CONTEXT_DOC_TOKENS, REASONING_BUDGET, PromptBudget, render_metrics_table, truncate_to_tokens
+
+# LTP Calculator knowledge base, split into sections and indexed once at module level.
+# Each call gets the persona core plus only the sections relevant to the query.
+KNOWLEDGE_BASE = load_knowledge_base()
+
+# market_data / comparative_analysis reports. "single": the reasoning call writes the
+# narrative sections and the metrics table is rendered from normalized_metrics.
+# "two_pass": free-text analysis, then a separate structured formatting call.
+REPORT_MODE = os.getenv("REPORT_MODE", "single")
+REPORT_INTENTS = ("market_data", "comparative_analysis")
+# Shown when no model answered before the request deadline
+UNAVAILABLE_MESSAGE = "The AI service is busy or unreachable right now. Please try again in a moment."
 
 # Professional analysis prompt
 PROFESSIONAL_PROMPT = """
@@ -49,44 +55,13 @@ CRITICAL FINANCIAL ANALYSIS RULES:
 Keep analysis objective, accurate, and insightful.
 """
 
-def analyze_market(state: AgentState):
+def _build_messages(query, metrics, context):
     """
-    Multi-layer reasoning node with AI-driven layer selection.
-    - options_trading: Uses Daddy's AI persona with LTP Calculator knowledge
-    - market_data/comparative_analysis: Uses professional fundamental analysis
-    - general_chat: Natural conversation
+    Builds the reasoning prompt for the query's intent, fitted to REASONING_BUDGET.
     """
-    query = state.get('parsed_query')
-    metrics = state.get('normalized_metrics', [])
-    context = state.get('retrieved_docs', [])
-    
-    if not query:
-        return {"error": "No query to analyze."}
-
     intent = query.intent
     language = getattr(query, 'language', 'english')
     
-    # Build market data context
-    data_summary = ""
-    for m in metrics:
-        data_summary += (
-            f"Ticker: {m.ticker}\n"
-            f"Price: {m.price} {m.currency}\n"
-            f"Market Cap: {m.market_cap}\n"
-            f"PE Ratio: {m.pe_ratio}\n"
-            f"Profit Margin: {m.profit_margin * 100 if m.profit_margin else 'N/A'}%\n"
-            f"Operating Margin: {m.operating_margin * 100 if m.operating_margin else 'N/A'}%\n\n"
-        )
-    
-    docs_text = "\n\n".join(context)
-    
-    # Build context section
-    context_section = ""
-    if metrics:
-        context_section += "Current Market Data:\n" + data_summary + "\n"
-    if docs_text:
-        context_section += "Historical Context:\n" + docs_text + "\n"
-    
     # Language-aware response style
     # Hindi query = WhatsApp/Hinglish style
     # English query = English professional style
@@ -95,8 +70,11 @@ def analyze_market(state: AgentState):
     else:
         language_instruction = "Respond in professional English."
     
-    # SYSTEM PROMPT IS ALWAYS APPLIED for financial knowledge
-    system_prompt = LTP_SYSTEM_PROMPT if LTP_SYSTEM_PROMPT else "You are Daddy's AI - a financial expert for Indian stock market."
+    # SYSTEM PROMPT IS ALWAYS APPLIED for financial knowledge (relevant sections only)
+    knowledge = [s.text for s in KNOWLEDGE_BASE.search(query.original_query, document_order=False)]
+    
+    budget = PromptBudget(REASONING_BUDGET, name=f"reasoning[{intent}]")
+    budget.add("persona", PERSONA_CORE)
     
     # SELECT RESPONSE STYLE BASED ON INTENT
     if intent == "options_trading":
@@ -109,10 +87,8 @@ Query: {query.original_query}
 Provide a helpful response using LTP Calculator concepts.
 Explain with scenarios if applicable.
 """
-        messages = [
-            SystemMessage(content=system_prompt),
-            HumanMessage(content=user_prompt)
-        ]
+        budget.add("instructions", user_prompt)
+        budget.add("knowledge", knowledge, priority=1)
         
     elif intent == "general_chat":
         # General conversation but still with system knowledge
@@ -123,27 +99,111 @@ User asked: {query.original_query}
 
 Provide a helpful, natural response. Use your knowledge from the system prompt if relevant.
 """
-        messages = [
-            SystemMessage(content=system_prompt),
-            HumanMessage(content=user_prompt)
-        ]
+        budget.add("instructions", user_prompt)
+        budget.add("knowledge", knowledge, priority=1)
         
     else:
         # Professional fundamental analysis (market_data, comparative_analysis)
-        user_prompt = PROFESSIONAL_PROMPT.format(
+        # Live metrics matter most, then retrieved history, then LTP knowledge
+        template_args = dict(
             query=query.original_query,
             intent=intent,
             language=language,
-            context_section=context_section,
             language_instruction=language_instruction
         )
-        messages = [
-            SystemMessage(content=system_prompt),
-            HumanMessage(content=user_prompt)
-        ]
+        budget.add("instructions", PROFESSIONAL_PROMPT.format(context_section="", **template_args))
+        budget.add("metrics", render_metrics_table(metrics), priority=1, separator="\n")
+        budget.add("context", [truncate_to_tokens(d, CONTEXT_DOC_TOKENS) for d in context], priority=2)
+        budget.add("knowledge", knowledge, priority=3)
+    
+    fitted = budget.fit()
+    budget.log()
+    
+    if intent not in ("options_trading", "general_chat"):
+        context_section = ""
+        if fitted["metrics"]:
+            context_section += "Current Market Data:\n" + fitted["metrics"] + "\n\n"
+        if fitted["context"]:
+            context_section += "Historical Context:\n" + fitted["context"] + "\n"
+        user_prompt = PROFESSIONAL_PROMPT.format(context_section=context_section, **template_args)
+    
+    return [
+        SystemMessage(content=build_system_prompt(fitted["knowledge"])),
+        HumanMessage(content=user_prompt)
+    ]
+
+def _analysis_result(query, text, narrative=None):
+    result = {"text": text, "intent": query.intent, "language": getattr(query, 'language', 'english')}
+    if _wants_narrative(query):
+        # None tells response_generation the structured call failed and `text` is all there is
+        result["narrative"] = narrative.model_dump() if narrative else None
+    return result
+
+def _wants_narrative(query):
+    return REPORT_MODE == "single" and query.intent in REPORT_INTENTS
+
+def _narrative_text(narrative: FinancialNarrative) -> str:
+    return "\n\n".join(p for p in (narrative.executive_summary, narrative.comparative_analysis, narrative.final_insight) if p)
+
+def analyze_market(state: AgentState):
+    """
+    Multi-layer reasoning node with AI-driven layer selection.
+    - options_trading: Uses Daddy's AI persona with LTP Calculator knowledge
+    - market_data/comparative_analysis: Uses professional fundamental analysis
+    - general_chat: Natural conversation
+    """
+    query = state.get('parsed_query')
+    if not query:
+        return {"error": "No query to analyze."}
+
+    messages = _build_messages(query, state.get('normalized_metrics') or [], state.get('retrieved_docs') or [])
     
-    llm = get_llm(temperature=0.3)
-    response = llm.invoke(messages)
+    if _wants_narrative(query):
+        llm, spec = get_llm_for("report", query.intent, temperature=0.3)
+        try:
+            with model_router.track("report", spec):
+                narrative = llm.with_structured_output(FinancialNarrative).invoke(messages, deadline=state.get('deadline'))
+            return {"analysis_result": _analysis_result(query, _narrative_text(narrative), narrative)}
+        except Exception as e:
+            print(f"[WARNING] Structured analysis failed, falling back to text: {e}")
     
-    return {"analysis_result": {"text": response.content, "intent": intent, "language": language}}
+    llm, spec = get_llm_for("reasoning", query.intent, temperature=0.3)
+    try:
+        with model_router.track("reasoning", spec):
+            response = llm.invoke(messages, deadline=state.get('deadline'))
+    except LLMUnavailableError as e:
+        print(f"[WARNING] Reasoning failed: {e}")
+        return {"error": UNAVAILABLE_MESSAGE}
+    return {"analysis_result": _analysis_result(query, response.content)}
+
+async def aanalyze_market(state: AgentState):
+    """
+    Async variant of analyze_market.
+    """
+    query = state.get('parsed_query')
+    if not query:
+        return {"error": "No query to analyze."}
 
+    messages = _build_messages(query, state.get('normalized_metrics') or [], state.get('retrieved_docs') or [])
+    
+    if _wants_narrative(query):
+        llm, spec = get_llm_for("report", query.intent, temperature=0.3)
+        try:
+            with model_router.track("report", spec):
+                narrative = await llm.with_structured_output(FinancialNarrative).ainvoke(messages, deadline=state.get('deadline'))
+            return {"analysis_result": _analysis_result(query, _narrative_text(narrative), narrative)}
+        except Exception as e:
+            print(f"[WARNING] Structured analysis failed, falling back to text: {e}")
+    
+    # Stream so token callbacks reach astream_events consumers such as /chat/stream
+    llm, spec = get_llm_for("reasoning", query.intent, temperature=0.3)
+    chunks = []
+    try:
+        with model_router.track("reasoning", spec):
+            async for chunk in llm.astream(messages, deadline=state.get('deadline')):
+                chunks.append(chunk.content)
+    except LLMUnavailableError as e:
+        print(f"[WARNING] Reasoning failed: {e}")
+        return {"error": UNAVAILABLE_MESSAGE}
+    
+    return {"analysis_result": _analysis_result(query, "".join(chunks))}
@@ -1,36 +1,20 @@
 import os
-from agent.llm_factory import get_llm
+from agent.llm_factory import get_llm_for
+from agent.model_router import model_router
 from agent.schemas.state import AgentState
-from agent.schemas.models import FinancialInsight
+from agent.schemas.models import FinancialInsight, FinancialNarrative
+from agent.response_cache import response_cache
+from agent.prompt_budget import RESPONSE_BUDGET, PromptBudget, render_metrics_table
+from agent.deadline import remaining
 
-def generate_response(state: AgentState):
-    """
-    Node to format the final response into the strict output format.
-    """
-    analysis = state.get('analysis_result', {})
-    metrics = state.get('normalized_metrics', [])
-    
-    if not analysis:
-        return {"final_response": "I could not generate an analysis."}
-    
-    # Logic to bypass strict structure for general chat and options trading
-    query = state.get('parsed_query')
-    if query and query.intent in ["general_chat", "options_trading"]:
-        # Return raw text for these intents
-        return {"final_response": analysis.get('text', '')}
+# With less time than this left, the report is rendered from the analysis text instead of formatted by the LLM
+MIN_FORMAT_TIME = float(os.getenv("MIN_FORMAT_TIME", "8"))
 
-    llm = get_llm(temperature=0)
-    
-    # If it's a general chat, we might want a looser structure or just use the same structure creatively.
-    # We will instruct it to use 'final_insight' for the main answer and leave others empty.
-    
-    structured_llm = llm.with_structured_output(FinancialInsight)
-    
-    prompt = f"""
+REPORT_PROMPT = """
     Based on the following analysis and metrics, generate a final structured report.
     
     Analysis Ref:
-    {analysis.get('text', '')}
+    {analysis}
     
     Metrics Ref:
     {metrics}
@@ -38,12 +22,29 @@ def generate_response(state: AgentState):
     Ensure the output strictly adheres to the FinancialInsight schema.
     For 'key_metrics', populate correctly from the provided metrics data.
     """
-    
-    try:
-        insight: FinancialInsight = structured_llm.invoke(prompt)
-        
-        # Convert Pydantic to Markdown string for final display
-        md_output = f"""
+
+def _build_prompt(analysis, metrics):
+    """
+    Fits the analysis and a metrics table into RESPONSE_BUDGET. Exact values are kept
+    in the table since the model copies them into key_metrics; the analysis is
+    trimmed from its last paragraph when the budget is tight.
+    """
+    metrics_ref = render_metrics_table(metrics, compact=False)
+    if metrics:
+        metrics_ref += f"\nlast_updated: {metrics[0].last_updated}"
+
+    budget = PromptBudget(RESPONSE_BUDGET, name="response_generation")
+    budget.add("instructions", REPORT_PROMPT.format(analysis="", metrics=""))
+    budget.add("metrics", metrics_ref, priority=1)
+    budget.add("analysis", analysis.get('text', '').split("\n\n"), priority=2)
+    fitted = budget.fit()
+    budget.log()
+
+    return REPORT_PROMPT.format(analysis=fitted["analysis"], metrics=fitted["metrics"])
+
+def _render_markdown(insight: FinancialInsight) -> str:
+    # Convert Pydantic to Markdown string for final display
+    md_output = f"""
 # Financial Report
 
 ## Executive Summary
@@ -51,26 +52,123 @@ def generate_response(state: AgentState):
 
 ## Key Metrics
 """
-        # Create a table for metrics
-        if insight.key_metrics:
-            md_output += "| Ticker | Price | Market Cap | PE | Volume |\n"
-            md_output += "| --- | --- | --- | --- | --- |\n"
-            for m in insight.key_metrics:
-                md_output += f"| {m.ticker} | {m.price} | {m.market_cap} | {m.pe_ratio} | {m.volume} |\n"
+    # Create a table for metrics
+    if insight.key_metrics:
+        md_output += "| Ticker | Price | Market Cap | PE | Volume |\n"
+        md_output += "| --- | --- | --- | --- | --- |\n"
+        for m in insight.key_metrics:
+            md_output += f"| {m.ticker} | {m.price} | {m.market_cap} | {m.pe_ratio} | {m.volume} |\n"
+    
+    if insight.comparative_analysis:
+        md_output += f"\n## Comparative Analysis\n{insight.comparative_analysis}\n"
         
-        if insight.comparative_analysis:
-            md_output += f"\n## Comparative Analysis\n{insight.comparative_analysis}\n"
-            
+    if insight.risk_factors:
         md_output += "\n## Risk Factors\n"
         for risk in insight.risk_factors:
             md_output += f"- {risk}\n"
-            
-        md_output += f"\n## Final Insight\n{insight.final_insight}\n"
-        md_output += f"\n> [!WARNING]\n> {insight.disclaimer}"
         
-        return {"final_response": md_output}
+    if insight.final_insight:
+        md_output += f"\n## Final Insight\n{insight.final_insight}\n"
+    md_output += f"\n> [!WARNING]\n> {insight.disclaimer}"
+    
+    return md_output
+
+DEFAULT_DISCLAIMER = (
+    "This is not investment advice. Market data may be delayed; "
+    "do your own research or consult a SEBI-registered advisor before investing."
+)
+
+def _deterministic_response(state: AgentState):
+    """
+    Renders the report without an LLM call when reasoning already wrote the narrative
+    (REPORT_MODE=single). Key metrics come straight from normalized_metrics. If the
+    structured call failed, or the request is too close to its deadline for the
+    formatting call, the free-text analysis becomes the summary. Returns None when
+    the two-pass formatting call is needed.
+    """
+    analysis = state.get('analysis_result', {})
+    if "narrative" in analysis:
+        narrative = analysis["narrative"]
+    elif remaining(state.get('deadline'), MIN_FORMAT_TIME) < MIN_FORMAT_TIME:
+        print("[WARNING] Request deadline is close, skipping the formatting call.")
+        narrative = None
+    else:
+        return None
+
+    if narrative:
+        narrative = FinancialNarrative(**narrative)
+    else:
+        narrative = FinancialNarrative(
+            executive_summary=analysis.get('text', ''),
+            risk_factors=[],
+            final_insight="",
+            disclaimer=DEFAULT_DISCLAIMER
+        )
+    insight = FinancialInsight(key_metrics=state.get('normalized_metrics') or [], **narrative.model_dump())
+    return {"final_response": _render_markdown(insight)}
+
+def _passthrough_response(state: AgentState):
+    """
+    Returns the early response for states that need no structured report, else None.
+    """
+    analysis = state.get('analysis_result', {})
+    if not analysis:
+        return {"final_response": "I could not generate an analysis."}
+    
+    # Logic to bypass strict structure for general chat and options trading
+    query = state.get('parsed_query')
+    if query and query.intent in ["general_chat", "options_trading"]:
+        # Return raw text for these intents; the answer depends only on the question
+        text = analysis.get('text', '')
+        if not state.get('error'):
+            response_cache.put(query.original_query, query.intent, analysis.get('language', 'english'), text)
+        return {"final_response": text}
+    return None
+
+def generate_response(state: AgentState):
+    """
+    Node to format the final response into the strict output format.
+    """
+    early = _passthrough_response(state) or _deterministic_response(state)
+    if early is not None:
+        return early
+
+    analysis = state.get('analysis_result', {})
+    metrics = state.get('normalized_metrics', [])
+
+    llm, spec = get_llm_for("response_generation", analysis.get("intent"))
+    
+    # If it's a general chat, we might want a looser structure or just use the same structure creatively.
+    # We will instruct it to use 'final_insight' for the main answer and leave others empty.
+    
+    structured_llm = llm.with_structured_output(FinancialInsight)
+    
+    try:
+        with model_router.track("response_generation", spec):
+            insight: FinancialInsight = structured_llm.invoke(_build_prompt(analysis, metrics), deadline=state.get('deadline'))
+        return {"final_response": _render_markdown(insight)}
         
-        return {"final_response": md_output}
+    except Exception as e:
+        return {"final_response": f"Error formatting response: {str(e)}", "error": str(e)}
+
+async def agenerate_response(state: AgentState):
+    """
+    Async variant of generate_response.
+    """
+    early = _passthrough_response(state) or _deterministic_response(state)
+    if early is not None:
+        return early
+
+    analysis = state.get('analysis_result', {})
+    metrics = state.get('normalized_metrics', [])
+
+    llm, spec = get_llm_for("response_generation", analysis.get("intent"))
+    structured_llm = llm.with_structured_output(FinancialInsight)
+    
+    try:
+        with model_router.track("response_generation", spec):
+            insight: FinancialInsight = await structured_llm.ainvoke(_build_prompt(analysis, metrics), deadline=state.get('deadline'))
+        return {"final_response": _render_markdown(insight)}
         
     except Exception as e:
         return {"final_response": f"Error formatting response: {str(e)}", "error": str(e)}
@@ -1,25 +1,84 @@
+import os
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from agent.schemas.state import AgentState
-from agent.tools.vector_store import VectorStoreTool
+from agent.tools.vector_store import VectorStoreTool, memory_available
+from agent.deadline import remaining
+
+# Retrieval is optional context; it gets at most this many seconds of the request budget
+RETRIEVAL_TIMEOUT = float(os.getenv("RETRIEVAL_TIMEOUT", "5"))
+# Below this much time left, retrieval is skipped entirely
+MIN_RETRIEVAL_TIME = 0.5
+
+_retrieval_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="retrieval")
+
+def _budget(state: AgentState):
+    """
+    Seconds retrieval may use, or None when it should be skipped because the
+    request is nearly out of time or Pinecone/Gemini has an open circuit.
+    """
+    budget = remaining(state.get('deadline'), RETRIEVAL_TIMEOUT)
+    if budget < MIN_RETRIEVAL_TIME:
+        print("[WARNING] Skipping retrieval: request deadline is too close.")
+        return None
+    if not memory_available():
+        print("[WARNING] Skipping retrieval: vector memory circuit is open.")
+        return None
+    return budget
+
+def _search(query: str):
+    tool = VectorStoreTool()
+    if tool.index is None:
+        return []
+    # Search using the original query or constructed keywords
+    return [d.page_content for d in tool.similarity_search(query, k=3)]
 
 def retrieve_context(state: AgentState):
     """
     Node to retrieve relevant documents from Pinecone.
+    Bounded by the request deadline; on timeout the analysis proceeds without context.
     """
     query = state.get('parsed_query')
     if not query:
         return {}
 
+    budget = _budget(state)
+    if budget is None:
+        return {"retrieved_docs": []}
+
+    future = _retrieval_executor.submit(contextvars.copy_context().run, _search, query.original_query)
     try:
-        tool = VectorStoreTool()
-        if not tool.index:
-            return {"retrieved_docs": []}
-
-        # Search using the original query or constructed keywords
-        search_query = query.original_query
-        
-        docs = tool.similarity_search(search_query, k=3)
-        return {"retrieved_docs": [d.page_content for d in docs]}
-        
+        return {"retrieved_docs": future.result(timeout=budget)}
+    except FutureTimeoutError:
+        print(f"[WARNING] Retrieval timed out after {budget:.1f}s, continuing without context.")
+        return {"retrieved_docs": []}
+    except Exception as e:
+        print(f"[WARNING] Retrieval failed: {e}")
+        return {"retrieved_docs": []}
+
+async def aretrieve_context(state: AgentState):
+    """
+    Async variant of retrieve_context.
+    """
+    query = state.get('parsed_query')
+    if not query:
+        return {}
+
+    budget = _budget(state)
+    if budget is None:
+        return {"retrieved_docs": []}
+
+    try:
+        # Client construction and search talk to Pinecone, keep them off the event loop.
+        # The thread cannot be interrupted, so shield it: on timeout we stop waiting instead of
+        # waiting for the cancellation to take effect.
+        search = asyncio.ensure_future(asyncio.to_thread(_search, query.original_query))
+        docs = await asyncio.wait_for(asyncio.shield(search), timeout=budget)
+        return {"retrieved_docs": docs}
+    except asyncio.TimeoutError:
+        print(f"[WARNING] Retrieval timed out after {budget:.1f}s, continuing without context.")
+        return {"retrieved_docs": []}
     except Exception as e:
         print(f"[WARNING] Retrieval failed: {e}")
         return {"retrieved_docs": []}
@@ -0,0 +1,177 @@
+import os
+import re
+import logging
+from typing import Dict, List, NamedTuple, Optional, Sequence, Union
+from agent.schemas.models import MarketMetrics
+
+logger = logging.getLogger("financial_agent")
+
+# Token budgets per node prompt (system + user messages)
+REASONING_BUDGET = int(os.getenv("REASONING_PROMPT_BUDGET", "4000"))
+RESPONSE_BUDGET = int(os.getenv("RESPONSE_PROMPT_BUDGET", "3000"))
+# Any single retrieved document is cut to this many tokens before budgeting
+CONTEXT_DOC_TOKENS = int(os.getenv("CONTEXT_DOC_TOKENS", "300"))
+
+# Letter runs, digit runs and single symbols, roughly how BPE tokenizers split text
+_PIECE_PATTERN = re.compile(r"[^\W\d_]+|\d+|[^\w\s]|_")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Local token estimate, no tokenizer download. Latin words count one token per
+    six letters (started), digits one per three, symbols one each, and non-Latin
+    scripts such as Devanagari one per character. Close enough to BPE counts for
+    budgeting; it is not meant to match any one model's tokenizer exactly.
+    """
+    tokens = 0
+    for piece in _PIECE_PATTERN.findall(text):
+        if piece[0].isdigit():
+            tokens += (len(piece) + 2) // 3
+        elif piece.isascii() and piece.isalpha():
+            tokens += (len(piece) + 5) // 6
+        elif piece.isalpha():
+            tokens += len(piece)
+        else:
+            tokens += 1
+    return tokens
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cuts `text` to about `max_tokens`, at a line or word boundary where possible."""
+    if max_tokens <= 0:
+        return ""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    # Binary search on characters since the estimate is monotonic in prefix length
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid]) + 1 <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    cut = text[:low]
+    boundary = max(cut.rfind("\n"), cut.rfind(" "))
+    if boundary > len(cut) // 2:
+        cut = cut[:boundary]
+    return cut.rstrip() + "…"
+
+
+def _format_number(value: Optional[float], compact: bool, decimals: int = 2) -> str:
+    """Large magnitudes such as market cap and volume: 12.70T, 2.1M."""
+    if value is None:
+        return "N/A"
+    if not compact:
+        return f"{value}"
+    for threshold, suffix in ((1e12, "T"), (1e9, "B"), (1e6, "M"), (1e3, "K")):
+        if abs(value) >= threshold:
+            return f"{value / threshold:.{decimals}f}{suffix}"
+    return f"{value:.{decimals}f}"
+
+
+def _format_price(value: Optional[float], compact: bool) -> str:
+    if value is None:
+        return "N/A"
+    return f"{value:.2f}" if compact else f"{value}"
+
+
+def _format_ratio(value: Optional[float], compact: bool) -> str:
+    if value is None:
+        return "N/A"
+    return f"{value * 100:.1f}%" if compact else f"{value}"
+
+
+def render_metrics_table(metrics: Sequence[MarketMetrics], compact: bool = True) -> str:
+    """
+    Markdown table of metrics, one row per ticker. `compact` rounds prices,
+    abbreviates large numbers (1.23T) and shows margins as percentages for prompts
+    the model only reads; pass False where the model has to copy exact values back
+    into a schema.
+    """
+    if not metrics:
+        return ""
+    lines = [
+        "| Ticker | Price | Currency | Market Cap | PE | EPS | Volume | Profit Margin | Operating Margin |",
+        "| --- | --- | --- | --- | --- | --- | --- | --- | --- |",
+    ]
+    for m in metrics:
+        lines.append(
+            f"| {m.ticker} | {_format_price(m.price, compact)} | {m.currency} "
+            f"| {_format_number(m.market_cap, compact)} | {_format_price(m.pe_ratio, compact)} "
+            f"| {_format_price(m.eps, compact)} | {_format_number(m.volume, compact, 1)} "
+            f"| {_format_ratio(m.profit_margin, compact)} | {_format_ratio(m.operating_margin, compact)} |"
+        )
+    return "\n".join(lines)
+
+
+class _Section(NamedTuple):
+    name: str
+    parts: List[str]
+    priority: int
+    separator: str
+
+
+class PromptBudget:
+    """
+    Assembles a prompt from named sections under a token budget.
+
+    Priority 0 sections are always kept whole. When the total is over budget the
+    section with the largest priority number is trimmed first: its parts are
+    dropped from the end (least relevant retrieved doc first), then the last part
+    is truncated, and only then does the next section get touched.
+    `fit()` returns the final text per section; `report()` describes what was sent.
+    """
+
+    def __init__(self, max_tokens: int, name: str = "prompt"):
+        self.max_tokens = max_tokens
+        self.name = name
+        self._sections: List[_Section] = []
+        self._fitted: Dict[str, str] = {}
+        self._tokens: Dict[str, int] = {}
+        self._trimmed: List[str] = []
+
+    def add(self, name: str, parts: Union[str, Sequence[str]], priority: int = 0, separator: str = "\n\n"):
+        if isinstance(parts, str):
+            parts = [parts] if parts else []
+        self._sections.append(_Section(name, [p for p in parts if p], priority, separator))
+        return self
+
+    @staticmethod
+    def _render(section: _Section) -> str:
+        return section.separator.join(section.parts)
+
+    def fit(self) -> Dict[str, str]:
+        sections = [s._replace(parts=list(s.parts)) for s in self._sections]
+        tokens = {s.name: estimate_tokens(self._render(s)) for s in sections}
+        self._trimmed = []
+
+        for section in sorted((s for s in sections if s.priority > 0), key=lambda s: -s.priority):
+            over = sum(tokens.values()) - self.max_tokens
+            if over <= 0:
+                break
+            self._trimmed.append(section.name)
+            while section.parts and over > 0:
+                last = section.parts[-1]
+                last_tokens = estimate_tokens(last)
+                if len(section.parts) > 1 or last_tokens <= over:
+                    section.parts.pop()
+                else:
+                    section.parts[-1] = truncate_to_tokens(last, last_tokens - over)
+                tokens[section.name] = estimate_tokens(self._render(section))
+                over = sum(tokens.values()) - self.max_tokens
+
+        self._fitted = {s.name: self._render(s) for s in sections}
+        self._tokens = tokens
+        return self._fitted
+
+    @property
+    def tokens(self) -> int:
+        return sum(self._tokens.values())
+
+    def report(self) -> str:
+        sizes = ", ".join(f"{name} {count}" for name, count in self._tokens.items())
+        trimmed = f"; trimmed {', '.join(self._trimmed)}" if self._trimmed else ""
+        return f"{self.name}: ~{self.tokens}/{self.max_tokens} tokens ({sizes}{trimmed})"
+
+    def log(self):
+        logger.info(f"[prompt] {self.report()}")
@@ -0,0 +1,144 @@
+import os
+import re
+from typing import List, NamedTuple, Optional
+from agent.schemas.models import FinancialQuery
+from agent.tools.symbol_index import Symbol, get_symbol_index
+
+# Minimum confidence for parse_input to trust the rules and skip the LLM call
+FAST_PATH_CONFIDENCE = float(os.getenv("FAST_PATH_CONFIDENCE", "0.8"))
+
+GREETING_WORDS = {
+    "hi", "hii", "hello", "hey", "hola", "namaste", "namaskar", "yo", "gm",
+    "good", "morning", "afternoon", "evening", "night", "thanks", "thank", "you",
+    "ok", "okay", "bye", "there", "ji", "sir", "bhai",
+}
+
+# Strong LTP Calculator vocabulary: on its own enough to call the intent
+LTP_STRONG_TERMS = {
+    "wtb", "wtt", "eor", "eos", "coa", "ltp", "oi", "option chain", "gamma blast",
+    "ltp calculator", "open interest", "imaginary line",
+}
+# Weaker options vocabulary: suggests options_trading but stays below the threshold alone
+LTP_WEAK_TERMS = {
+    "strike", "strike price", "premium", "theta", "delta", "gamma", "iv", "expiry",
+    "scenario", "support", "resistance", "put", "ce", "pe side", "call side",
+    "bull run", "blood bath",
+}
+
+COMPARE_TERMS = {"compare", "comparison", "vs", "versus", "better", "difference", "ya fir", "or"}
+MARKET_TERMS = {
+    "price", "share", "shares", "stock", "stocks", "pe", "p/e", "market cap", "mcap",
+    "volume", "eps", "margin", "margins", "fundamentals", "valuation", "kitna", "bhav",
+    "rate", "quote", "performance", "analysis", "analyse", "analyze",
+}
+
+HINGLISH_MARKERS = {
+    "kya", "hai", "hain", "hota", "hoti", "hote", "kaise", "kaisa", "kitna", "kitne",
+    "batao", "bataiye", "samjhao", "samjhaiye", "mein", "mai", "ka", "ki", "ke", "ko",
+    "aur", "nahi", "nahin", "kyu", "kyun", "kab", "kaun", "konsa", "kaunsa", "chahiye",
+    "karo", "karna", "raha", "rahi", "wala", "wali", "acha", "accha", "bhai", "yaar",
+    "matlab", "abhi", "aaj", "kal", "sakte", "sakta",
+}
+DEVANAGARI = re.compile(r"[ऀ-ॿ]")
+
+TIMEFRAME_PATTERNS = [
+    (re.compile(r"\bytd\b|\byear to date\b"), "ytd"),
+    (re.compile(r"\b(\d+)\s*(?:d|day|days|din)\b"), "{}d"),
+    (re.compile(r"\b(\d+)\s*(?:mo|month|months|mahine|mahina)\b"), "{}mo"),
+    (re.compile(r"\b(\d+)\s*(?:y|yr|yrs|year|years|saal)\b"), "{}y"),
+    (re.compile(r"\b(?:this|last|pichle)\s+(?:month|mahine)\b"), "1mo"),
+    (re.compile(r"\b(?:this|last|pichle)\s+(?:week|hafte)\b"), "5d"),
+    (re.compile(r"\btoday\b|\baaj\b"), "1d"),
+]
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9&/]+")
+
+
+class Classification(NamedTuple):
+    """
+    Result of the rule-based parser. `query` is None when no rule matched.
+    """
+    query: Optional[FinancialQuery]
+    confidence: float
+
+
+def _match_terms(text: str, terms) -> List[str]:
+    return [t for t in terms if re.search(rf"(?<![a-z0-9]){re.escape(t)}(?![a-z0-9])", text)]
+
+
+def detect_language(text: str) -> str:
+    """'hindi' if the text is Devanagari or carries Hinglish markers, else 'english'."""
+    if DEVANAGARI.search(text):
+        return "hindi"
+    tokens = TOKEN_PATTERN.findall(text.lower())
+    return "hindi" if any(t in HINGLISH_MARKERS for t in tokens) else "english"
+
+
+def detect_timeframe(text: str) -> str:
+    lowered = text.lower()
+    for pattern, template in TIMEFRAME_PATTERNS:
+        match = pattern.search(lowered)
+        if match:
+            return template.format(*match.groups())
+    return "1y"
+
+
+def classify_query(text: str) -> Classification:
+    """
+    Deterministic pre-classifier for parse_input.
+    Returns a FinancialQuery and a confidence in [0, 1]; callers fall back to the LLM
+    when the confidence is below FAST_PATH_CONFIDENCE.
+    """
+    lowered = text.lower().strip()
+    tokens = TOKEN_PATTERN.findall(lowered)
+    if not tokens:
+        return Classification(None, 0.0)
+
+    language = detect_language(text)
+    timeframe = detect_timeframe(text)
+    symbols: List[Symbol] = get_symbol_index().extract(text)
+
+    def build(intent: str, found: List[str], confidence: float) -> Classification:
+        query = FinancialQuery(
+            tickers=found,
+            intent=intent,
+            timeframe=timeframe,
+            original_query=text,
+            language=language,
+        )
+        return Classification(query, confidence)
+
+    # Pure greetings / pleasantries
+    if all(t in GREETING_WORDS for t in tokens):
+        return build("general_chat", [], 0.95)
+
+    strong = _match_terms(lowered, LTP_STRONG_TERMS)
+    weak = _match_terms(lowered, LTP_WEAK_TERMS)
+    companies = [s.symbol for s in symbols if s.kind == "equity"]
+    indices = [s.symbol for s in symbols if s.kind == "index"]
+
+    # LTP Calculator / option chain questions
+    if strong and not companies:
+        return build("options_trading", indices, 0.9)
+    if weak and not companies:
+        return build("options_trading", indices, 0.85 if indices else 0.6)
+
+    compare = _match_terms(lowered, COMPARE_TERMS)
+    market = _match_terms(lowered, MARKET_TERMS)
+
+    if len(companies) >= 2:
+        return build("comparative_analysis", companies, 0.9 if compare else 0.75)
+
+    if len(companies) == 1:
+        if compare:
+            # "is TCS better than ..." with an unknown second company
+            return build("comparative_analysis", companies, 0.5)
+        if market or len(tokens) <= 2:
+            return build("market_data", companies, 0.85)
+        return build("market_data", companies, 0.6)
+
+    # Nothing financial recognised: probably chit-chat, but not sure enough to skip the LLM
+    if not (strong or weak or compare or market or indices):
+        return build("general_chat", [], 0.5)
+
+    return Classification(None, 0.0)
@@ -0,0 +1,208 @@
+import os
+import re
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, List, NamedTuple, Optional, Tuple
+import numpy as np
+from agent.tools.local_embeddings import HashingEmbeddings, get_hashing_embeddings
+
+logger = logging.getLogger("financial_agent")
+
+# Intents whose answer depends only on the question text and language
+CACHEABLE_INTENTS = ("options_trading", "general_chat")
+TTL = float(os.getenv("RESPONSE_CACHE_TTL", str(6 * 3600)))
+MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))
+# Cosine similarity needed for a semantic (non-exact) hit; same_terms is the stricter check
+SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.6"))
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+# Filler that does not change what is being asked
+FILLER_WORDS = {
+    "a", "an", "the", "is", "are", "was", "what", "whats", "how", "does", "do", "can", "you",
+    "me", "please", "explain", "tell", "about", "of", "in", "to", "and", "i", "it", "this", "that",
+    "kya", "hai", "hain", "hota", "hoti", "hote", "ka", "ki", "ke", "ko", "se", "mein", "me", "batao",
+    "bataiye", "samjhao", "samjhaiye", "mujhe", "yeh", "ye", "kaise", "kaisa", "hum", "aap", "karte",
+}
+
+
+def normalize(text: str) -> str:
+    """Lowercase, punctuation-free, single-spaced form used for exact hits."""
+    return " ".join(TOKEN_PATTERN.findall(text.lower()))
+
+
+def content_terms(text: str) -> List[str]:
+    return sorted(set(normalize(text).split()) - FILLER_WORDS)
+
+
+def _close(a: str, b: str) -> bool:
+    """Same term, allowing a one-letter slip only in longer words ("relaince")."""
+    if a == b:
+        return True
+    if min(len(a), len(b)) < 6 or abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) == len(b):
+        diffs = [i for i in range(len(a)) if a[i] != b[i]]
+        return len(diffs) == 1 or (len(diffs) == 2 and diffs[1] == diffs[0] + 1 and a[diffs[0]] == b[diffs[1]] and a[diffs[1]] == b[diffs[0]])
+    short, long = (a, b) if len(a) < len(b) else (b, a)
+    return any(long[:i] + long[i + 1:] == short for i in range(len(long)))
+
+
+def same_terms(a: List[str], b: List[str]) -> bool:
+    """
+    Guard for semantic hits. Character n-gram similarity alone would happily
+    match "wtb kya hota hai" to "wtt kya hota hai", which have opposite answers,
+    so both queries must ask about the same content terms.
+    """
+    if len(a) != len(b):
+        return False
+    return all(_close(x, y) for x, y in zip(a, b))
+
+
+class CachedResponse(NamedTuple):
+    text: str
+    intent: str
+    language: str
+    kind: str  # "exact" or "semantic"
+
+
+class _Entry:
+    __slots__ = ("query", "text", "intent", "language", "terms", "vector", "created")
+
+    def __init__(self, query, text, intent, language, terms, vector, created):
+        self.query = query
+        self.text = text
+        self.intent = intent
+        self.language = language
+        self.terms = terms
+        self.vector = vector
+        self.created = created
+
+
+class ResponseCache:
+    """
+    Two-tier cache of final answers for CACHEABLE_INTENTS, keyed by intent and
+    language. The first tier is an exact match on the normalised question. The
+    second embeds the question with the offline HashingEmbeddings and takes the
+    nearest cached question above `similarity`, provided both ask about the same
+    content terms (see same_terms). Entries expire after `ttl` and the least
+    recently used are evicted past `max_entries`.
+    """
+
+    def __init__(
+        self,
+        ttl: float = TTL,
+        max_entries: int = MAX_ENTRIES,
+        similarity: float = SIMILARITY,
+        embeddings: Optional[HashingEmbeddings] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self.embeddings = embeddings or get_hashing_embeddings()
+        self.clock = clock
+        self.stats = {"exact": 0, "semantic": 0, "misses": 0, "evictions": 0}
+        self._entries: "OrderedDict[Tuple[str, str, str], _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Stacked entry vectors for the semantic tier, rebuilt after writes
+        self._keys: List[Tuple[str, str, str]] = []
+        self._matrix: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, query: str, intent: str, language: str) -> Optional[CachedResponse]:
+        if intent not in CACHEABLE_INTENTS:
+            return None
+        key = (intent, language, normalize(query))
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry.created < self.ttl:
+                self._entries.move_to_end(key)
+                self.stats["exact"] += 1
+                return CachedResponse(entry.text, intent, language, "exact")
+
+        terms = content_terms(query)
+        vector = self._embed(terms)
+        with self._lock:
+            if self._matrix is None:
+                self._keys = list(self._entries)
+                self._matrix = np.stack([self._entries[k].vector for k in self._keys]) if self._keys else np.empty((0, 0))
+            if len(self._keys) and vector is not None:
+                scores = self._matrix @ vector
+                above = np.flatnonzero(scores >= self.similarity)
+                for i in above[np.argsort(-scores[above])]:
+                    found_key = self._keys[i]
+                    entry = self._entries.get(found_key)
+                    if (
+                        entry is None or found_key[0] != intent or found_key[1] != language
+                        or now - entry.created >= self.ttl
+                    ):
+                        continue
+                    if same_terms(terms, entry.terms):
+                        self._entries.move_to_end(found_key)
+                        self.stats["semantic"] += 1
+                        return CachedResponse(entry.text, intent, language, "semantic")
+            self.stats["misses"] += 1
+            return None
+
+    def _embed(self, terms: List[str]) -> Optional[np.ndarray]:
+        if not terms:
+            return None
+        return np.asarray(self.embeddings.embed_query(" ".join(terms)), dtype=np.float32)
+
+    def put(self, query: str, intent: str, language: str, text: str):
+        if intent not in CACHEABLE_INTENTS or not text:
+            return
+        normalized = normalize(query)
+        terms = content_terms(query)
+        vector = self._embed(terms)
+        entry = _Entry(
+            query=normalized,
+            text=text,
+            intent=intent,
+            language=language,
+            terms=terms,
+            vector=vector if vector is not None else np.zeros(self.embeddings.dim, dtype=np.float32),
+            created=self.clock(),
+        )
+        with self._lock:
+            key = (intent, language, normalized)
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._evict()
+            self._matrix = None
+
+    def _evict(self):
+        now = self.clock()
+        expired = [k for k, e in self._entries.items() if now - e.created >= self.ttl]
+        for k in expired:
+            del self._entries[k]
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def invalidate(self, query: Optional[str] = None, intent: Optional[str] = None) -> int:
+        """
+        Admin hook, e.g. after sys_prmpt.txt changes. Drops entries matching the
+        normalised `query` and/or `intent`, or everything when neither is given.
+        Returns how many entries were removed.
+        """
+        normalized = normalize(query) if query else None
+        with self._lock:
+            doomed = [
+                k for k in self._entries
+                if (intent is None or k[0] == intent) and (normalized is None or k[2] == normalized)
+            ]
+            for k in doomed:
+                del self._entries[k]
+            self._matrix = None
+        logger.info(f"Response cache invalidated {len(doomed)} entries.")
+        return len(doomed)
+
+
+# Shared by every request in the process
+response_cache = ResponseCache()
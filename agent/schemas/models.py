@@ -38,3 +38,14 @@ class FinancialInsight(BaseModel):
     risk_factors: List[str] = Field(description="List of potential risks identified.")
     final_insight: str = Field(description="Concluding insight or recommendation context.")
     disclaimer: str = Field(description="Standard financial disclaimer.")
+
+class FinancialNarrative(BaseModel):
+    """
+    The written sections of a FinancialInsight. Produced by the reasoning call;
+    key_metrics is filled from normalized_metrics rather than by the model.
+    """
+    executive_summary: str = Field(description="Concise summary of the findings.")
+    comparative_analysis: Optional[str] = Field(default=None, description="Comparison text if applicable, else null.")
+    risk_factors: List[str] = Field(description="List of potential risks identified.")
+    final_insight: str = Field(description="Concluding insight or recommendation context.")
+    disclaimer: str = Field(description="Standard financial disclaimer.")
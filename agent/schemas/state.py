@@ -14,3 +14,4 @@ class AgentState(TypedDict):
     analysis_result: Optional[Dict[str, Any]] # Intermediate reasoning results
     final_response: Optional[str] # Final formatted string
     error: Optional[str]
+    deadline: Optional[float] # time.monotonic() timestamp the request must finish by
@@ -0,0 +1,297 @@
+import re
+import json
+from typing import Any, Dict, List, Optional, Type
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from langchain_core.exceptions import OutputParserException
+
+_LITERALS = {"true": "true", "false": "false", "null": "null", "True": "true", "False": "false", "None": "null"}
+_WORD = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_NUMBER = re.compile(r"-?\d+(\.\d+)?([eE][+-]?\d+)?")
+
+
+def _find_start(text: str) -> int:
+    """Index of the first `{` or `[`, skipping prose and ``` fences before it."""
+    positions = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    return min(positions) if positions else -1
+
+
+def repair_json(text: str) -> str:
+    """
+    Turns what LLMs produce when asked for JSON into valid JSON text.
+    Handles prose or code fences around the value, single-quoted strings, Python
+    literals (True/None), unquoted keys, trailing commas, raw newlines in strings,
+    and output that stops mid-way: unterminated strings are closed, a dangling key
+    or partial literal is dropped and open brackets are closed. A mismatched closer
+    ends the value there, as if the output had stopped.
+    Raises ValueError when there is no JSON value to recover.
+    """
+    start = _find_start(text)
+    if start < 0:
+        raise ValueError("No JSON object found")
+
+    out: List[str] = []
+    stack: List[str] = []           # expected closers
+    member_start: List[int] = []    # per container: len(out) where the current member began
+    has_value: List[bool] = []      # per container: whether the current member has a value yet
+    quote: Optional[str] = None
+    escape = False
+    i, n = start, len(text)
+
+    def open_member():
+        member_start[-1] = len(out)
+        has_value[-1] = False
+
+    while i < n:
+        c = text[i]
+        if quote:
+            if escape:
+                if quote == "'" and c == "'":
+                    out[-1] = "'"   # \' is not a JSON escape; the apostrophe needs none
+                else:
+                    out.append(c)
+                escape = False
+            elif c == "\\":
+                out.append(c)
+                escape = True
+            elif c == quote:
+                out.append('"')
+                quote = None
+            elif c == '"':
+                out.append('\\"')
+            elif c == "\n":
+                out.append("\\n")
+            elif c == "\t":
+                out.append("\\t")
+            else:
+                out.append(c)
+            i += 1
+            continue
+
+        if c in "\"'":
+            if stack and (stack[-1] == "]" or _tail_is_colon(out)):
+                has_value[-1] = True
+            quote = c
+            out.append('"')
+        elif c in "{[":
+            if stack:
+                has_value[-1] = True
+            stack.append("}" if c == "{" else "]")
+            out.append(c)
+            member_start.append(len(out))
+            has_value.append(False)
+        elif c in "}]":
+            if not stack:
+                break
+            if c != stack[-1]:
+                # The model lost track of its nesting; what follows is prose, not values
+                break
+            _strip_trailing(out, ",")
+            out.append(stack.pop())
+            member_start.pop()
+            has_value.pop()
+            if not stack:
+                break  # anything after the top-level value is prose
+        elif c == ",":
+            if stack:
+                _strip_trailing(out, ",")
+                out.append(",")
+                open_member()
+        elif c == ":":
+            out.append(":")
+        elif c.isspace():
+            out.append(c)
+        elif c == "-" or c.isdigit():
+            # A number cut off mid-way ("12." or "-") keeps only its valid prefix
+            match = _NUMBER.match(text, i)
+            if match:
+                out.append(match.group(0))
+                if stack:
+                    has_value[-1] = True
+                i = match.end()
+            else:
+                i += 1
+            continue
+        elif c.isalpha() or c == "_":
+            match = _WORD.match(text, i)
+            word = match.group(0)
+            rest = text[match.end():].lstrip()
+            if rest.startswith(":"):
+                out.append(json.dumps(word))          # unquoted key
+            elif word in _LITERALS:
+                out.append(_LITERALS[word])
+                if stack:
+                    has_value[-1] = True
+            elif match.end() == n and any(lit.startswith(word) for lit in _LITERALS):
+                pass                                   # literal cut off mid-word
+            else:
+                out.append(json.dumps(word))          # bare word value
+                if stack:
+                    has_value[-1] = True
+            i = match.end()
+            continue
+        # Anything else (comments, stray symbols) is dropped
+        i += 1
+
+    if quote:
+        if escape:
+            out.pop()
+        out.append('"')
+    while stack:
+        # Drop a member that never got its value ("key": or a lone "key")
+        if stack[-1] == "}" and not has_value[-1]:
+            del out[member_start[-1]:]
+        _strip_trailing(out, ",:")
+        out.append(stack.pop())
+        member_start.pop()
+        has_value.pop()
+    return "".join(out)
+
+
+def _tail_is_colon(out: List[str]) -> bool:
+    for piece in reversed(out):
+        if piece.isspace():
+            continue
+        return piece == ":"
+    return False
+
+
+def _strip_trailing(out: List[str], chars: str):
+    while out and (out[-1].isspace() or out[-1] in chars):
+        out.pop()
+
+
+class StreamingJSONParser:
+    """
+    Incremental, tolerant parser for a JSON object arriving as LLM tokens.
+
+    `feed` tracks bracket depth across chunks. Each time a top-level member
+    completes (its `,` or the closing `}` arrives) the prefix is repaired and
+    parsed, and the new field is validated against `schema`; fields that fail
+    validation are reported in `errors` and treated as missing. `done` turns true
+    when the object closes or every schema field has arrived, so callers can stop
+    reading the stream and skip trailing prose. `result` repairs whatever has
+    arrived and fails only if required fields are missing or invalid.
+    `defaults` are fields the caller fills in itself; the model's values for them
+    are ignored.
+    """
+
+    def __init__(self, schema: Optional[Type[BaseModel]] = None, defaults: Optional[Dict[str, Any]] = None):
+        self.schema = schema
+        self.buffer = ""
+        self.fields: Dict[str, Any] = dict(defaults or {})
+        self.errors: Dict[str, str] = {}
+        self._start = -1
+        self._pos = 0
+        self._depth = 0
+        self._quote: Optional[str] = None
+        self._escape = False
+        self._closed = False
+        self._adapters: Dict[str, TypeAdapter] = {}
+        if schema is not None:
+            for name, field in schema.model_fields.items():
+                self._adapters[name] = TypeAdapter(field.annotation)
+
+    @property
+    def required(self) -> List[str]:
+        if self.schema is None:
+            return []
+        return [name for name, field in self.schema.model_fields.items() if field.is_required()]
+
+    @property
+    def missing_required(self) -> List[str]:
+        return [name for name in self.required if name not in self.fields]
+
+    @property
+    def done(self) -> bool:
+        if self._closed:
+            return True
+        return self.schema is not None and all(name in self.fields for name in self.schema.model_fields)
+
+    def feed(self, chunk: str) -> List[str]:
+        """Adds streamed text; returns the names of fields completed by it."""
+        if not chunk or self._closed:
+            return []
+        self.buffer += chunk
+        if self._start < 0:
+            self._start = self.buffer.find("{")
+            if self._start < 0:
+                return []
+            self._pos = self._start
+
+        completed: List[str] = []
+        text = self.buffer
+        while self._pos < len(text):
+            c = text[self._pos]
+            if self._quote:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == self._quote:
+                    self._quote = None
+            elif c in "\"'":
+                self._quote = c
+            elif c in "{[":
+                self._depth += 1
+            elif c in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    completed += self._collect(self._pos + 1)
+                    self._closed = True
+                    self._pos += 1
+                    break
+            elif c == "," and self._depth == 1:
+                completed += self._collect(self._pos)
+            self._pos += 1
+        return completed
+
+    def _collect(self, end: int) -> List[str]:
+        try:
+            data = json.loads(repair_json(self.buffer[self._start:end]))
+        except ValueError:
+            return []
+        if not isinstance(data, dict):
+            return []
+        new = [k for k in data if k not in self.fields and k not in self.errors]
+        for key in new:
+            self._accept(key, data[key])
+        return [k for k in new if k in self.fields]
+
+    def _accept(self, key: str, value: Any):
+        adapter = self._adapters.get(key)
+        if adapter is None:
+            self.fields[key] = value
+            return
+        try:
+            self.fields[key] = adapter.validate_python(value)
+        except ValidationError as e:
+            self.errors[key] = str(e)
+
+    def result(self) -> Dict[str, Any]:
+        """Everything parsed so far, repaired; raises if required fields are missing."""
+        if self._start < 0:
+            raise OutputParserException("No JSON object in model output", llm_output=self.buffer)
+        if not self._closed:
+            try:
+                data = json.loads(repair_json(self.buffer[self._start:]))
+            except ValueError as e:
+                raise OutputParserException(f"Unrecoverable JSON: {e}", llm_output=self.buffer)
+            if isinstance(data, dict):
+                for key, value in data.items():
+                    if key not in self.fields and key not in self.errors:
+                        self._accept(key, value)
+        missing = self.missing_required
+        if missing:
+            details = "; ".join(f"{k}: {self.errors[k]}" for k in missing if k in self.errors)
+            raise OutputParserException(
+                f"Missing or invalid required fields {missing}" + (f" ({details})" if details else ""),
+                llm_output=self.buffer
+            )
+        return dict(self.fields)
+
+    def parse(self) -> BaseModel:
+        """`result` validated into `schema`."""
+        try:
+            return self.schema.model_validate(self.result())
+        except ValidationError as e:
+            raise OutputParserException(str(e), llm_output=self.buffer)
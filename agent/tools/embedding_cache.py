@@ -0,0 +1,224 @@
+import os
+import struct
+import hashlib
+import logging
+import threading
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger("financial_agent")
+
+CACHE_DIR = Path(os.getenv("EMBED_CACHE_DIR", Path(__file__).parent.parent.parent / ".cache" / "embeddings"))
+# Vectors kept decoded in memory
+MAX_MEMORY_ENTRIES = int(os.getenv("EMBED_CACHE_MEMORY_SIZE", "4096"))
+# Records kept on disk per model; the file is compacted to the newest 3/4 when exceeded
+MAX_DISK_ENTRIES = int(os.getenv("EMBED_CACHE_DISK_SIZE", "20000"))
+
+_MAGIC = b"EMB1"
+_HEADER = struct.Struct("<4sI")  # magic, dimension
+_KEY_SIZE = 16                   # md5 digest
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache for one embedding model.
+
+    On disk it is a single append-only file: a header with the vector dimension,
+    then fixed-size records of `md5(kind, text)` followed by the float32 vector.
+    The key -> offset index is rebuilt by scanning keys on startup, and an LRU of
+    decoded vectors sits in front. Records written by other worker processes become
+    visible after a restart. Another worker's compaction can move records under a
+    remembered offset, so every read checks the stored key and treats a mismatch as
+    a miss. If the directory is not writable the cache runs memory-only.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        directory: Path = CACHE_DIR,
+        max_memory_entries: int = MAX_MEMORY_ENTRIES,
+        max_disk_entries: int = MAX_DISK_ENTRIES,
+    ):
+        self.model = model
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        self._memory: "OrderedDict[bytes, List[float]]" = OrderedDict()
+        self._offsets: Dict[bytes, int] = {}
+        self._dim: Optional[int] = None
+        self._lock = threading.Lock()
+        self._path: Optional[Path] = None
+        try:
+            directory = Path(directory)
+            directory.mkdir(parents=True, exist_ok=True)
+            self._path = directory / f"{hashlib.md5(model.encode()).hexdigest()[:12]}.f32"
+            self._load()
+        except OSError as e:
+            logger.warning(f"Embedding cache disk disabled for {model}: {e}")
+            self._path = None
+
+    def __len__(self) -> int:
+        return max(len(self._offsets), len(self._memory))
+
+    @staticmethod
+    def key(kind: str, text: str) -> bytes:
+        return hashlib.md5(f"{kind}\0{text}".encode()).digest()
+
+    @property
+    def _record_size(self) -> int:
+        return _KEY_SIZE + 4 * self._dim
+
+    def _load(self):
+        if not self._path.exists():
+            return
+        with open(self._path, "rb") as f:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                return
+            magic, dim = _HEADER.unpack(header)
+            if magic != _MAGIC:
+                logger.warning(f"Ignoring unrecognised embedding cache file {self._path}")
+                return
+            self._dim = dim
+            # A truncated tail from an interrupted write is ignored
+            count = (self._path.stat().st_size - _HEADER.size) // self._record_size
+            for i in range(count):
+                offset = _HEADER.size + i * self._record_size
+                f.seek(offset)
+                self._offsets[f.read(_KEY_SIZE)] = offset
+        logger.info(f"Loaded {len(self._offsets)} cached embeddings for {self.model}.")
+
+    def get(self, kind: str, text: str) -> Optional[List[float]]:
+        key = self.key(kind, text)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return vector
+            offset = self._offsets.get(key)
+            if offset is None or self._path is None:
+                self.stats["misses"] += 1
+                return None
+            try:
+                with open(self._path, "rb") as f:
+                    f.seek(offset)
+                    record = f.read(self._record_size)
+            except OSError as e:
+                logger.warning(f"Embedding cache read failed: {e}")
+                self.stats["misses"] += 1
+                return None
+            if record[:_KEY_SIZE] != key or len(record) != self._record_size:
+                # The file was compacted or rewritten by another process since we indexed it
+                del self._offsets[key]
+                self.stats["misses"] += 1
+                return None
+            values = array("f")
+            values.frombytes(record[_KEY_SIZE:])
+            vector = values.tolist()
+            self._remember(key, vector)
+            self.stats["disk_hits"] += 1
+            return vector
+
+    def put(self, kind: str, text: str, vector: List[float]):
+        key = self.key(kind, text)
+        with self._lock:
+            self._remember(key, list(vector))
+            if self._path is None or key in self._offsets:
+                return
+            if self._dim is None:
+                self._dim = len(vector)
+            elif len(vector) != self._dim:
+                return
+            try:
+                self._append(key, vector)
+            except OSError as e:
+                logger.warning(f"Embedding cache write failed, continuing memory-only: {e}")
+                self._path = None
+
+    def _remember(self, key: bytes, vector: List[float]):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _append(self, key: bytes, vector: List[float]):
+        if len(self._offsets) >= self.max_disk_entries:
+            self._compact(keep=self.max_disk_entries * 3 // 4)
+        new_file = not self._path.exists() or self._path.stat().st_size == 0
+        with open(self._path, "ab") as f:
+            if new_file:
+                f.write(_HEADER.pack(_MAGIC, self._dim))
+            offset = f.tell()
+            f.write(key + array("f", vector).tobytes())
+        self._offsets[key] = offset
+
+    def _compact(self, keep: int):
+        """Rewrites the file with only the `keep` newest records."""
+        newest = sorted(self._offsets.items(), key=lambda item: item[1])[-keep:]
+        # Per-process temp file, so two workers compacting at once do not interleave writes
+        tmp_path = self._path.with_suffix(f".{os.getpid()}.tmp")
+        offsets = {}
+        with open(self._path, "rb") as src, open(tmp_path, "wb") as dst:
+            dst.write(_HEADER.pack(_MAGIC, self._dim))
+            for key, offset in newest:
+                src.seek(offset)
+                record = src.read(self._record_size)
+                # Skip records another process has moved since they were indexed
+                if record[:_KEY_SIZE] != key or len(record) != self._record_size:
+                    continue
+                offsets[key] = dst.tell()
+                dst.write(record)
+        os.replace(tmp_path, self._path)
+        self._offsets = offsets
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an Embeddings model with an EmbeddingCache. Only cache misses reach the
+    underlying model, and misses from one embed_documents call go out as one batch.
+    Query and document vectors are cached separately since models like Gemini embed
+    them with different task types.
+    """
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache):
+        self.embeddings = embeddings
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = [self.cache.get("document", t) for t in texts]
+        missing = list(dict.fromkeys(t for t, v in zip(texts, vectors) if v is None))
+        if missing:
+            fresh = dict(zip(missing, self.embeddings.embed_documents(missing)))
+            for text, vector in fresh.items():
+                self.cache.put("document", text, vector)
+            vectors = [v if v is not None else fresh[t] for t, v in zip(texts, vectors)]
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        vector = self.cache.get("query", text)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.cache.put("query", text, vector)
+        return vector
+
+
+_caches: Dict[str, EmbeddingCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(model: str) -> EmbeddingCache:
+    """Process-wide cache per embedding model."""
+    with _caches_lock:
+        if model not in _caches:
+            _caches[model] = EmbeddingCache(model)
+        return _caches[model]
+
+
+def embedding_cache_stats() -> Dict[str, Dict[str, int]]:
+    """Hit/miss counters of every embedding cache created so far, by model."""
+    with _caches_lock:
+        return {model: dict(cache.stats) for model, cache in _caches.items()}
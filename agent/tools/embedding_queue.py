@@ -0,0 +1,151 @@
+import os
+import time
+import atexit
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Optional
+from langchain_core.documents import Document
+from agent.tools.vector_store import VectorStoreTool
+
+logger = logging.getLogger("financial_agent")
+
+# Documents per embed_documents/index.upsert call
+BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+# Seconds the oldest pending document may wait before a partial batch is flushed
+FLUSH_INTERVAL = float(os.getenv("EMBED_FLUSH_INTERVAL", "5"))
+# Pending documents beyond this are dropped; long-term memory is best effort
+MAX_PENDING = int(os.getenv("EMBED_MAX_PENDING", "2048"))
+
+
+class EmbeddingQueue:
+    """
+    Write-behind buffer for long-term memory.
+    Requests hand their documents to `submit` and return immediately; a background
+    thread deduplicates them by content ID across requests and writes them to the
+    vector store in batches once BATCH_SIZE documents are pending or the oldest has
+    waited FLUSH_INTERVAL seconds. `close` drains what is left.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = BATCH_SIZE,
+        flush_interval: float = FLUSH_INTERVAL,
+        max_pending: int = MAX_PENDING,
+        store_factory: Callable[[], VectorStoreTool] = VectorStoreTool,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.store_factory = store_factory
+        self.stats = {"submitted": 0, "deduplicated": 0, "dropped": 0, "written": 0, "failed": 0, "batches": 0}
+        self._pending: "OrderedDict[str, Document]" = OrderedDict()
+        self._oldest: Optional[float] = None
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self._store: Optional[VectorStoreTool] = None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def submit(self, documents: List[Document]) -> int:
+        """
+        Queues documents for embedding. Returns how many were newly queued.
+        """
+        queued = 0
+        with self._cond:
+            if self._closed:
+                return 0
+            for doc in documents:
+                self.stats["submitted"] += 1
+                doc_id = VectorStoreTool.document_id(doc.page_content)
+                if doc_id in self._pending:
+                    self.stats["deduplicated"] += 1
+                    continue
+                if len(self._pending) >= self.max_pending:
+                    self.stats["dropped"] += 1
+                    continue
+                self._pending[doc_id] = doc
+                queued += 1
+            if queued:
+                if self._oldest is None:
+                    self._oldest = time.monotonic()
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="embedding-queue", daemon=True)
+                    self._thread.start()
+                self._cond.notify()
+        return queued
+
+    def flush(self):
+        """
+        Writes everything pending now, in batches, on the calling thread.
+        """
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return
+            self._write(batch)
+
+    def close(self, timeout: float = 30.0):
+        """
+        Stops accepting documents and drains the queue. Safe to call more than once.
+        """
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.flush()
+
+    def _take_batch(self) -> List[Document]:
+        with self._cond:
+            batch = []
+            while self._pending and len(batch) < self.batch_size:
+                batch.append(self._pending.popitem(last=False)[1])
+            self._oldest = time.monotonic() if self._pending else None
+            return batch
+
+    def _ready(self) -> bool:
+        if self._closed or len(self._pending) >= self.batch_size:
+            return True
+        return self._oldest is not None and time.monotonic() - self._oldest >= self.flush_interval
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._ready():
+                    timeout = None
+                    if self._oldest is not None:
+                        timeout = max(0.0, self.flush_interval - (time.monotonic() - self._oldest))
+                    self._cond.wait(timeout)
+                if self._closed and not self._pending:
+                    return
+            batch = self._take_batch()
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch: List[Document]):
+        try:
+            store = self._store or self.store_factory()
+            if store.index is None:
+                # Not kept, so the next batch connects again once the index is back
+                self.stats["failed"] += len(batch)
+                return
+            self._store = store
+            if not store.upsert_documents(batch):
+                self.stats["failed"] += len(batch)
+                return
+            self.stats["written"] += len(batch)
+            self.stats["batches"] += 1
+        except Exception as e:
+            # Long term memory is optional; never let the writer thread die
+            self.stats["failed"] += len(batch)
+            logger.warning(f"Embedding batch of {len(batch)} failed: {e}")
+
+
+# Shared by every request in the process; drained on interpreter exit
+embedding_queue = EmbeddingQueue()
+atexit.register(embedding_queue.close)
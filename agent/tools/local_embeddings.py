@@ -0,0 +1,117 @@
+import os
+import re
+import hashlib
+import threading
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# Output dimension of the hashed feature space
+LOCAL_EMBED_DIM = int(os.getenv("LOCAL_EMBED_DIM", "512"))
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+# Character n-gram sizes taken from each word (with boundary markers)
+CHAR_NGRAMS = (3, 4, 5)
+WORD_WEIGHT = 1.0
+BIGRAM_WEIGHT = 0.7
+CHAR_WEIGHT = 0.35
+
+
+def _bucket(feature: str, dim: int) -> Tuple[int, float]:
+    """
+    Stable hash of a feature into (column, sign). blake2b rather than hash() so
+    vectors persisted by one process match the ones computed by the next.
+    """
+    digest = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+    return digest % dim, 1.0 if (digest >> 63) else -1.0
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Offline embedder: word unigrams, word bigrams and character n-grams are hashed
+    into a fixed `dim`-wide space with signed feature hashing, given sublinear term
+    frequency and L2-normalised. No weights are downloaded and nothing leaves the
+    process; the character n-grams keep tickers, inflections and typos close
+    ("reliance"/"relaince"), which is most of what the short, keyword-heavy queries
+    here need. Vectors are not comparable with Gemini ones, so an index must be
+    built with a single embedder.
+
+    `fit` optionally learns per-column IDF weights from a fixed corpus, turning this
+    into a hashed TF-IDF projection that down-weights filler like "kya hota hai".
+    """
+
+    def __init__(self, dim: int = LOCAL_EMBED_DIM):
+        self.dim = dim
+        self.idf: Optional[np.ndarray] = None
+        self._features = lru_cache(maxsize=65536)(self._word_features)
+
+    @property
+    def model(self) -> str:
+        return f"local-hashing-{self.dim}"
+
+    def _word_features(self, word: str) -> Tuple[Tuple[int, float], ...]:
+        """(column, signed weight) pairs for one word, memoised per word."""
+        features = {}
+        col, sign = _bucket(f"w:{word}", self.dim)
+        features[col] = features.get(col, 0.0) + sign * WORD_WEIGHT
+        marked = f"<{word}>"
+        for n in CHAR_NGRAMS:
+            for i in range(len(marked) - n + 1):
+                col, sign = _bucket(f"c:{marked[i:i + n]}", self.dim)
+                features[col] = features.get(col, 0.0) + sign * CHAR_WEIGHT
+        return tuple(features.items())
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        rows, cols, values = [], [], []
+        for row, text in enumerate(texts):
+            words = TOKEN_PATTERN.findall(text.lower())
+            for word in words:
+                for col, value in self._features(word):
+                    rows.append(row)
+                    cols.append(col)
+                    values.append(value)
+            for first, second in zip(words, words[1:]):
+                col, sign = _bucket(f"b:{first} {second}", self.dim)
+                rows.append(row)
+                cols.append(col)
+                values.append(sign * BIGRAM_WEIGHT)
+
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        if values:
+            np.add.at(matrix, (np.array(rows), np.array(cols)), np.array(values, dtype=np.float32))
+        # Sublinear term frequency so repeated words do not dominate
+        matrix = np.sign(matrix) * np.log1p(np.abs(matrix))
+        if self.idf is not None:
+            matrix *= self.idf
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def fit(self, texts: List[str]) -> "HashingEmbeddings":
+        """Learns smoothed IDF weights per hashed column from `texts`."""
+        self.idf = None
+        counts = np.count_nonzero(self._encode(texts), axis=0)
+        self.idf = (np.log((1 + len(texts)) / (1 + counts)) + 1).astype(np.float32)
+        return self
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._encode(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text])[0].tolist()
+
+
+_shared: Dict[int, HashingEmbeddings] = {}
+_shared_lock = threading.Lock()
+
+
+def get_hashing_embeddings(dim: int = LOCAL_EMBED_DIM) -> HashingEmbeddings:
+    """
+    Process-wide unfitted embedder per dimension, so the per-word feature memo stays
+    warm across requests. Anything that calls `fit` needs its own instance.
+    """
+    with _shared_lock:
+        if dim not in _shared:
+            _shared[dim] = HashingEmbeddings(dim)
+        return _shared[dim]
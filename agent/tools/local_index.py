@@ -0,0 +1,393 @@
+import os
+import json
+import logging
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Protocol, Sequence, Set, Tuple
+import numpy as np
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, so one writer process per directory
+    fcntl = None
+
+logger = logging.getLogger("financial_agent")
+
+INDEX_DIR = Path(os.getenv("VECTOR_INDEX_DIR", Path(__file__).parent.parent.parent / ".cache" / "vector_index"))
+# Below this many vectors queries are exact brute force; above it an IVF index is used
+IVF_THRESHOLD = int(os.getenv("VECTOR_IVF_THRESHOLD", "20000"))
+# Inverted lists probed per IVF query
+IVF_NPROBE = int(os.getenv("VECTOR_IVF_NPROBE", "8"))
+
+# Metadata fields with an inverted index for fast equality / $in filters
+INDEXED_FIELDS = ("ticker", "type", "date")
+
+
+class QueryMatch(NamedTuple):
+    id: str
+    score: float
+    metadata: Dict[str, Any]
+
+
+class QueryResult(NamedTuple):
+    matches: List[QueryMatch]
+
+
+class VectorIndex(Protocol):
+    """
+    What VectorStoreTool needs from a vector backend. A Pinecone `Index` satisfies it
+    as-is; LocalVectorIndex implements it in-process.
+    """
+
+    def upsert(self, vectors: Sequence[Tuple[str, Sequence[float], Dict[str, Any]]]) -> Any: ...
+
+    def query(self, vector: Sequence[float], top_k: int, include_metadata: bool = True, filter: Optional[Dict] = None) -> Any: ...
+
+
+def _matches_condition(value: Any, condition: Any) -> bool:
+    if not isinstance(condition, dict):
+        return value == condition
+    for op, operand in condition.items():
+        if value is None and op not in ("$ne", "$nin"):
+            return False
+        if op == "$eq" and not value == operand:
+            return False
+        if op == "$ne" and not value != operand:
+            return False
+        if op == "$in" and value not in operand:
+            return False
+        if op == "$nin" and value in operand:
+            return False
+        if op == "$gt" and not value > operand:
+            return False
+        if op == "$gte" and not value >= operand:
+            return False
+        if op == "$lt" and not value < operand:
+            return False
+        if op == "$lte" and not value <= operand:
+            return False
+    return True
+
+
+def matches_filter(metadata: Dict[str, Any], filter: Optional[Dict]) -> bool:
+    """Evaluates the Pinecone filter subset used here: field conditions, $and, $or."""
+    if not filter:
+        return True
+    for field, condition in filter.items():
+        if field == "$and":
+            if not all(matches_filter(metadata, f) for f in condition):
+                return False
+        elif field == "$or":
+            if not any(matches_filter(metadata, f) for f in condition):
+                return False
+        elif not _matches_condition(metadata.get(field), condition):
+            return False
+    return True
+
+
+class LocalVectorIndex:
+    """
+    In-process cosine-similarity index with the same upsert/query surface as Pinecone.
+
+    Vectors are L2-normalised into a memory-mapped float32 matrix (`vectors.f32`) and
+    ids/metadata are appended to `metadata.jsonl`; both are replayed on startup.
+    Queries score all rows with one matrix-vector product while the corpus is small.
+    Past IVF_THRESHOLD rows a k-means coarse quantizer is trained and queries only
+    score the IVF_NPROBE closest inverted lists plus rows added since training.
+    Equality and $in filters on INDEXED_FIELDS use inverted indexes; other
+    conditions are checked on the remaining candidates.
+
+    Worker processes on one host may share a directory: writes take an flock on
+    `.lock` and first replay rows other processes appended, and queries replay them
+    when the log has grown. flock does not work across hosts or on network
+    filesystems, and Windows has no lock at all; there, only one process may write
+    to a directory.
+    """
+
+    def __init__(self, directory: Path = INDEX_DIR, ivf_threshold: int = IVF_THRESHOLD, nprobe: int = IVF_NPROBE):
+        self.directory = Path(directory)
+        self.ivf_threshold = ivf_threshold
+        self.nprobe = nprobe
+        self._lock = threading.RLock()
+        self._dim: Optional[int] = None
+        self._count = 0
+        self._matrix: Optional[np.memmap] = None
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._metadata: List[Dict[str, Any]] = []
+        self._log_offset = 0  # bytes of metadata.jsonl applied so far
+        self._postings: Dict[str, Dict[Any, Set[int]]] = {f: defaultdict(set) for f in INDEXED_FIELDS}
+        # IVF state
+        self._centroids: Optional[np.ndarray] = None
+        self._lists: List[np.ndarray] = []
+        self._ivf_rows = 0
+        self._stale: Set[int] = set()  # rows below _ivf_rows updated since training
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._load()
+
+    # No __len__: an empty index must stay truthy for code that tests `if not index`
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @property
+    def _vectors_path(self) -> Path:
+        return self.directory / "vectors.f32"
+
+    @property
+    def _metadata_path(self) -> Path:
+        return self.directory / "metadata.jsonl"
+
+    def _load(self):
+        with self._file_lock():
+            self._replay()
+        if not self._count:
+            return
+        logger.info(f"Loaded {self._count} vectors into the local vector index.")
+        if self._count >= self.ivf_threshold:
+            self._train_ivf()
+
+    @contextmanager
+    def _file_lock(self):
+        """Serialises log replay and appends across processes sharing the directory."""
+        if fcntl is None:
+            yield
+            return
+        with open(self.directory / ".lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _replay(self):
+        """
+        Applies metadata.jsonl records past `_log_offset`: the whole log on startup,
+        afterwards the rows other processes appended. Caller holds the file lock.
+        """
+        if not self._metadata_path.exists():
+            return
+        with open(self._metadata_path, "rb") as f:
+            f.seek(self._log_offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # truncated tail from an interrupted write
+                self._log_offset += len(line)
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if "dim" in record:
+                    self._dim = record["dim"]
+                else:
+                    self._set_row(record["row"], record["id"], record["metadata"])
+        if self._count:
+            self._ensure_capacity(self._count)
+
+    def _refresh(self):
+        """Replays rows appended by other processes since the last replay."""
+        try:
+            size = self._metadata_path.stat().st_size
+        except OSError:
+            return
+        if size > self._log_offset:
+            with self._file_lock():
+                self._replay()
+
+    def _set_row(self, row: int, doc_id: str, metadata: Dict[str, Any]):
+        """Points `row` at `doc_id` and `metadata` in the in-memory tables."""
+        while len(self._ids) < row:
+            # Rows whose record was lost to an interrupted write
+            self._ids.append(f"__missing_{len(self._ids)}")
+            self._metadata.append({})
+        if row == len(self._ids):
+            self._ids.append(doc_id)
+            self._metadata.append(metadata)
+        else:
+            if self._rows.get(self._ids[row]) == row:
+                del self._rows[self._ids[row]]
+            self._unindex_metadata(row, self._metadata[row])
+            self._ids[row] = doc_id
+            self._metadata[row] = metadata
+            if row < self._ivf_rows:
+                self._stale.add(row)
+        self._rows[doc_id] = row
+        self._index_metadata(row, metadata)
+        self._count = len(self._ids)
+
+    def _ensure_capacity(self, rows: int):
+        if self._matrix is None or self._matrix.shape[0] < rows:
+            self._open_matrix(max(rows, 1024))
+
+    def _open_matrix(self, capacity: int):
+        """Opens (or grows) the memory-mapped matrix to hold `capacity` rows."""
+        needed = capacity * self._dim * 4
+        if not self._vectors_path.exists() or self._vectors_path.stat().st_size < needed:
+            with open(self._vectors_path, "ab") as f:
+                f.truncate(needed)
+        if self._matrix is not None:
+            self._matrix.flush()
+        rows = self._vectors_path.stat().st_size // (self._dim * 4)
+        self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(rows, self._dim))
+
+    def _index_metadata(self, row: int, metadata: Dict[str, Any]):
+        for field in INDEXED_FIELDS:
+            value = metadata.get(field)
+            if value is not None:
+                self._postings[field][value].add(row)
+
+    def _unindex_metadata(self, row: int, metadata: Dict[str, Any]):
+        for field in INDEXED_FIELDS:
+            value = metadata.get(field)
+            if value is not None:
+                self._postings[field][value].discard(row)
+
+    def upsert(self, vectors: Sequence[Tuple[str, Sequence[float], Dict[str, Any]]]):
+        if not vectors:
+            return {"upserted_count": 0}
+        with self._lock, self._file_lock():
+            # Rows are numbered from the shared log, so catch up with other processes first
+            self._replay()
+            log_lines = []
+            if self._dim is None:
+                self._dim = len(vectors[0][1])
+                log_lines.append(json.dumps({"dim": self._dim}))
+            self._ensure_capacity(1024)
+
+            upserted = 0
+            for doc_id, values, metadata in vectors:
+                vec = np.asarray(values, dtype=np.float32)
+                if vec.shape != (self._dim,):
+                    logger.warning(f"Skipping {doc_id}: dimension {vec.shape} != {self._dim}")
+                    continue
+                norm = np.linalg.norm(vec)
+                if norm > 0:
+                    vec = vec / norm
+                row = self._rows.get(doc_id, self._count)
+                if row >= self._matrix.shape[0]:
+                    self._open_matrix(self._matrix.shape[0] * 2)
+                self._matrix[row] = vec
+                self._set_row(row, doc_id, metadata)
+                log_lines.append(json.dumps({"id": doc_id, "row": row, "metadata": metadata}, default=str))
+                upserted += 1
+
+            self._matrix.flush()
+            with open(self._metadata_path, "ab") as f:
+                # Start on a fresh line after a tail left by an interrupted write
+                prefix = "\n" if f.tell() > self._log_offset else ""
+                f.write((prefix + "\n".join(log_lines) + "\n").encode("utf-8"))
+                self._log_offset = f.tell()
+
+            changed = self._count - self._ivf_rows + len(self._stale)
+            if self._count >= self.ivf_threshold and changed > max(self._ivf_rows // 5, 1):
+                self._train_ivf()
+            return {"upserted_count": upserted}
+
+    def _train_ivf(self, iterations: int = 10, sample_size: int = 50000):
+        """Trains spherical k-means centroids and rebuilds the inverted lists."""
+        data = np.asarray(self._matrix[:self._count])
+        nlist = max(1, int(np.sqrt(self._count)))
+        rng = np.random.default_rng(0)
+        sample = data[rng.choice(self._count, size=min(sample_size, self._count), replace=False)]
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = sample[assign == c]
+                if len(members):
+                    centroid = members.sum(axis=0)
+                    centroids[c] = centroid / (np.linalg.norm(centroid) or 1.0)
+        assign = np.argmax(data @ centroids.T, axis=1)
+        self._centroids = centroids
+        self._lists = [np.flatnonzero(assign == c) for c in range(nlist)]
+        self._ivf_rows = self._count
+        self._stale = set()
+        logger.info(f"Trained IVF index with {nlist} lists over {self._count} vectors.")
+
+    def _candidate_rows(self, query: np.ndarray) -> Optional[np.ndarray]:
+        """Rows worth scoring, or None for all of them."""
+        if self._centroids is None:
+            return None
+        probes = np.argsort(-(self._centroids @ query))[:self.nprobe]
+        rows = [self._lists[p] for p in probes]
+        # Rows added after the last training are always scanned
+        rows.append(np.arange(self._ivf_rows, self._count))
+        if self._stale:
+            # Rows updated since training may sit in the wrong list, so they are scanned too
+            rows.append(np.fromiter(self._stale, dtype=np.int64, count=len(self._stale)))
+            return np.unique(np.concatenate(rows))
+        return np.concatenate(rows)
+
+    def _filter_rows(self, filter: Optional[Dict]) -> Optional[Set[int]]:
+        """Narrows candidates via the inverted indexes; None means unrestricted."""
+        if not filter:
+            return None
+        allowed: Optional[Set[int]] = None
+        for field, condition in filter.items():
+            if field not in INDEXED_FIELDS:
+                continue
+            if isinstance(condition, dict):
+                if "$eq" in condition:
+                    values = [condition["$eq"]]
+                elif "$in" in condition:
+                    values = condition["$in"]
+                else:
+                    continue
+            else:
+                values = [condition]
+            rows = set().union(*(self._postings[field].get(v, set()) for v in values))
+            allowed = rows if allowed is None else allowed & rows
+        return allowed
+
+    def query(self, vector: Sequence[float], top_k: int = 3, include_metadata: bool = True, filter: Optional[Dict] = None) -> QueryResult:
+        with self._lock:
+            self._refresh()
+            if not self._count:
+                return QueryResult(matches=[])
+            query = np.asarray(vector, dtype=np.float32)
+            norm = np.linalg.norm(query)
+            if norm > 0:
+                query = query / norm
+
+            allowed = self._filter_rows(filter)
+            if allowed is not None:
+                rows = np.fromiter(sorted(allowed), dtype=np.int64, count=len(allowed))
+            else:
+                rows = self._candidate_rows(query)
+            if filter:
+                base = rows if rows is not None else range(self._count)
+                rows = np.fromiter(
+                    (r for r in base if matches_filter(self._metadata[r], filter)), dtype=np.int64
+                )
+            if rows is not None and len(rows) == 0:
+                return QueryResult(matches=[])
+
+            matrix = self._matrix[:self._count] if rows is None else self._matrix[rows]
+            scores = matrix @ query
+            k = min(top_k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+
+            matches = []
+            for i in top:
+                row = int(i) if rows is None else int(rows[i])
+                metadata = self._metadata[row] if include_metadata else {}
+                matches.append(QueryMatch(id=self._ids[row], score=float(scores[i]), metadata=metadata))
+            return QueryResult(matches=matches)
+
+
+_local_indexes: Dict[str, LocalVectorIndex] = {}
+_local_indexes_lock = threading.Lock()
+
+
+def get_local_index(namespace: str = "default") -> LocalVectorIndex:
+    """
+    Process-wide local index per namespace, loaded from VECTOR_INDEX_DIR/<namespace>
+    on first use. Callers use the embedding model as the namespace so vectors from
+    different embedders never share an index.
+    """
+    with _local_indexes_lock:
+        if namespace not in _local_indexes:
+            _local_indexes[namespace] = LocalVectorIndex(INDEX_DIR / namespace)
+        return _local_indexes[namespace]
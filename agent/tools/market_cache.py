@@ -0,0 +1,166 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+logger = logging.getLogger("financial_agent")
+
+# Fields that move intraday; everything else in `info` is treated as fundamentals
+QUOTE_FIELDS = (
+    "currentPrice", "regularMarketPrice", "volume", "regularMarketVolume",
+    "dayHigh", "dayLow", "open", "previousClose",
+)
+
+
+class FieldClass(NamedTuple):
+    ttl: float        # seconds the data is served as fresh
+    max_stale: float  # seconds past `ttl` it may still be served while a refresh runs
+
+
+QUOTE = FieldClass(
+    ttl=float(os.getenv("MARKET_QUOTE_TTL", "60")),
+    max_stale=float(os.getenv("MARKET_QUOTE_MAX_STALE", "600")),
+)
+FUNDAMENTALS = FieldClass(
+    ttl=float(os.getenv("MARKET_FUNDAMENTALS_TTL", str(6 * 3600))),
+    max_stale=float(os.getenv("MARKET_FUNDAMENTALS_MAX_STALE", str(24 * 3600))),
+)
+MAX_ENTRIES = int(os.getenv("MARKET_CACHE_SIZE", "512"))
+
+
+class _Entry:
+    __slots__ = ("info", "quote_at", "fundamentals_at", "refreshing")
+
+    def __init__(self, info: Dict[str, Any], quote_at: float, fundamentals_at: float):
+        self.info = info
+        self.quote_at = quote_at
+        self.fundamentals_at = fundamentals_at
+        self.refreshing = False
+
+
+class MarketDataCache:
+    """
+    LRU cache of yfinance `info` dicts keyed by symbol, with separate TTLs for quote
+    fields and fundamentals. Expired entries inside their stale window are served
+    immediately while a background thread refreshes them (stale-while-revalidate);
+    only the quote fields are refetched when the fundamentals are still fresh.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = MAX_ENTRIES,
+        quote: FieldClass = QUOTE,
+        fundamentals: FieldClass = FUNDAMENTALS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_entries = max_entries
+        self.quote = quote
+        self.fundamentals = fundamentals
+        self.clock = clock
+        self.stats = {"hits": 0, "stale": 0, "misses": 0, "evictions": 0}
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(
+        self,
+        key: str,
+        fetch_info: Callable[[str], Dict[str, Any]],
+        fetch_quote: Callable[[str], Dict[str, Any]],
+    ) -> Dict[str, Any]:
+        """
+        Returns the cached info for `key`, fetching or refreshing as the TTLs require.
+        `fetch_info` loads the full info dict, `fetch_quote` only the QUOTE_FIELDS.
+        Empty results are never cached.
+        """
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+
+        if entry is None:
+            self.stats["misses"] += 1
+            return self._refresh(key, fetch_info, fetch_quote, full=True)
+
+        quote_age = now - entry.quote_at
+        fundamentals_age = now - entry.fundamentals_at
+        full = fundamentals_age >= self.fundamentals.ttl
+
+        if not full and quote_age < self.quote.ttl:
+            self.stats["hits"] += 1
+            return entry.info
+
+        too_stale = (
+            quote_age >= self.quote.ttl + self.quote.max_stale
+            or fundamentals_age >= self.fundamentals.ttl + self.fundamentals.max_stale
+        )
+        if too_stale:
+            self.stats["misses"] += 1
+            return self._refresh(key, fetch_info, fetch_quote, full=full) or entry.info
+
+        self.stats["stale"] += 1
+        self._refresh_in_background(key, entry, fetch_info, fetch_quote, full)
+        return entry.info
+
+    def invalidate(self, key: Optional[str] = None):
+        """Drops one symbol, or everything when `key` is None."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def _refresh(self, key, fetch_info, fetch_quote, full: bool) -> Dict[str, Any]:
+        now = self.clock()
+        if full:
+            info = fetch_info(key)
+            if info:
+                self._store(key, _Entry(info, now, now))
+            return info
+
+        quote = fetch_quote(key)
+        with self._lock:
+            entry = self._entries.get(key)
+        if not quote or entry is None:
+            return {}
+        # Build a new dict so readers holding the old one never see a half-updated quote
+        info = {**entry.info, **quote}
+        self._store(key, _Entry(info, now, entry.fundamentals_at))
+        return info
+
+    def _refresh_in_background(self, key, entry: _Entry, fetch_info, fetch_quote, full: bool):
+        with self._lock:
+            if entry.refreshing:
+                return
+            entry.refreshing = True
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="market-cache")
+
+        def run():
+            try:
+                self._refresh(key, fetch_info, fetch_quote, full)
+            except Exception as e:
+                logger.warning(f"Background refresh failed for {key}: {e}")
+            finally:
+                entry.refreshing = False
+
+        self._executor.submit(run)
+
+    def _store(self, key: str, entry: _Entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+
+# Shared by every MarketDataTool in the process
+market_cache = MarketDataCache()
@@ -1,62 +1,214 @@
+import os
 import yfinance as yf
 import time
+import random
+import asyncio
 import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait
 from typing import Dict, Any, List, Optional
 from requests.exceptions import RequestException
+try:
+    from yfinance.exceptions import YFRateLimitError
+except ImportError:  # yfinance before 0.2.55
+    YFRateLimitError = ()
+from agent.tools.symbol_index import get_symbol_index
+from agent.tools.market_cache import MarketDataCache, market_cache
+from agent.singleflight import SingleFlight
+from agent.circuit_breaker import get_breaker
+from agent.metrics import TOOL_RETRIES, tool_span
 
 logger = logging.getLogger("financial_agent")
 
+# Bounded pool shared by all requests so a burst of comparisons cannot spawn unbounded threads
+FETCH_WORKERS = int(os.getenv("MARKET_FETCH_WORKERS", "8"))
+# Overall budget for one get_market_data call, in seconds
+FETCH_TIMEOUT = float(os.getenv("MARKET_FETCH_TIMEOUT", "20"))
+
+_fetch_executor = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="market-fetch")
+# Concurrent requests for the same symbol share one yfinance call
+_ticker_flight = SingleFlight()
+
+
+def _is_upstream_failure(error: BaseException) -> bool:
+    """
+    True when Yahoo itself is failing (transport error, rate limit, 5xx), as opposed to
+    one ticker having no data. Only these count against the shared yfinance breaker.
+    """
+    if isinstance(error, YFRateLimitError):
+        return True
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    # requests and curl_cffi transport errors are both OSErrors
+    return isinstance(error, (RequestException, OSError))
+
+
 class MarketDataTool:
     """
     Tool to fetch market data using yfinance with retry logic.
     """
     
-    def __init__(self, max_retries: int = 3, retry_delay: int = 2):
+    def __init__(self, max_retries: int = 3, retry_delay: int = 2, cache: Optional[MarketDataCache] = market_cache):
         self.max_retries = max_retries
         self.retry_delay = retry_delay
+        # Process-wide TTL cache by default; pass cache=None to always hit yfinance
+        self.cache = cache
+
+    def get_ticker_info(self, ticker_symbol: str, deadline: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Fetches basic info for a ticker, served from the TTL cache when possible.
+        Unknown tickers are rejected without a network call once a full exchange
+        master is configured (SYMBOL_MASTER); until then they are fetched as written.
+        `deadline` is a time.monotonic() timestamp after which no further retries are made.
+        """
+        yahoo_symbol = get_symbol_index().to_yahoo(ticker_symbol)
+        if yahoo_symbol is None:
+            logger.warning(f"Unknown symbol {ticker_symbol}, skipping fetch.")
+            return {}
+
+        fetch_info = lambda symbol: self._fetch_info(symbol, deadline)
+        if self.cache is None:
+            return _ticker_flight.do(yahoo_symbol, lambda: fetch_info(yahoo_symbol))
+        return _ticker_flight.do(
+            yahoo_symbol,
+            lambda: self.cache.get(yahoo_symbol, fetch_info, self._fetch_quote)
+        )
+
+    def _backoff(self, attempt: int) -> float:
+        """
+        Exponential backoff with full jitter, so retries from concurrent fetches do not line up.
+        """
+        return random.uniform(0, self.retry_delay * (2 ** attempt))
 
-    def get_ticker_info(self, ticker_symbol: str) -> Dict[str, Any]:
+    def _fetch_info(self, yahoo_symbol: str, deadline: Optional[float] = None) -> Dict[str, Any]:
         """
-        Fetches basic info for a ticker.
+        Fetches the full info dict from yfinance with retries.
+        Gives up at once while the yfinance circuit breaker is open. A fetch that ends
+        in an upstream failure counts once against the breaker, however many retries
+        it took; a symbol without data does not count at all.
         """
+        breaker = get_breaker("yfinance")
+        if not breaker.allow():
+            logger.error(f"yfinance circuit open, not fetching {yahoo_symbol}.")
+            return {}
+        upstream_failed = False
         for attempt in range(self.max_retries):
+            # allow() once per fetch: while half-open it admits a single probe, which is this fetch
+            if attempt and breaker.state == "open":
+                logger.error(f"yfinance circuit opened, not retrying {yahoo_symbol}.")
+                break
+            if attempt:
+                TOOL_RETRIES.labels(tool="yfinance").inc()
             try:
-                ticker = yf.Ticker(ticker_symbol)
-                info = ticker.info
-                # Basic validation to check if data is valid
-                if 'symbol' not in info: 
-                     # Sometimes yfinance returns empty dict on failure without raising
-                    raise ValueError(f"No data found for {ticker_symbol}")
+                with tool_span("yfinance", "info"):
+                    ticker = yf.Ticker(yahoo_symbol)
+                    info = ticker.info
+                    # Basic validation to check if data is valid
+                    if 'symbol' not in info: 
+                         # Sometimes yfinance returns empty dict on failure without raising
+                        raise ValueError(f"No data found for {yahoo_symbol}")
+                breaker.record_success()
                 return info
             except (RequestException, ValueError, Exception) as e:
-                logger.warning(f"Attempt {attempt + 1} failed for {ticker_symbol}: {e}")
-                if attempt < self.max_retries - 1:
-                    time.sleep(self.retry_delay)
-                else:
-                    logger.error(f"Failed to fetch info for {ticker_symbol} after {self.max_retries} attempts.")
-                    return {}
+                upstream_failed = _is_upstream_failure(e)
+                logger.warning(f"Attempt {attempt + 1} failed for {yahoo_symbol}: {e}")
+                if attempt == self.max_retries - 1:
+                    logger.error(f"Failed to fetch info for {yahoo_symbol} after {self.max_retries} attempts.")
+                    break
+                delay = self._backoff(attempt)
+                if deadline is not None and time.monotonic() + delay >= deadline:
+                    logger.error(f"Deadline reached fetching {yahoo_symbol}, giving up after {attempt + 1} attempts.")
+                    break
+                time.sleep(delay)
+        if upstream_failed:
+            breaker.record_failure()
+        else:
+            breaker.release()
+        return {}
 
-    def get_market_data(self, tickers: List[str], period: str = "1y") -> Dict[str, Any]:
+    def _fetch_quote(self, yahoo_symbol: str) -> Dict[str, Any]:
         """
-        Fetches historical market data for a list of tickers.
+        Fetches only the fast-moving quote fields, mapped onto `info` keys.
+        Much lighter than `info`, used when the cached fundamentals are still fresh.
         """
+        breaker = get_breaker("yfinance")
+        if not breaker.allow():
+            return {}
+        try:
+            # fast_info fetches lazily on key access, so the whole mapping is the upstream call
+            with tool_span("yfinance", "quote"):
+                fast = yf.Ticker(yahoo_symbol).fast_info
+                quote = {
+                    "currentPrice": fast["lastPrice"],
+                    "regularMarketPrice": fast["lastPrice"],
+                    "volume": fast["lastVolume"],
+                    "regularMarketVolume": fast["lastVolume"],
+                    "dayHigh": fast["dayHigh"],
+                    "dayLow": fast["dayLow"],
+                    "open": fast["open"],
+                    "previousClose": fast["previousClose"],
+                }
+            breaker.record_success()
+            return {k: v for k, v in quote.items() if v is not None}
+        except Exception as e:
+            if _is_upstream_failure(e):
+                breaker.record_failure()
+            else:
+                breaker.release()
+            logger.warning(f"Quote refresh failed for {yahoo_symbol}: {e}")
+            return {}
+
+    def get_market_data(self, tickers: List[str], period: str = "1y", timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Fetches market data for a list of tickers concurrently.
+        Each ticker runs on the shared fetch pool, so one failing symbol retries on its own
+        thread instead of delaying the others. Tickers still pending after `timeout` seconds
+        (default MARKET_FETCH_TIMEOUT) come back as empty dicts.
+        """
+        tickers = list(dict.fromkeys(tickers))
+        if not tickers:
+            return {}
+        if timeout is not None and timeout <= 0:
+            logger.error(f"No time left to fetch {tickers}.")
+            return {t: {} for t in tickers}
+
+        # For 'metrics' the info dict is enough (current price, PE, etc.);
+        # history() can be added per ticker if historical data is requested.
+        deadline = time.monotonic() + (timeout if timeout is not None else FETCH_TIMEOUT)
+        futures = {
+            t: _fetch_executor.submit(contextvars.copy_context().run, self.get_ticker_info, t, deadline)
+            for t in tickers
+        }
+        wait(futures.values(), timeout=max(0.0, deadline - time.monotonic()))
+
         data_map = {}
-        for t in tickers:
-            info = self.get_ticker_info(t)
+        for t, future in futures.items():
+            if not future.done():
+                future.cancel()
+                logger.error(f"Timed out fetching {t}.")
+                data_map[t] = {}
+                continue
             try:
-                # We can also fetch history if needed, but for 'metrics' info is often enough 
-                # for current price, PE, etc. 
-                # If historical data is requested, we can use history()
-                # For now, we return the info dict which contains most 'current' metrics
-                data_map[t] = info
+                data_map[t] = future.result()
             except Exception as e:
                 logger.error(f"Error processing {t}: {e}")
                 data_map[t] = {}
         return data_map
 
+    async def aget_market_data(self, tickers: List[str], period: str = "1y", timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Async variant of get_market_data. yfinance is blocking, so it runs in a worker thread.
+        """
+        return await asyncio.to_thread(self.get_market_data, tickers, period, timeout)
+
     def get_history(self, ticker_symbol: str, period: str = "1mo") -> Any:
+        yahoo_symbol = get_symbol_index().to_yahoo(ticker_symbol)
+        if yahoo_symbol is None:
+            logger.warning(f"Unknown symbol {ticker_symbol}, skipping history fetch.")
+            return None
         try:
-             ticker = yf.Ticker(ticker_symbol)
+             ticker = yf.Ticker(yahoo_symbol)
              return ticker.history(period=period)
         except Exception as e:
             logger.error(f"Error fetching history for {ticker_symbol}: {e}")
@@ -0,0 +1,331 @@
+import os
+import csv
+import re
+import logging
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+logger = logging.getLogger("financial_agent")
+
+SYMBOLS_PATH = Path(__file__).parent.parent / "data" / "symbols.csv"
+
+# Full exchange symbol masters (NSE EQUITY_L.csv, BSE scrip master), os.pathsep-separated.
+# Without one, the bundled list only covers well-known names, so unknown but well-formed
+# tickers are passed through to yfinance instead of being rejected.
+SYMBOL_MASTER = os.getenv("SYMBOL_MASTER", "")
+
+# Free-text words shorter than this are never fuzzy matched ("trend" must not become TRENT)
+MIN_FUZZY_LENGTH = 6
+
+# Words next to a dictionary-word alias ("~apollo" in symbols.csv) that make it a company mention
+GUARD_CONTEXT = {
+    "share", "shares", "stock", "stocks", "price", "ltd", "limited", "ns", "bo", "nse", "bse",
+    "results", "dividend", "target", "chart", "mcap", "vs", "versus",
+}
+# How many words either side of a guarded alias are checked for GUARD_CONTEXT
+GUARD_WINDOW = 2
+
+TICKER_PATTERN = re.compile(r"^\^?[A-Z0-9][A-Z0-9&_-]{0,19}(\.(NS|BO))?$")
+# Placeholders LLMs put in the tickers list that are never real symbols
+PLACEHOLDER_TICKERS = {"GREETING", "NONE", "NULL", "NA", "N/A", "UNKNOWN"}
+
+
+class Symbol(NamedTuple):
+    """
+    One entry of the bundled symbol master.
+    `symbol` is the canonical ticker used across the agent, `yahoo` what yfinance expects.
+    """
+    symbol: str
+    name: str
+    kind: str  # "equity" or "index"
+    yahoo: str
+
+
+class _TrieNode:
+    __slots__ = ("children", "symbol", "guarded")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.symbol: Optional[Symbol] = None
+        # Dictionary-word alias: needs case or context in free text, never fuzzy matched
+        self.guarded = False
+
+
+def normalize(text: str) -> str:
+    """Lowercase, drop apostrophes and collapse everything except [a-z0-9&] to single spaces."""
+    text = text.lower().replace("'", "").replace("’", "")
+    return " ".join(re.findall(r"[a-z0-9&]+", text))
+
+
+def _written_as_name(text: str, alias: str) -> bool:
+    """True if `alias` appears in `text` in capitals or capitalised mid-sentence ("buy Apollo", "META")."""
+    words = alias.split()
+    pattern = r"(?<![A-Za-z0-9])" + r"[^A-Za-z0-9&]+".join(map(re.escape, words)) + r"(?![A-Za-z0-9])"
+    for m in re.finditer(pattern, text, re.IGNORECASE):
+        written = m.group()
+        if written.isupper():
+            return True
+        # A capital at the start of a sentence says nothing
+        if written != written.lower() and text[:m.start()].rstrip()[-1:] not in ("", ".", "!", "?"):
+            return True
+    return False
+
+
+def _read_master(path: str) -> Iterator[Tuple[Symbol, str]]:
+    """
+    (Symbol, company name) rows of an NSE EQUITY_L.csv or a BSE scrip master export.
+    The format is told apart by its header.
+    """
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        reader = csv.DictReader(f)
+        fields = {(name or "").strip().lower(): name for name in reader.fieldnames or []}
+        if "symbol" in fields and "name of company" in fields:
+            for row in reader:
+                ticker = row[fields["symbol"]].strip().upper()
+                if ticker:
+                    name = row[fields["name of company"]].strip()
+                    yield Symbol(f"{ticker}.NS", name, "equity", f"{ticker}.NS"), name
+        elif "security id" in fields:
+            status, instrument = fields.get("status"), fields.get("instrument")
+            name_field = fields.get("issuer name") or fields.get("security name")
+            for row in reader:
+                if status and row[status].strip().lower() != "active":
+                    continue
+                if instrument and row[instrument].strip().lower() != "equity":
+                    continue
+                ticker = row[fields["security id"]].strip().upper()
+                if ticker:
+                    name = row[name_field].strip() if name_field else ticker
+                    yield Symbol(f"{ticker}.BO", name, "equity", f"{ticker}.BO"), name
+        else:
+            raise ValueError(f"Unrecognised symbol master format: {path}")
+
+
+class SymbolIndex:
+    """
+    Offline NSE/BSE (plus major US) symbol resolver.
+    Aliases live in a character trie: exact and longest-match lookups walk it directly,
+    and typo-tolerant lookups walk it with a bounded edit-distance row per node.
+    `complete` means a full exchange master was loaded, so unknown tickers can be rejected.
+    """
+
+    def __init__(self, symbols: List[Symbol], aliases: Dict[str, Symbol], guarded: Set[str] = frozenset(), complete: bool = False):
+        self._by_symbol: Dict[str, Symbol] = {s.symbol: s for s in symbols}
+        self._by_yahoo: Dict[str, Symbol] = {s.yahoo: s for s in symbols}
+        self.complete = complete
+        self._root = _TrieNode()
+        for alias, symbol in aliases.items():
+            self._insert(alias, symbol, alias in guarded)
+        # Free text repeats the same few words, so typo lookups are memoised per term
+        self._cached_fuzzy = lru_cache(maxsize=4096)(self.fuzzy_lookup)
+
+    @classmethod
+    def from_csv(cls, path: Path = SYMBOLS_PATH, masters: Sequence[str] = ()) -> "SymbolIndex":
+        """
+        Loads the bundled list, whose aliases carry a leading "~" when they are ordinary
+        words ("~apollo"), then any full exchange masters. Master entries never replace
+        bundled ones; their single-word company names are treated as guarded aliases.
+        """
+        symbols: List[Symbol] = []
+        aliases: Dict[str, Symbol] = {}
+        guarded: Set[str] = set()
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                symbol = Symbol(
+                    symbol=row["symbol"],
+                    name=row["name"],
+                    kind=row["kind"],
+                    yahoo=row["yahoo"] or row["symbol"],
+                )
+                symbols.append(symbol)
+                for name in [row["name"], *row["aliases"].split("|")]:
+                    alias = normalize(name)
+                    if alias and name.startswith("~"):
+                        guarded.add(alias)
+                    if alias:
+                        aliases.setdefault(alias, symbol)
+
+        known = {s.symbol for s in symbols}
+        for master in masters:
+            for symbol, name in _read_master(master):
+                if symbol.symbol in known:
+                    continue
+                known.add(symbol.symbol)
+                symbols.append(symbol)
+                alias = re.sub(r"\s+(limited|ltd)$", "", normalize(name))
+                if alias and alias not in aliases:
+                    aliases[alias] = symbol
+                    if " " not in alias:
+                        guarded.add(alias)
+        return cls(symbols, aliases, guarded, complete=bool(masters))
+
+    def __len__(self) -> int:
+        return len(self._by_symbol)
+
+    def _insert(self, alias: str, symbol: Symbol, guarded: bool = False):
+        node = self._root
+        for ch in alias:
+            node = node.children.setdefault(ch, _TrieNode())
+        node.symbol = symbol
+        node.guarded = guarded
+
+    def lookup(self, alias: str) -> Optional[Symbol]:
+        """Exact alias lookup."""
+        node = self._root
+        for ch in normalize(alias):
+            node = node.children.get(ch)
+            if node is None:
+                return None
+        return node.symbol
+
+    def fuzzy_lookup(self, term: str, max_distance: int = 1) -> Optional[Symbol]:
+        """Closest alias within `max_distance` edits (insert, delete, substitute, transpose)."""
+        term = normalize(term)
+        if not term:
+            return None
+        best = [max_distance + 1, None]
+        first_row = list(range(len(term) + 1))
+
+        def walk(node, ch, prev_ch, row, prev_row):
+            current = [row[0] + 1]
+            for i in range(1, len(term) + 1):
+                cost = 0 if term[i - 1] == ch else 1
+                value = min(current[i - 1] + 1, row[i] + 1, row[i - 1] + cost)
+                if prev_row is not None and i > 1 and term[i - 1] == prev_ch and term[i - 2] == ch:
+                    value = min(value, prev_row[i - 2] + 1)
+                current.append(value)
+            if node.symbol is not None and not node.guarded and current[-1] < best[0]:
+                best[0], best[1] = current[-1], node.symbol
+            if min(current) < best[0]:
+                for next_ch, child in node.children.items():
+                    walk(child, next_ch, ch, current, row)
+
+        for ch, child in self._root.children.items():
+            walk(child, ch, None, first_row, None)
+        return best[1]
+
+    def resolve(self, mention: str) -> Optional[Symbol]:
+        """Company name, alias or ticker to Symbol; exact first, then typo-tolerant."""
+        symbol = self.get(mention) or self.lookup(mention)
+        if symbol:
+            return symbol
+        term = normalize(mention)
+        if len(term) < MIN_FUZZY_LENGTH:
+            return None
+        return self._cached_fuzzy(term, 1 if len(term) < 9 else 2)
+
+    def extract(self, text: str, fuzzy: bool = True) -> List[Symbol]:
+        """
+        All symbols mentioned in free text, in order of appearance.
+        Uses longest alias match at each word, so "hdfc life" wins over "hdfc".
+        Guarded aliases only count when written as a name or next to GUARD_CONTEXT
+        words, so "apollo mission" is not Apollo Hospitals but "Apollo share" is.
+        """
+        normalized = normalize(text)
+        found: List[Symbol] = []
+        pos = 0
+        while pos < len(normalized):
+            node, match, match_end = self._root, None, pos
+            i = pos
+            while i < len(normalized):
+                node = node.children.get(normalized[i])
+                if node is None:
+                    break
+                i += 1
+                if node.symbol is not None and (i == len(normalized) or normalized[i] == " "):
+                    if node.guarded and not self._confirmed(text, normalized, pos, i):
+                        continue
+                    match, match_end = node.symbol, i
+            word_end = normalized.find(" ", pos)
+            word_end = len(normalized) if word_end == -1 else word_end
+            if match is None and fuzzy and word_end - pos >= MIN_FUZZY_LENGTH:
+                # Typo lookup only: an exact alias here was guarded and rejected above
+                term = normalized[pos:word_end]
+                match = self._cached_fuzzy(term, 1 if len(term) < 9 else 2)
+                match_end = word_end
+            if match is not None:
+                if match not in found:
+                    found.append(match)
+                pos = match_end + 1
+            else:
+                pos = word_end + 1
+        return found
+
+    @staticmethod
+    def _confirmed(text: str, normalized: str, start: int, end: int) -> bool:
+        """Whether the guarded alias at normalized[start:end] reads as a company mention."""
+        nearby = normalized[:start].split()[-GUARD_WINDOW:] + normalized[end:].split()[:GUARD_WINDOW]
+        if any(word in GUARD_CONTEXT for word in nearby):
+            return True
+        return _written_as_name(text, normalized[start:end])
+
+    def get(self, ticker: str) -> Optional[Symbol]:
+        """Symbol for a canonical or Yahoo ticker, e.g. 'TCS.NS', 'NIFTY' or '^NSEI'."""
+        t = ticker.strip().upper()
+        return self._by_symbol.get(t) or self._by_yahoo.get(t)
+
+    def canonicalize(self, ticker: str) -> Optional[str]:
+        """
+        Maps a ticker as an LLM or user might write it to a known ticker, or None.
+        'RELIANCE' -> 'RELIANCE.NS', 'HUL.NS' -> 'HINDUNILVR.NS', '^NSEBANK' -> 'BANKNIFTY'.
+        BSE listings ('.BO') of known NSE symbols are kept as given.
+        """
+        t = ticker.strip().upper()
+        symbol = self.get(t)
+        if symbol:
+            return symbol.symbol
+        base, _, suffix = t.partition(".")
+        if suffix == "BO" and f"{base}.NS" in self._by_symbol:
+            return t
+        for candidate in (f"{base}.NS", base, f"{base}.BO"):
+            if candidate in self._by_symbol:
+                return candidate
+        # 'HUL.NS', 'ZOMATO.NS': an alias with an exchange suffix glued on
+        symbol = self.resolve(base) or self.resolve(ticker)
+        if symbol:
+            return symbol.symbol
+        return t if self._passthrough(t) else None
+
+    def _passthrough(self, ticker: str) -> bool:
+        """Unknown tickers are trusted as written unless a full master says they do not exist."""
+        return not self.complete and ticker not in PLACEHOLDER_TICKERS and bool(TICKER_PATTERN.match(ticker))
+
+    def to_yahoo(self, ticker: str) -> Optional[str]:
+        """
+        The yfinance symbol for a ticker: 'YESBANK' -> 'YESBANK.NS', 'ZOMATO' -> 'ETERNAL.NS'.
+        None if the ticker is unknown and a full master is loaded (or it is not a ticker at all).
+        """
+        t = ticker.strip().upper()
+        symbol = self.get(t)
+        if symbol:
+            return symbol.yahoo
+        base, _, suffix = t.partition(".")
+        if suffix == "BO" and f"{base}.NS" in self._by_symbol:
+            return t
+        for candidate in ((f"{base}.NS", f"{base}.BO") if not suffix else ()):
+            if candidate in self._by_symbol:
+                return self._by_symbol[candidate].yahoo
+        # Renamed companies keep their old ticker as an alias
+        symbol = self.lookup(base)
+        if symbol:
+            return symbol.yahoo
+        return t if self._passthrough(t) else None
+
+    def is_known(self, ticker: str) -> bool:
+        return self.to_yahoo(ticker) is not None
+
+
+@lru_cache(maxsize=1)
+def get_symbol_index() -> SymbolIndex:
+    """Process-wide symbol index, loaded from the bundled CSV and SYMBOL_MASTER on first use."""
+    masters = []
+    for path in filter(None, SYMBOL_MASTER.split(os.pathsep)):
+        if os.path.exists(path):
+            masters.append(path)
+        else:
+            logger.error(f"Symbol master {path} not found, ignoring it.")
+    index = SymbolIndex.from_csv(masters=masters)
+    mode = "full master, unknown tickers rejected" if index.complete else "bundled list, unknown tickers passed through"
+    logger.info(f"Loaded {len(index)} symbols into the symbol index ({mode}).")
+    return index
@@ -1,86 +1,166 @@
 import os
+import asyncio
+import hashlib
 import logging
 from typing import List, Dict, Any, Optional
 from pinecone import Pinecone, ServerlessSpec
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from agent.singleflight import SingleFlight
+from agent.circuit_breaker import CircuitBreaker, get_breaker
+from agent.metrics import tool_span
+from agent.tools.embedding_cache import CachedEmbeddings, get_embedding_cache
+from agent.tools.local_embeddings import get_hashing_embeddings
+from agent.tools.local_index import VectorIndex, get_local_index
 
 logger = logging.getLogger("financial_agent")
 
+EMBEDDING_MODEL = "models/embedding-001"
+
+# Users asking the same question at the same moment share one embedding call
+_embed_flight = SingleFlight()
+
+def _upstream_breakers(backend: str, embedding_backend: str) -> Dict[str, Optional[CircuitBreaker]]:
+    """Breakers for the remote services in use; the local index and embedder have none."""
+    return {
+        "index": get_breaker("pinecone") if backend != "local" else None,
+        "embeddings": get_breaker("gemini") if embedding_backend != "local" else None,
+    }
+
+def memory_available() -> bool:
+    """False while Pinecone or Gemini (whichever are configured) has an open circuit."""
+    breakers = _upstream_breakers(
+        os.getenv("VECTOR_BACKEND", "pinecone").lower(),
+        os.getenv("EMBEDDING_BACKEND", "gemini").lower()
+    )
+    return all(b.state != "open" for b in breakers.values() if b is not None)
+
+def _guarded(breaker: Optional[CircuitBreaker], fn, *args, **kwargs):
+    return breaker.call(fn, *args, **kwargs) if breaker is not None else fn(*args, **kwargs)
+
 class VectorStoreTool:
     """
-    Tool to interact with Pinecone for storing and retrieving financial knowledge.
+    Tool to interact with the vector index for storing and retrieving financial knowledge.
+    The backend is chosen with VECTOR_BACKEND: "pinecone" (default) or "local", an
+    in-process index under VECTOR_INDEX_DIR that needs no network access.
+    EMBEDDING_BACKEND picks the embedder: "gemini" (default) or "local", an offline
+    hashed n-gram model. A Pinecone index must be created with the embedder's dimension.
     """
     
     def __init__(self):
+        self.backend = os.getenv("VECTOR_BACKEND", "pinecone").lower()
+        self.embedding_backend = os.getenv("EMBEDDING_BACKEND", "gemini").lower()
+        self.embedding_model = EMBEDDING_MODEL
         self.api_key = os.getenv("PINECONE_API_KEY")
         self.index_name = os.getenv("PINECONE_INDEX")
         self.gemini_api_key = os.getenv("GEMINI_API_KEY")
-        
+        self.pc = None
+        self.index: Optional[VectorIndex] = None
+        self.embeddings = None
+        # Fail fast while Pinecone or Gemini is down instead of blocking worker threads
+        self.breakers = _upstream_breakers(self.backend, self.embedding_backend)
+
+        if self.backend == "local":
+            try:
+                self.embeddings = self._build_embeddings()
+                self.index = get_local_index(self.embedding_model.replace("/", "_"))
+            except Exception as e:
+                logger.warning(f"Failed to initialize local vector index: {e}")
+                self.index = None
+                self.embeddings = None
+            return
+
         if not self.api_key or not self.index_name:
             logger.warning("Pinecone credentials not found. Vector memory will be disabled.")
-            self.pc = None
-            self.index = None
-            self.embeddings = None
             return
 
         try:
             self.pc = Pinecone(api_key=self.api_key)
             self.index = self.pc.Index(self.index_name)
-            self.embeddings = GoogleGenerativeAIEmbeddings(
-                model="models/embedding-001", 
-                google_api_key=self.gemini_api_key
-            )
+            self.embeddings = self._build_embeddings()
         except Exception as e:
             logger.warning(f"Failed to initialize Pinecone: {e}")
             self.pc = None
             self.index = None
+            self.embeddings = None
+
+    def _build_embeddings(self) -> Embeddings:
+        if self.embedding_backend == "local":
+            # Cheaper to recompute than to look up, so no cache in front; one shared
+            # instance keeps its per-word memo across requests
+            local = get_hashing_embeddings()
+            self.embedding_model = local.model
+            return local
+        # Repeated documents and queries are served from the local embedding cache
+        return CachedEmbeddings(
+            GoogleGenerativeAIEmbeddings(
+                model=EMBEDDING_MODEL, 
+                google_api_key=self.gemini_api_key
+            ),
+            get_embedding_cache(EMBEDDING_MODEL)
+        )
 
-    def upsert_documents(self, documents: List[Document]):
+    @staticmethod
+    def document_id(text: str) -> str:
         """
-        Embeds and upserts documents to Pinecone.
+        Content-addressed vector ID, so re-upserting the same text overwrites instead of duplicating.
         """
-        if not self.index or not self.embeddings:
-            return
+        return hashlib.md5(text.encode()).hexdigest()
+
+    def upsert_documents(self, documents: List[Document]) -> bool:
+        """
+        Embeds and upserts documents to the vector index.
+        Returns False if the index is unavailable or the write failed.
+        """
+        if self.index is None or self.embeddings is None:
+            return False
 
         try:
             texts = [d.page_content for d in documents]
             metadatas = [d.metadata for d in documents]
             
             # Embed documents
-            vectors = self.embeddings.embed_documents(texts)
+            with tool_span(self.embedding_backend, "embed_documents"):
+                vectors = _guarded(self.breakers["embeddings"], self.embeddings.embed_documents, texts)
             
             # Prepare for upsert
             to_upsert = []
-            for i, (text, meta, vec) in enumerate(zip(texts, metadatas, vectors)):
-                # Create a unique ID. Ideally hashed content or UUID.
-                # Here we use a simple generic ID for demo, but better to use hash of content
-                import hashlib
-                doc_id = hashlib.md5(text.encode()).hexdigest()
-                to_upsert.append((doc_id, vec, {**meta, "text": text}))
+            for text, meta, vec in zip(texts, metadatas, vectors):
+                to_upsert.append((self.document_id(text), vec, {**meta, "text": text}))
             
-            # Upsert in batches if needed, Pinecone handles some list sizes
-            self.index.upsert(vectors=to_upsert)
-            logger.info(f"Upserted {len(to_upsert)} documents to Pinecone.")
+            # Callers keep batches within Pinecone's request limits (see EmbeddingQueue)
+            with tool_span(self.backend, "upsert"):
+                _guarded(self.breakers["index"], self.index.upsert, vectors=to_upsert)
+            logger.info(f"Upserted {len(to_upsert)} documents to the {self.backend} index.")
+            return True
 
         except Exception as e:
             logger.error(f"Error performing upsert: {e}")
+            return False
 
     def similarity_search(self, query: str, k: int = 3, filter: Optional[Dict] = None) -> List[Document]:
         """
         Performs semantic search.
         """
-        if not self.index or not self.embeddings:
+        if self.index is None or self.embeddings is None:
             return []
 
         try:
-            query_vector = self.embeddings.embed_query(query)
-            results = self.index.query(
-                vector=query_vector, 
-                top_k=k, 
-                include_metadata=True,
-                filter=filter
-            )
+            with tool_span(self.embedding_backend, "embed_query"):
+                query_vector = _embed_flight.do(
+                    (self.embedding_model, query),
+                    lambda: _guarded(self.breakers["embeddings"], self.embeddings.embed_query, query)
+                )
+            with tool_span(self.backend, "query"):
+                results = _guarded(
+                    self.breakers["index"],
+                    self.index.query,
+                    vector=query_vector, 
+                    top_k=k, 
+                    include_metadata=True,
+                    filter=filter
+                )
             
             docs = []
             for match in results.matches:
@@ -94,3 +174,9 @@ class VectorStoreTool:
         except Exception as e:
             logger.error(f"Error during similarity search: {e}")
             return []
+
+    async def asimilarity_search(self, query: str, k: int = 3, filter: Optional[Dict] = None) -> List[Document]:
+        """
+        Async variant of similarity_search.
+        """
+        return await asyncio.to_thread(self.similarity_search, query, k, filter)
@@ -1,16 +1,42 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional
+from contextlib import asynccontextmanager
+import os
+import asyncio
+import json
+import math
+import time
+import secrets
 import uvicorn
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from agent.graph import build_graph
+from agent.tools.embedding_queue import embedding_queue
+from agent.response_cache import response_cache
+from agent.model_router import model_router
+from agent.llm_pool import llm_pool
+from agent.circuit_breaker import breaker_snapshot
+from agent.llm_scheduler import Admission, llm_scheduler
+from agent.deadline import REQUEST_TIMEOUT, new_deadline
+from agent.metrics import REQUEST_SECONDS, TIMING_HEADER, register_stats, request_timings, server_timing, timing_totals
+from agent.tools.market_cache import market_cache
+from agent.tools.embedding_cache import embedding_cache_stats
 from langchain_core.messages import HumanMessage
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Drain queued long-term memory writes before the worker exits
+    await asyncio.to_thread(embedding_queue.close)
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Daddy's AI - Financial Agent API",
     description="Multi-layer financial agent for Indian stock market analysis and LTP Calculator",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS configuration for Next.js frontend
@@ -27,22 +53,84 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_request_time(request: Request, call_next):
+    """
+    Times every request into `agent_request_seconds`. For /chat/stream this is the
+    time until the response starts; per-node spans cover the rest of the stream.
+    """
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        # Unmatched paths share one label so scanners cannot blow up the series count
+        endpoint = route.path if route is not None else "unmatched"
+        REQUEST_SECONDS.labels(endpoint=endpoint, status=str(status)).observe(time.perf_counter() - started)
+
 # Build the agent graph once at startup
 print("[INFO] Building agent graph...")
 agent = build_graph()
 print("[INFO] Agent ready!")
 
+# Counters the caches, LLM pool, scheduler and breakers already keep, exported on /metrics
+register_stats({
+    "response_cache": lambda: response_cache.stats,
+    "market_cache": lambda: market_cache.stats,
+    "embedding_caches": embedding_cache_stats,
+    "llm_pool": lambda: llm_pool.counters,
+    "llm_scheduler": llm_scheduler.snapshot,
+    "circuits": breaker_snapshot,
+})
+
 # Request/Response Models
 class ChatRequest(BaseModel):
     message: str
     session_id: Optional[str] = None
 
+class CacheInvalidationRequest(BaseModel):
+    query: Optional[str] = None
+    intent: Optional[str] = None
+
+class ModelRouteRequest(BaseModel):
+    key: str                     # "task" or "task:intent", e.g. "reasoning:general_chat"
+    model: Optional[str] = None  # "model" or "model@Provider"; None resets to the default
+
 class ChatResponse(BaseModel):
     response: str
     intent: Optional[str] = None
     language: Optional[str] = None
     error: Optional[str] = None
 
+def build_chat_response(result: dict) -> ChatResponse:
+    """
+    Converts the final agent state into the API response model.
+    """
+    final_response = result.get("final_response", "")
+    analysis = result.get("analysis_result", {})
+    error = result.get("error")
+    
+    if error:
+        return ChatResponse(
+            response=f"Error: {error}",
+            error=error
+        )
+    
+    return ChatResponse(
+        response=final_response,
+        intent=analysis.get("intent") if isinstance(analysis, dict) else None,
+        language=analysis.get("language") if isinstance(analysis, dict) else None
+    )
+
+def sse_event(event: str, data: dict) -> str:
+    """
+    Formats a single Server-Sent Event.
+    """
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
 # Health check endpoint
 @app.get("/")
 async def root():
@@ -52,9 +140,36 @@ async def root():
 async def health():
     return {"status": "ok"}
 
+@app.get("/metrics")
+async def metrics():
+    """
+    Prometheus scrape endpoint: request, node, tool and LLM latency histograms,
+    prompt/completion token sizes, retries, cache hits and circuit breaker state.
+    """
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+def admit_request() -> Admission:
+    """
+    Admission control: rejects a request with 429 when its first LLM call would not
+    get a slot and finish within one attempt's budget (LLM_ATTEMPT_TIMEOUT, capped by
+    REQUEST_TIMEOUT), instead of accepting it only to fail with "no free LLM slot".
+    Run the request under `llm_scheduler.admitted(...)` with the returned admission.
+    """
+    admission = llm_scheduler.admit(
+        budget=min(llm_pool.attempt_timeout, REQUEST_TIMEOUT),
+        expires_in=REQUEST_TIMEOUT,
+    )
+    if admission is None:
+        raise HTTPException(
+            status_code=429,
+            detail="Server is busy, please retry shortly",
+            headers={"Retry-After": str(max(1, math.ceil(llm_scheduler.estimated_wait())))}
+        )
+    return admission
+
 # Main chat endpoint
 @app.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, response: Response, x_timing: Optional[str] = Header(None)):
     """
     Main endpoint for chatting with the financial agent.
     
@@ -63,48 +178,139 @@ async def chat(request: ChatRequest):
     - "wtb kya hota hai" → Hindi LTP Calculator response
     - "what is wtb" → English LTP Calculator response
     - "hi" → Casual greeting with system knowledge
+    
+    Send `X-Timing: 1` (or set TIMING_HEADER=1) to get a Server-Timing header
+    with the time spent in each node, tool and LLM call.
     """
     try:
         if not request.message.strip():
             raise HTTPException(status_code=400, detail="Message cannot be empty")
+        admission = admit_request()
         
         # Invoke the agent
         initial_state = {
             "messages": [HumanMessage(content=request.message)],
+            # Every node budgets its tool and LLM calls against this (REQUEST_TIMEOUT)
+            "deadline": new_deadline(),
         }
         
-        result = agent.invoke(initial_state)
+        # ainvoke keeps the event loop free while g4f, yfinance and Pinecone calls are in flight
+        with llm_scheduler.admitted(admission), request_timings() as timings:
+            result = await agent.ainvoke(initial_state)
         
-        # Extract response
-        final_response = result.get("final_response", "")
-        analysis = result.get("analysis_result", {})
-        error = result.get("error")
-        
-        if error:
-            return ChatResponse(
-                response=f"Error: {error}",
-                error=error
-            )
-        
-        return ChatResponse(
-            response=final_response,
-            intent=analysis.get("intent") if isinstance(analysis, dict) else None,
-            language=analysis.get("language") if isinstance(analysis, dict) else None
-        )
+        if TIMING_HEADER or x_timing:
+            response.headers["Server-Timing"] = server_timing(timings)
+        return build_chat_response(result)
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"[ERROR] Chat endpoint error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-# Streaming endpoint (for real-time responses)
+# Streaming endpoint (Server-Sent Events)
+STREAMED_NODES = {
+    "input_parsing", "cache_lookup", "query_planner", "data_fetch", "data_normalization",
+    "embedding", "retrieval", "reasoning", "response_generation",
+}
+
+async def stream_agent_events(message: str, admission: Admission, timing: bool = False):
+    """
+    Yields SSE frames while the graph runs:
+    - `node`: a graph node started or finished
+    - `token`: a reasoning token as it arrives from the LLM
+    - `timing`: milliseconds per node, tool and LLM call (only when `timing`), just before `final`
+    - `final`: the complete ChatResponse
+    - `error`: the run failed
+    """
+    initial_state = {
+        "messages": [HumanMessage(content=message)],
+        "deadline": new_deadline(),
+    }
+    try:
+        with llm_scheduler.admitted(admission), request_timings() as timings:
+            async for event in agent.astream_events(initial_state, version="v2"):
+                kind = event["event"]
+                name = event.get("name")
+                node = event.get("metadata", {}).get("langgraph_node")
+                
+                if kind in ("on_chain_start", "on_chain_end") and name in STREAMED_NODES and name == node:
+                    status = "start" if kind == "on_chain_start" else "end"
+                    yield sse_event("node", {"node": name, "status": status})
+                elif kind == "on_chat_model_stream" and node == "reasoning":
+                    text = event["data"]["chunk"].content
+                    if text:
+                        yield sse_event("token", {"text": text})
+                elif kind == "on_chain_end" and not event.get("parent_ids"):
+                    result = event["data"].get("output") or {}
+                    if timing:
+                        yield sse_event("timing", timing_totals(timings))
+                    yield sse_event("final", build_chat_response(result).model_dump())
+    except Exception as e:
+        print(f"[ERROR] Stream endpoint error: {e}")
+        yield sse_event("error", {"error": str(e)})
+
 @app.post("/chat/stream")
-async def chat_stream(request: ChatRequest):
+async def chat_stream(request: ChatRequest, x_timing: Optional[str] = Header(None)):
     """
     Streaming endpoint for real-time responses.
-    For now, returns the same as /chat. 
-    Implement SSE/WebSocket for true streaming.
+    Sends graph progress and reasoning tokens as Server-Sent Events,
+    followed by a `final` event carrying the same payload as /chat.
+    With `X-Timing: 1` (or TIMING_HEADER=1) a `timing` event precedes `final`.
+    """
+    if not request.message.strip():
+        raise HTTPException(status_code=400, detail="Message cannot be empty")
+    admission = admit_request()
+    
+    return StreamingResponse(
+        stream_agent_events(request.message, admission, timing=TIMING_HEADER or bool(x_timing)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Admin endpoints are disabled unless ADMIN_TOKEN is set
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+def _require_admin(x_admin_token: Optional[str]):
+    if not ADMIN_TOKEN or not x_admin_token or not secrets.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+@app.post("/admin/cache/invalidate")
+async def invalidate_response_cache(
+    request: CacheInvalidationRequest,
+    x_admin_token: Optional[str] = Header(None)
+):
+    """
+    Drops cached answers, e.g. after sys_prmpt.txt changes.
+    Empty body clears everything; `query` and/or `intent` narrow it down.
+    """
+    _require_admin(x_admin_token)
+    
+    removed = response_cache.invalidate(query=request.query, intent=request.intent)
+    return {"removed": removed, "remaining": len(response_cache), "stats": response_cache.stats}
+
+@app.get("/admin/llm")
+async def llm_status(x_admin_token: Optional[str] = Header(None)):
+    """
+    Model routing table with per-task health, per-provider latency/error stats,
+    LLM slot usage and queue depth, and the state of every upstream circuit breaker.
+    """
+    _require_admin(x_admin_token)
+    return {
+        "router": model_router.snapshot(),
+        "pool": llm_pool.snapshot(),
+        "scheduler": llm_scheduler.snapshot(),
+        "circuits": breaker_snapshot(),
+    }
+
+@app.post("/admin/llm/routes")
+async def set_model_route(request: ModelRouteRequest, x_admin_token: Optional[str] = Header(None)):
+    """
+    Changes which model serves a task (and optionally one intent) without a restart.
     """
-    return await chat(request)
+    _require_admin(x_admin_token)
+    model_router.set_route(request.key, request.model)
+    return model_router.snapshot()
 
 if __name__ == "__main__":
     uvicorn.run(
@@ -0,0 +1,164 @@
+"""
+Offline benchmark for the agent graph.
+
+Runs build_graph() against deterministic stand-ins (benchmarks/stubs.py) for g4f,
+Yahoo Finance and the vector store, over a query corpus covering all four intents,
+at several concurrency levels. Reports end-to-end and per-span (node, tool, LLM)
+p50/p95/p99 and throughput, and saves the results as JSON for later comparison.
+
+    python -m benchmarks.graph_bench --concurrency 1,4,16 --requests 60
+    python -m benchmarks.graph_bench --compare .cache/bench/graph-<earlier>.json
+"""
+import argparse
+import asyncio
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+from benchmarks import stubs
+from benchmarks.report import compare, run_metadata, save, summarize
+
+# Must precede any `agent` import
+stubs.configure_environment()
+
+from langchain_core.messages import HumanMessage  # noqa: E402
+from agent.graph import build_graph  # noqa: E402
+from agent.deadline import new_deadline  # noqa: E402
+from agent.metrics import request_timings  # noqa: E402
+from agent.tools.embedding_queue import embedding_queue  # noqa: E402
+
+
+def _initial_state(query: str) -> Dict[str, Any]:
+    return {"messages": [HumanMessage(content=query)], "deadline": new_deadline()}
+
+
+def _sample(entry: Dict[str, Any], started: float, result: Any, timings, error: str = None) -> Dict[str, Any]:
+    elapsed = time.perf_counter() - started
+    if error is None and isinstance(result, dict):
+        error = result.get("error")
+        if error is None and not result.get("final_response"):
+            error = "no response"
+    spans = defaultdict(float)
+    for name, seconds in timings:
+        spans[name] += seconds
+    return {"intent": entry["intent"], "seconds": elapsed, "spans": dict(spans), "error": error}
+
+
+async def _run_async(graph, entries: List[Dict[str, Any]], concurrency: int) -> List[Dict[str, Any]]:
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one(entry):
+        async with gate:
+            started = time.perf_counter()
+            with request_timings() as timings:
+                try:
+                    result = await graph.ainvoke(_initial_state(entry["query"]))
+                except Exception as e:
+                    return _sample(entry, started, None, timings, f"{type(e).__name__}: {e}")
+            return _sample(entry, started, result, timings)
+
+    return await asyncio.gather(*(one(entry) for entry in entries))
+
+
+def _run_sync(graph, entries: List[Dict[str, Any]], concurrency: int) -> List[Dict[str, Any]]:
+    def one(entry):
+        started = time.perf_counter()
+        with request_timings() as timings:
+            try:
+                result = graph.invoke(_initial_state(entry["query"]))
+            except Exception as e:
+                return _sample(entry, started, None, timings, f"{type(e).__name__}: {e}")
+        return _sample(entry, started, result, timings)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(one, entries))
+
+
+def run_level(graph, corpus: List[Dict[str, Any]], concurrency: int, requests: int, mode: str) -> Dict[str, Any]:
+    """Runs `requests` corpus queries (round robin) with at most `concurrency` in flight."""
+    stubs.reset_caches()
+    entries = [corpus[i % len(corpus)] for i in range(requests)]
+    started = time.perf_counter()
+    if mode == "async":
+        samples = asyncio.run(_run_async(graph, entries, concurrency))
+    else:
+        samples = _run_sync(graph, entries, concurrency)
+    wall = time.perf_counter() - started
+
+    spans = defaultdict(list)
+    intents = defaultdict(list)
+    for sample in samples:
+        intents[sample["intent"]].append(sample["seconds"])
+        for name, seconds in sample["spans"].items():
+            spans[name].append(seconds)
+    errors = [s["error"] for s in samples if s["error"]]
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(requests / wall, 2),
+        "errors": len(errors),
+        "error_samples": sorted(set(errors))[:5],
+        "latency": summarize(s["seconds"] for s in samples),
+        "intents": {intent: summarize(values) for intent, values in sorted(intents.items())},
+        "spans": {name: summarize(values) for name, values in sorted(spans.items())},
+    }
+
+
+def print_level(level: Dict[str, Any]):
+    latency = level["latency"]
+    print(
+        f"\nconcurrency {level['concurrency']}: {level['requests']} requests in {level['wall_seconds']}s, "
+        f"{level['throughput_rps']} req/s, {level['errors']} errors"
+    )
+    row = "  {:<32} p50 {:>9.1f}  p95 {:>9.1f}  p99 {:>9.1f} ms  (n={})"
+    print(row.format("end-to-end", latency["p50"], latency["p95"], latency["p99"], latency["count"]))
+    for title, group in (("by intent", level["intents"]), ("by span", level["spans"])):
+        print(f"  {title}:")
+        for name, stats in group.items():
+            print(row.format(name, stats["p50"], stats["p95"], stats["p99"], stats["count"]))
+    for error in level["error_samples"]:
+        print(f"  error: {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--concurrency", default="1,4,16", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=60, help="requests per level")
+    parser.add_argument("--mode", choices=["async", "sync"], default="async", help="graph.ainvoke (as api.py) or graph.invoke in threads")
+    stubs.add_arguments(parser)
+    parser.add_argument("--output", help="result file (default .cache/bench/graph-<timestamp>.json)")
+    parser.add_argument("--compare", help="earlier result file to compare against")
+    args = parser.parse_args()
+
+    corpus, llm, market = stubs.from_arguments(args)
+    stubs.install(llm, market)
+    graph = build_graph()
+
+    # One untimed pass loads the symbol index, knowledge base and clients
+    run_level(graph, corpus, 1, len(corpus), args.mode)
+
+    levels = []
+    for concurrency in [int(c) for c in args.concurrency.split(",") if c.strip()]:
+        level = run_level(graph, corpus, concurrency, args.requests, args.mode)
+        print_level(level)
+        levels.append(level)
+    embedding_queue.close()
+
+    results = {
+        "benchmark": "graph",
+        "meta": run_metadata(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "levels": levels,
+    }
+    path = save(results, args.output, "graph")
+    print(f"\nSaved {path}")
+    if args.compare:
+        print(f"\nCompared with {args.compare}:")
+        for line in compare(args.compare, results, ["latency.p50", "latency.p95", "latency.p99", "throughput_rps"]):
+            print(f"  {line}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""
+HTTP load test for api.py with stubbed upstreams.
+
+Closed-loop virtual users replay a mix of /chat and /chat/stream traffic from the
+benchmark corpus, stepping through concurrency levels. A separate probe polls
+/health throughout. For each step it reports requests per second, latency
+percentiles, streaming time to first byte, the server's event-loop lag and peak
+RSS, and /health latency. Results are saved as JSON for later comparison.
+
+    python -m benchmarks.load_test --concurrency 1,8,32 --duration 20
+    python -m benchmarks.load_test --target subprocess   # uvicorn in its own process
+    python -m benchmarks.load_test --target http://127.0.0.1:8001   # a running stub_server
+"""
+import argparse
+import asyncio
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from benchmarks import stubs
+from benchmarks.report import compare, run_metadata, save, summarize
+
+HEALTH_INTERVAL = 0.25
+# Per-request client timeout; above REQUEST_TIMEOUT so server-side deadlines show up as answers
+CLIENT_TIMEOUT = 120.0
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class InProcessServer:
+    """
+    uvicorn serving the stubbed app on a background thread of this process.
+    The load generator's own work shares the process (and GIL); use
+    `--target subprocess` when that matters.
+    """
+
+    def __init__(self, args: argparse.Namespace):
+        import uvicorn
+        from benchmarks.stub_server import stub_app
+
+        port = _free_port()
+        self.url = f"http://127.0.0.1:{port}"
+        self.server = uvicorn.Server(uvicorn.Config(stub_app(args), host="127.0.0.1", port=port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, name="uvicorn", daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            if not self.thread.is_alive():
+                raise RuntimeError("uvicorn failed to start")
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join(timeout=30)
+
+
+class SubprocessServer:
+    """`python -m benchmarks.stub_server` in a child process, so client and server do not share a GIL."""
+
+    def __init__(self, args: argparse.Namespace):
+        port = _free_port()
+        self.url = f"http://127.0.0.1:{port}"
+        self.command = [
+            sys.executable, "-m", "benchmarks.stub_server", "--port", str(port),
+            "--llm-first-token", str(args.llm_first_token), "--llm-per-chunk", str(args.llm_per_chunk),
+            "--llm-words", str(args.llm_words), "--market-latency", str(args.market_latency),
+            "--jitter", str(args.jitter), "--seed", str(args.seed), "--corpus", args.corpus,
+        ]
+        self.process: Optional[subprocess.Popen] = None
+
+    def __enter__(self):
+        self.process = subprocess.Popen(self.command, stdout=subprocess.DEVNULL)
+        deadline = time.monotonic() + 120
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"stub server exited with {self.process.returncode}")
+            try:
+                if httpx.get(f"{self.url}/health", timeout=1).status_code == 200:
+                    return self
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError("stub server did not start in time")
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+class ExternalServer:
+    """An already running server (normally `python -m benchmarks.stub_server`)."""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+async def _chat(client: httpx.AsyncClient, query: str) -> Dict[str, Any]:
+    started = time.perf_counter()
+    response = await client.post("/chat", json={"message": query})
+    return {"endpoint": "chat", "status": response.status_code, "seconds": time.perf_counter() - started}
+
+
+async def _chat_stream(client: httpx.AsyncClient, query: str) -> Dict[str, Any]:
+    started = time.perf_counter()
+    ttfb = None
+    body = b""
+    async with client.stream("POST", "/chat/stream", json={"message": query}) as response:
+        async for chunk in response.aiter_bytes():
+            if ttfb is None:
+                ttfb = time.perf_counter() - started
+            body += chunk
+        status = response.status_code
+    if status == 200 and b"event: final" not in body:
+        # The stream ended with an `error` event or was cut short
+        status = "stream_error"
+    return {"endpoint": "stream", "status": status, "seconds": time.perf_counter() - started, "ttfb": ttfb}
+
+
+async def _user(client: httpx.AsyncClient, corpus: List[Dict[str, Any]], rng: random.Random, stream_ratio: float, stop_at: float, samples: List[Dict[str, Any]]):
+    while time.perf_counter() < stop_at:
+        query = rng.choice(corpus)["query"]
+        call = _chat_stream if rng.random() < stream_ratio else _chat
+        try:
+            samples.append(await call(client, query))
+        except httpx.HTTPError as e:
+            samples.append({"endpoint": call.__name__.lstrip("_"), "status": type(e).__name__, "seconds": None})
+
+
+async def _probe_health(client: httpx.AsyncClient, stop: asyncio.Event, samples: List[Optional[float]]):
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            response = await client.get("/health", timeout=10)
+            samples.append(time.perf_counter() - started if response.status_code == 200 else None)
+        except httpx.HTTPError:
+            samples.append(None)
+        try:
+            await asyncio.wait_for(stop.wait(), HEALTH_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_step(url: str, corpus: List[Dict[str, Any]], concurrency: int, duration: float, stream_ratio: float, seed: int) -> Dict[str, Any]:
+    limits = httpx.Limits(max_connections=concurrency + 2, max_keepalive_connections=concurrency + 2)
+    async with httpx.AsyncClient(base_url=url, timeout=CLIENT_TIMEOUT, limits=limits) as client, \
+            httpx.AsyncClient(base_url=url, timeout=CLIENT_TIMEOUT) as health_client:
+        await health_client.get("/_bench/stats", params={"reset": True})  # 404 on a plain api.py, which is fine
+        samples: List[Dict[str, Any]] = []
+        health: List[Optional[float]] = []
+        stop = asyncio.Event()
+        probe = asyncio.ensure_future(_probe_health(health_client, stop, health))
+
+        started = time.perf_counter()
+        stop_at = started + duration
+        await asyncio.gather(*(
+            _user(client, corpus, random.Random(seed * 1000 + i), stream_ratio, stop_at, samples)
+            for i in range(concurrency)
+        ))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await probe
+        stats = await health_client.get("/_bench/stats")
+        # Only benchmarks.stub_server reports loop lag and RSS
+        server = stats.json() if stats.status_code == 200 else {"loop_lag": {"count": 0}, "peak_rss_mb": None}
+
+    ok = [s for s in samples if s["status"] == 200]
+    statuses = Counter(str(s["status"]) for s in samples)
+    return {
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 2),
+        "requests": len(samples),
+        "throughput_rps": round(len(ok) / elapsed, 2),
+        "statuses": dict(statuses),
+        "rejected": statuses.get("429", 0),
+        "errors": len(samples) - len(ok) - statuses.get("429", 0),
+        "latency": summarize(s["seconds"] for s in ok),
+        "chat": summarize(s["seconds"] for s in ok if s["endpoint"] == "chat"),
+        "stream": summarize(s["seconds"] for s in ok if s["endpoint"] == "stream"),
+        "stream_ttfb": summarize(s["ttfb"] for s in ok if s["endpoint"] == "stream" and s["ttfb"] is not None),
+        "health": {**summarize(h for h in health if h is not None), "failures": sum(1 for h in health if h is None)},
+        "loop_lag": server["loop_lag"],
+        "peak_rss_mb": server["peak_rss_mb"],
+    }
+
+
+def print_step(step: Dict[str, Any]):
+    rss = f", peak RSS {step['peak_rss_mb']} MB" if step["peak_rss_mb"] is not None else ""
+    print(
+        f"\nconcurrency {step['concurrency']}: {step['requests']} requests in {step['seconds']}s, "
+        f"{step['throughput_rps']} ok req/s, {step['rejected']} rejected (429), {step['errors']} errors{rss}"
+    )
+    row = "  {:<14} p50 {:>9}  p95 {:>9}  p99 {:>9}  max {:>9} ms  (n={})"
+    for name in ("latency", "chat", "stream", "stream_ttfb", "health", "loop_lag"):
+        stats = step[name]
+        if stats.get("count"):
+            print(row.format(name, stats["p50"], stats["p95"], stats["p99"], stats["max"], stats["count"]))
+    if step["health"].get("failures"):
+        print(f"  /health failures: {step['health']['failures']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--target", default="inprocess", help='"inprocess", "subprocess" or the URL of a running stub_server')
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated virtual user counts, one step each")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds per step")
+    parser.add_argument("--stream-ratio", type=float, default=0.3, help="fraction of requests sent to /chat/stream")
+    parser.add_argument("--output", help="result file (default .cache/bench/load-<timestamp>.json)")
+    parser.add_argument("--compare", help="earlier result file to compare against")
+    stubs.add_arguments(parser)
+    args = parser.parse_args()
+
+    corpus = stubs.load_corpus(args.corpus)
+    if args.target == "inprocess":
+        server = InProcessServer(args)
+    elif args.target == "subprocess":
+        server = SubprocessServer(args)
+    else:
+        server = ExternalServer(args.target)
+
+    steps = []
+    with server:
+        for concurrency in [int(c) for c in args.concurrency.split(",") if c.strip()]:
+            step = asyncio.run(run_step(server.url, corpus, concurrency, args.duration, args.stream_ratio, args.seed))
+            print_step(step)
+            steps.append(step)
+
+    results = {
+        "benchmark": "load",
+        "meta": run_metadata(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "levels": steps,
+    }
+    path = save(results, args.output, "load")
+    print(f"\nSaved {path}")
+    if args.compare:
+        print(f"\nCompared with {args.compare}:")
+        for line in compare(args.compare, results, ["throughput_rps", "latency.p95", "stream_ttfb.p95", "health.p99", "loop_lag.p99"]):
+            print(f"  {line}")
+
+
+if __name__ == "__main__":
+    main()
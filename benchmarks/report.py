@@ -0,0 +1,91 @@
+import json
+import math
+import platform
+import subprocess
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+RESULTS_DIR = Path(__file__).parent.parent / ".cache" / "bench"
+
+
+def percentile(ordered: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+
+def summarize(values: Iterable[float], scale: float = 1000.0) -> Dict[str, Any]:
+    """count, mean, p50/p95/p99 and max, in milliseconds for values given in seconds."""
+    ordered = sorted(values)
+    if not ordered:
+        return {"count": 0}
+
+    def ms(value: float) -> float:
+        return round(value * scale, 2)
+
+    return {
+        "count": len(ordered),
+        "mean": ms(sum(ordered) / len(ordered)),
+        "p50": ms(percentile(ordered, 0.50)),
+        "p95": ms(percentile(ordered, 0.95)),
+        "p99": ms(percentile(ordered, 0.99)),
+        "max": ms(ordered[-1]),
+    }
+
+
+def run_metadata() -> Dict[str, Any]:
+    """Enough context to tell two result files apart."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5,
+            cwd=Path(__file__).parent
+        ).stdout.strip() or None
+    except Exception:
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+    }
+
+
+def save(results: Dict[str, Any], output: Optional[str], prefix: str) -> Path:
+    path = Path(output) if output else RESULTS_DIR / f"{prefix}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    return path
+
+
+def compare(baseline_path: str, results: Dict[str, Any], metrics: List[str]) -> List[str]:
+    """
+    Lines comparing `metrics` of each concurrency level against a saved run.
+    Metrics are dotted paths into a level, e.g. "latency.p95" or "throughput_rps".
+    """
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {level["concurrency"]: level for level in json.load(f)["levels"]}
+
+    def lookup(level: Dict[str, Any], path: str) -> Optional[float]:
+        for key in path.split("."):
+            if not isinstance(level, dict) or key not in level:
+                return None
+            level = level[key]
+        return level
+
+    lines = []
+    for level in results["levels"]:
+        before = baseline.get(level["concurrency"])
+        if before is None:
+            continue
+        parts = []
+        for metric in metrics:
+            old, new = lookup(before, metric), lookup(level, metric)
+            if old is None or new is None:
+                continue
+            change = f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+            parts.append(f"{metric} {old} -> {new} ({change})")
+        lines.append(f"c={level['concurrency']}: " + ", ".join(parts))
+    return lines
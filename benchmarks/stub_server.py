@@ -0,0 +1,108 @@
+"""
+api.py with stubbed upstreams, for load tests.
+
+    python -m benchmarks.stub_server --port 8001
+
+Serves the real FastAPI app with the stand-ins from benchmarks/stubs.py installed,
+plus GET /_bench/stats: event-loop lag and peak RSS of the server process since the
+previous `?reset=1` call.
+"""
+import argparse
+import asyncio
+import os
+import resource
+import sys
+import time
+from typing import Any, Dict, Optional
+
+from benchmarks import stubs
+from benchmarks.report import summarize
+
+# Must precede any `agent` import
+stubs.configure_environment()
+
+# How often the loop monitor wakes; lag is how late each wake-up is
+LAG_INTERVAL = 0.05
+
+
+def current_rss() -> int:
+    """Resident set size of this process in bytes (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss is kilobytes on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class LoopMonitor:
+    """Samples event-loop lag and RSS every LAG_INTERVAL seconds on the loop it runs on."""
+
+    def __init__(self, interval: float = LAG_INTERVAL):
+        self.interval = interval
+        self.task: Optional[asyncio.Task] = None
+        self.reset()
+
+    def reset(self):
+        self.lags = []
+        self.peak_rss = current_rss()
+        self.since = time.monotonic()
+
+    async def run(self):
+        while True:
+            # perf_counter rather than loop.time(): uvloop's clock only has millisecond resolution
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, time.perf_counter() - started - self.interval))
+            self.peak_rss = max(self.peak_rss, current_rss())
+
+    def ensure_running(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.ensure_future(self.run())
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "seconds": round(time.monotonic() - self.since, 2),
+            "loop_lag": summarize(self.lags),
+            "peak_rss_mb": round(self.peak_rss / 2 ** 20, 1),
+        }
+
+
+def create_app(llm: stubs.StubLLM, market: stubs.ReplayMarketData):
+    """Installs the stand-ins, imports api.py and adds /_bench/stats to its app."""
+    stubs.install(llm, market)
+    import api
+
+    monitor = LoopMonitor()
+
+    @api.app.get("/_bench/stats", include_in_schema=False)
+    async def bench_stats(reset: bool = False):
+        monitor.ensure_running()
+        snapshot = monitor.snapshot()
+        if reset:
+            monitor.reset()
+        return snapshot
+
+    return api.app
+
+
+def stub_app(args: argparse.Namespace):
+    """The stubbed app configured by stubs.add_arguments options."""
+    _, llm, market = stubs.from_arguments(args)
+    return create_app(llm, market)
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    stubs.add_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(stub_app(args), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
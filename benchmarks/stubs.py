@@ -0,0 +1,272 @@
+import os
+import re
+import copy
+import json
+import time
+import random
+import asyncio
+import threading
+import types
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+DATA_DIR = Path(__file__).parent / "data"
+
+PARSE_MARKER = "Extract tickers, intent, timeframe, and language"
+QUERY_PATTERN = re.compile(r"User Query:\s*(.+)")
+# FinancialInsight / FinancialNarrative format instructions list this field
+STRUCTURED_MARKER = "executive_summary"
+
+
+def load_corpus(path: Path = DATA_DIR / "queries.json") -> List[Dict[str, Any]]:
+    """Benchmark queries: `query`, expected `intent`, and the `parse` the stub LLM answers with."""
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def configure_environment():
+    """
+    Points the agent at its offline backends. Must run before `agent` is imported,
+    since some modules read their configuration at import time.
+    """
+    os.environ["VECTOR_BACKEND"] = "local"
+    os.environ["EMBEDDING_BACKEND"] = "local"
+    os.environ.pop("PINECONE_API_KEY", None)
+
+
+class Latency:
+    """Stand-in delays in seconds, scaled by a seeded +/- `jitter` factor."""
+
+    def __init__(self, seed: int = 0, jitter: float = 0.2):
+        self.jitter = jitter
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def __call__(self, seconds: float) -> float:
+        if seconds <= 0:
+            return 0.0
+        with self._lock:
+            return seconds * self._rng.uniform(1 - self.jitter, 1 + self.jitter)
+
+
+class StubLLM:
+    """
+    Deterministic answers for the agent's three kinds of LLM call, recognised from
+    the prompt: query extraction (the corpus `parse` for the query, in a fenced
+    block with trailing chatter, like real models), structured reports, and free
+    text analysis of `completion_words` words. `first_token` is the delay before
+    the first chunk and `per_chunk` the delay between streamed chunks (one per word).
+    """
+
+    def __init__(
+        self,
+        corpus: List[Dict[str, Any]],
+        first_token: float = 0.3,
+        per_chunk: float = 0.004,
+        completion_words: int = 150,
+        latency: Optional[Latency] = None,
+    ):
+        self.parses = {entry["query"].strip().lower(): entry["parse"] for entry in corpus}
+        self.first_token = first_token
+        self.per_chunk = per_chunk
+        self.completion_words = completion_words
+        self.latency = latency or Latency()
+        self.calls = 0
+
+    def reply(self, messages: List[dict]) -> str:
+        self.calls += 1
+        text = "\n".join(str(m["content"]) for m in messages)
+        if PARSE_MARKER in text:
+            queries = QUERY_PATTERN.findall(text)
+            query = queries[-1].strip() if queries else ""
+            parse = self.parses.get(query.lower(), {"tickers": [], "intent": "general_chat", "timeframe": "1y", "language": "english"})
+            return f"```json\n{json.dumps(parse)}\n```\nLet me know if you need anything else."
+        if STRUCTURED_MARKER in text:
+            return json.dumps({
+                "executive_summary": self._words(40),
+                "key_metrics": [],
+                "comparative_analysis": self._words(40),
+                "risk_factors": [self._words(12), self._words(12)],
+                "final_insight": self._words(30),
+                "disclaimer": "This is not investment advice.",
+            })
+        return self._words(self.completion_words)
+
+    @staticmethod
+    def _words(n: int) -> str:
+        base = "the company reported steady growth with healthy margins and stable cash flows".split()
+        return " ".join(base[i % len(base)] for i in range(n))
+
+    def chunks(self, messages: List[dict]) -> List[str]:
+        words = self.reply(messages).split(" ")
+        return [w + " " for w in words[:-1]] + words[-1:]
+
+    def completion_delay(self, chunks: int) -> float:
+        return self.latency(self.first_token) + chunks * self.latency(self.per_chunk)
+
+
+def _completion(content: str):
+    message = types.SimpleNamespace(content=content)
+    return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message, delta=message)])
+
+
+class StubClient:
+    """Drop-in for g4f.client.Client backed by a StubLLM."""
+
+    def __init__(self, llm: StubLLM):
+        self.llm = llm
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=self.create))
+
+    def create(self, model: str, messages: List[dict], stream: bool = False, **kwargs):
+        chunks = self.llm.chunks(messages)
+        if not stream:
+            time.sleep(self.llm.completion_delay(len(chunks)))
+            return _completion("".join(chunks))
+
+        def iterate():
+            time.sleep(self.llm.latency(self.llm.first_token))
+            for chunk in chunks:
+                yield _completion(chunk)
+                time.sleep(self.llm.latency(self.llm.per_chunk))
+        return iterate()
+
+
+class AsyncStubClient:
+    """Drop-in for g4f.client.AsyncClient backed by a StubLLM."""
+
+    def __init__(self, llm: StubLLM):
+        self.llm = llm
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=self.create))
+
+    def create(self, model: str, messages: List[dict], stream: bool = False, **kwargs):
+        chunks = self.llm.chunks(messages)
+        if not stream:
+            async def complete():
+                await asyncio.sleep(self.llm.completion_delay(len(chunks)))
+                return _completion("".join(chunks))
+            return complete()
+
+        async def iterate():
+            await asyncio.sleep(self.llm.latency(self.llm.first_token))
+            for chunk in chunks:
+                yield _completion(chunk)
+                await asyncio.sleep(self.llm.latency(self.llm.per_chunk))
+        return iterate()
+
+
+class ReplayMarketData:
+    """
+    Serves recorded yfinance `info` dicts in place of Yahoo, after `latency` seconds
+    (a quote refresh takes `quote_latency`). Symbols without a recording get a copy
+    of the first one under their own name, so any corpus query can be replayed.
+    """
+
+    def __init__(self, path: Path = DATA_DIR / "market_info.json", latency: float = 0.15, quote_latency: float = 0.05, jitter: Optional[Latency] = None):
+        with open(path, encoding="utf-8") as f:
+            self.recordings: Dict[str, Dict[str, Any]] = json.load(f)
+        self.latency = latency
+        self.quote_latency = quote_latency
+        self.jitter = jitter or Latency()
+        self.calls = 0
+
+    def info(self, yahoo_symbol: str) -> Dict[str, Any]:
+        self.calls += 1
+        time.sleep(self.jitter(self.latency))
+        recorded = self.recordings.get(yahoo_symbol)
+        if recorded is None:
+            recorded = {**next(iter(self.recordings.values())), "symbol": yahoo_symbol, "shortName": yahoo_symbol}
+        return copy.deepcopy(recorded)
+
+    def quote(self, yahoo_symbol: str) -> Dict[str, Any]:
+        time.sleep(self.jitter(self.quote_latency))
+        info = self.recordings.get(yahoo_symbol, {})
+        keys = ("currentPrice", "regularMarketPrice", "volume", "regularMarketVolume", "dayHigh", "dayLow", "open", "previousClose")
+        return {k: info[k] for k in keys if k in info}
+
+
+class InMemoryIndex:
+    """VectorIndex held in a numpy matrix; brute-force cosine search, nothing on disk."""
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._metadata: List[Dict[str, Any]] = []
+        self._vectors: List[np.ndarray] = []
+        self._lock = threading.Lock()
+
+    def upsert(self, vectors: Sequence[Tuple[str, Sequence[float], Dict[str, Any]]]):
+        with self._lock:
+            for vector_id, values, metadata in vectors:
+                vec = np.asarray(values, dtype=np.float32)
+                vec = vec / (np.linalg.norm(vec) or 1.0)
+                row = self._ids.get(vector_id)
+                if row is None:
+                    self._ids[vector_id] = len(self._vectors)
+                    self._vectors.append(vec)
+                    self._metadata.append(dict(metadata))
+                else:
+                    self._vectors[row] = vec
+                    self._metadata[row] = dict(metadata)
+        return {"upserted_count": len(vectors)}
+
+    def query(self, vector: Sequence[float], top_k: int, include_metadata: bool = True, filter: Optional[Dict] = None):
+        from agent.tools.local_index import QueryMatch, QueryResult, matches_filter
+
+        with self._lock:
+            if not self._vectors:
+                return QueryResult([])
+            ids = list(self._ids)
+            scores = np.stack(self._vectors) @ np.asarray(vector, dtype=np.float32)
+            rows = [r for r in np.argsort(-scores) if matches_filter(self._metadata[r], filter)][:top_k]
+            return QueryResult([
+                QueryMatch(ids[r], float(scores[r]), dict(self._metadata[r]) if include_metadata else {})
+                for r in rows
+            ])
+
+
+def add_arguments(parser):
+    """Stand-in options shared by the benchmark harnesses."""
+    parser.add_argument("--llm-first-token", type=float, default=0.3, help="stub LLM seconds to first chunk")
+    parser.add_argument("--llm-per-chunk", type=float, default=0.004, help="stub LLM seconds between streamed chunks")
+    parser.add_argument("--llm-words", type=int, default=150, help="words in a free-text stub answer")
+    parser.add_argument("--market-latency", type=float, default=0.15, help="seconds per replayed yfinance info fetch")
+    parser.add_argument("--jitter", type=float, default=0.2, help="+/- fraction applied to every stub delay")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--corpus", default=str(DATA_DIR / "queries.json"))
+
+
+def from_arguments(args) -> Tuple[List[Dict[str, Any]], StubLLM, ReplayMarketData]:
+    """Corpus and stand-ins configured by `add_arguments` options."""
+    corpus = load_corpus(args.corpus)
+    latency = Latency(args.seed, args.jitter)
+    llm = StubLLM(corpus, args.llm_first_token, args.llm_per_chunk, args.llm_words, latency)
+    market = ReplayMarketData(latency=args.market_latency, jitter=latency)
+    return corpus, llm, market
+
+
+def install(llm: StubLLM, market: ReplayMarketData) -> InMemoryIndex:
+    """
+    Swaps the agent's network dependencies for the stand-ins, leaving everything
+    in between (LLM pool, scheduler, caches, breakers, parsers) as it runs in production.
+    Returns the vector index the agent will use.
+    """
+    import agent.g4f_wrapper as g4f_wrapper
+    import agent.tools.vector_store as vector_store
+    from agent.tools.market_data import MarketDataTool
+
+    g4f_wrapper._client = StubClient(llm)
+    g4f_wrapper._async_client = AsyncStubClient(llm)
+    MarketDataTool._fetch_info = lambda self, yahoo_symbol, deadline=None: market.info(yahoo_symbol)
+    MarketDataTool._fetch_quote = lambda self, yahoo_symbol: market.quote(yahoo_symbol)
+    index = InMemoryIndex()
+    vector_store.get_local_index = lambda namespace="default": index
+    return index
+
+
+def reset_caches():
+    """Empties the response and market caches so a run starts cold."""
+    from agent.response_cache import response_cache
+    from agent.tools.market_cache import market_cache
+
+    response_cache.invalidate()
+    market_cache.invalidate()
@@ -0,0 +1,12 @@
+from agent.knowledge_base import PERSONA_CORE, load_knowledge_base
+
+knowledge_base = load_knowledge_base()
+
+
+def test_small_talk_gets_only_the_persona_core():
+    assert knowledge_base.search("hi") == []
+    assert knowledge_base.system_prompt("hi") == PERSONA_CORE
+
+
+def test_ltp_question_gets_sections():
+    assert knowledge_base.search("wtb kya hota hai")
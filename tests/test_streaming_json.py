@@ -0,0 +1,12 @@
+import json
+
+from agent.streaming_json import repair_json
+
+
+def test_escaped_apostrophe_in_single_quoted_string():
+    assert json.loads(repair_json("{'a': 'it\\'s', 'b': True}")) == {"a": "it's", "b": True}
+
+
+def test_mismatched_closer_drops_trailing_prose():
+    assert json.loads(repair_json("[1,2,} hope this helps")) == [1, 2]
+    assert json.loads(repair_json('{"a": [1,2,} hope this helps')) == {"a": [1, 2]}